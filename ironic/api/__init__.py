@@ -27,6 +27,27 @@ API_SERVICE_OPTS = [
                default=1000,
                help='The maximum number of items returned in a single '
                     'response from a collection resource.'),
+    cfg.IntOpt('driver_cache_ttl',
+               default=300,
+               help='Seconds the answers of the conductors about drivers, '
+                    'like their properties and vendor passthru methods, '
+                    'are cached. They are also dropped when the drivers of '
+                    'the active conductors change. 0 disables the cache.'),
+    cfg.IntOpt('api_workers',
+               default=1,
+               help='Number of worker processes of the Ironic API server. '
+                    'When greater than 1, the workers are forked from the '
+                    'main process and share its listening socket.'),
+    cfg.BoolOpt('wsgi_keep_alive',
+                default=True,
+                help='Whether the connections of the clients are kept open '
+                     'between their requests.'),
+    cfg.IntOpt('client_socket_timeout',
+               default=60,
+               help='Seconds a connection of a client is waited on for its '
+                    'next request, 0 means forever. A stopping worker '
+                    'completes the requests it is serving, and waits at '
+                    'most this long for the idle connections to close.'),
     ]
 
 CONF = cfg.CONF
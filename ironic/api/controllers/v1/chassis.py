@@ -31,6 +31,10 @@ from ironic.common import exception
 from ironic import objects
 
 
+# The fields of the chassis shown when listing chassis without detail.
+_SUMMARY_FIELDS = ['uuid', 'description']
+
+
 class ChassisPatchType(types.JsonPatchType):
     pass
 
@@ -70,7 +74,7 @@ class Chassis(base.APIBase):
     @staticmethod
     def _convert_with_links(chassis, url, expand=True):
         if not expand:
-            chassis.unset_fields_except(['uuid', 'description'])
+            chassis.unset_fields_except(_SUMMARY_FIELDS)
         else:
             chassis.nodes = [link.Link.make_link('self',
                                                  url,
@@ -151,13 +155,26 @@ class ChassisController(rest.RestController):
                                 expand=False, resource_url=None):
         limit = api_utils.validate_limit(limit)
         sort_dir = api_utils.validate_sort_dir(sort_dir)
-        marker_obj = None
-        if marker:
-            marker_obj = objects.Chassis.get_by_uuid(pecan.request.context,
-                                                     marker)
-        chassis = objects.Chassis.list(pecan.request.context, limit,
-                                       marker_obj, sort_key=sort_key,
-                                       sort_dir=sort_dir)
+
+        def list_chassis(fields):
+            return objects.Chassis.list(pecan.request.context, limit,
+                                        marker, sort_key=sort_key,
+                                        sort_dir=sort_dir, fields=fields,
+                                        use_slave=True)
+
+        # A conditional request is checked loading only the fields the
+        # entity tag is computed from.
+        if pecan.request.if_none_match:
+            not_modified = api_utils.check_etag(
+                list_chassis(api_utils.ETAG_FIELDS))
+            if not_modified is not None:
+                return not_modified
+        chassis = list_chassis(None if expand else
+                               _SUMMARY_FIELDS + api_utils.ETAG_FIELDS)
+        not_modified = api_utils.check_etag(chassis)
+        if not_modified is not None:
+            return not_modified
+
         return ChassisCollection.convert_with_links(chassis, limit,
                                                     url=resource_url,
                                                     expand=expand,
@@ -204,6 +221,9 @@ class ChassisController(rest.RestController):
         """
         rpc_chassis = objects.Chassis.get_by_uuid(pecan.request.context,
                                                   chassis_uuid)
+        not_modified = api_utils.check_etag([rpc_chassis])
+        if not_modified is not None:
+            return not_modified
         return Chassis.convert_with_links(rpc_chassis)
 
     @wsme_pecan.wsexpose(Chassis, body=Chassis, status_code=201)
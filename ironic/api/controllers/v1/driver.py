@@ -21,31 +21,11 @@ import wsmeext.pecan as wsme_pecan
 
 from ironic.api.controllers import base
 from ironic.api.controllers import link
+from ironic.api.controllers.v1 import utils as api_utils
 from ironic.common import exception
 from ironic.common.i18n import _
 
 
-# Property information for drivers:
-#   key = driver name;
-#   value = dictionary of properties of that driver:
-#             key = property name.
-#             value = description of the property.
-# NOTE(rloo). This is cached for the lifetime of the API service. If one or
-# more conductor services are restarted with new driver versions, the API
-# service should be restarted.
-_DRIVER_PROPERTIES = {}
-
-# Vendor information for drivers:
-#   key = driver name;
-#   value = dictionary of vendor methods of that driver:
-#             key = method name.
-#             value = dictionary with the metadata of that method.
-# NOTE(lucasagomes). This is cached for the lifetime of the API
-# service. If one or more conductor services are restarted with new driver
-# versions, the API service should be restarted.
-_VENDOR_METHODS = {}
-
-
 class Driver(base.APIBase):
     """API representation of a driver."""
 
@@ -124,13 +104,13 @@ class DriverPassthruController(rest.RestController):
         :raises: DriverNotFound if the driver name is invalid or the
                  driver cannot be loaded.
         """
-        if driver_name not in _VENDOR_METHODS:
+        def fetch():
             topic = pecan.request.rpcapi.get_topic_for_driver(driver_name)
-            ret = pecan.request.rpcapi.get_driver_vendor_passthru_methods(
+            return pecan.request.rpcapi.get_driver_vendor_passthru_methods(
                         pecan.request.context, driver_name, topic=topic)
-            _VENDOR_METHODS[driver_name] = ret
 
-        return _VENDOR_METHODS[driver_name]
+        return api_utils.DRIVER_CACHE.get(('vendor_methods', driver_name),
+                                          fetch)
 
     @wsme_pecan.wsexpose(wtypes.text, wtypes.text, wtypes.text,
                          body=wtypes.text)
@@ -201,10 +181,9 @@ class DriversController(rest.RestController):
         :raises: DriverNotFound (HTTP 404) if the driver name is invalid or
                  the driver cannot be loaded.
         """
-        if driver_name not in _DRIVER_PROPERTIES:
+        def fetch():
             topic = pecan.request.rpcapi.get_topic_for_driver(driver_name)
-            properties = pecan.request.rpcapi.get_driver_properties(
-                             pecan.request.context, driver_name, topic=topic)
-            _DRIVER_PROPERTIES[driver_name] = properties
+            return pecan.request.rpcapi.get_driver_properties(
+                       pecan.request.context, driver_name, topic=topic)
 
-        return _DRIVER_PROPERTIES[driver_name]
+        return api_utils.DRIVER_CACHE.get(('properties', driver_name), fetch)
@@ -18,6 +18,7 @@ import datetime
 from oslo.config import cfg
 import pecan
 from pecan import rest
+import six
 import wsme
 from wsme import types as wtypes
 import wsmeext.pecan as wsme_pecan
@@ -42,15 +43,9 @@ CONF.import_opt('heartbeat_timeout', 'ironic.conductor.manager',
 
 LOG = log.getLogger(__name__)
 
-# Vendor information for node's driver:
-#   key = driver name;
-#   value = dictionary of node vendor methods of that driver:
-#             key = method name.
-#             value = dictionary with the metadata of that method.
-# NOTE(lucasagomes). This is cached for the lifetime of the API
-# service. If one or more conductor services are restarted with new driver
-# versions, the API service should be restarted.
-_VENDOR_METHODS = {}
+# The fields of the nodes shown when listing nodes without detail.
+_SUMMARY_FIELDS = ['instance_uuid', 'maintenance', 'power_state',
+                   'provision_state', 'uuid']
 
 
 class NodePatchType(types.JsonPatchType):
@@ -63,7 +58,8 @@ class NodePatchType(types.JsonPatchType):
         return defaults + ['/console_enabled', '/last_error',
                            '/power_state', '/provision_state', '/reservation',
                            '/target_power_state', '/target_provision_state',
-                           '/provision_updated_at', '/maintenance_reason']
+                           '/provision_updated_at', '/maintenance_reason',
+                           '/version_id']
 
     @staticmethod
     def mandatory_attrs():
@@ -482,9 +478,7 @@ class Node(base.APIBase):
     @staticmethod
     def _convert_with_links(node, url, expand=True):
         if not expand:
-            except_list = ['instance_uuid', 'maintenance', 'power_state',
-                           'provision_state', 'uuid']
-            node.unset_fields_except(except_list)
+            node.unset_fields_except(_SUMMARY_FIELDS)
         else:
             node.ports = [link.Link.make_link('self', url, 'nodes',
                                               node.uuid + "/ports"),
@@ -556,6 +550,57 @@ class NodeCollection(collection.Collection):
         return sample
 
 
+class BulkPort(base.APIBase):
+    """API representation of a port created together with its node."""
+
+    uuid = types.uuid
+    """Unique UUID for this port"""
+
+    address = wsme.wsattr(types.macaddress, mandatory=True)
+    """MAC Address for this port"""
+
+    extra = {wtypes.text: types.jsontype}
+    """This port's meta data"""
+
+    def __init__(self, **kwargs):
+        self.fields = ['uuid', 'address', 'extra']
+        for field in self.fields:
+            setattr(self, field, kwargs.get(field, wtypes.Unset))
+
+
+class BulkNode(Node):
+    """API representation of a node created in a batch, with its ports."""
+
+    ports = [BulkPort]
+    """The ports of the node"""
+
+
+class BulkNodeResult(base.APIBase):
+    """API representation of the creation of one node of a batch."""
+
+    uuid = types.uuid
+    """The UUID of the node"""
+
+    node = Node
+    """The node, if it was created"""
+
+    ports = [BulkPort]
+    """The ports of the node, if it was created"""
+
+    error = wtypes.text
+    """The reason why the node was not created"""
+
+    code = int
+    """The HTTP status code of the error"""
+
+
+class BulkNodeResultCollection(base.APIBase):
+    """API representation of the creation of a batch of nodes."""
+
+    results = [BulkNodeResult]
+    """The result for each node, in the order of the request"""
+
+
 class NodeVendorPassthruController(rest.RestController):
     """REST controller for VendorPassthru.
 
@@ -581,13 +626,14 @@ class NodeVendorPassthruController(rest.RestController):
         rpc_node = objects.Node.get_by_uuid(pecan.request.context,
                                             node_uuid)
 
-        if rpc_node.driver not in _VENDOR_METHODS:
+        # NOTE: the methods of a node are the ones of its driver.
+        def fetch():
             topic = pecan.request.rpcapi.get_topic_for(rpc_node)
-            ret = pecan.request.rpcapi.get_node_vendor_passthru_methods(
+            return pecan.request.rpcapi.get_node_vendor_passthru_methods(
                         pecan.request.context, node_uuid, topic=topic)
-            _VENDOR_METHODS[rpc_node.driver] = ret
 
-        return _VENDOR_METHODS[rpc_node.driver]
+        return api_utils.DRIVER_CACHE.get(
+            ('node_vendor_methods', rpc_node.driver), fetch)
 
     @wsme_pecan.wsexpose(wtypes.text, types.uuid, wtypes.text,
                          body=wtypes.text)
@@ -682,6 +728,7 @@ class NodesController(rest.RestController):
     _custom_actions = {
         'detail': ['GET'],
         'validate': ['GET'],
+        'bulk': ['POST'],
     }
 
     def _get_nodes_collection(self, chassis_uuid, instance_uuid, associated,
@@ -694,10 +741,6 @@ class NodesController(rest.RestController):
         limit = api_utils.validate_limit(limit)
         sort_dir = api_utils.validate_sort_dir(sort_dir)
 
-        marker_obj = None
-        if marker:
-            marker_obj = objects.Node.get_by_uuid(pecan.request.context,
-                                                  marker)
         if instance_uuid:
             nodes = self._get_nodes_by_instance(instance_uuid)
         else:
@@ -709,9 +752,27 @@ class NodesController(rest.RestController):
             if maintenance is not None:
                 filters['maintenance'] = maintenance
 
-            nodes = objects.Node.list(pecan.request.context, limit, marker_obj,
-                                      sort_key=sort_key, sort_dir=sort_dir,
-                                      filters=filters)
+            def list_nodes(fields):
+                # NOTE: the marker is given as a uuid, so that the database
+                #       looks up its sort keys while fetching the page.
+                return objects.Node.list(pecan.request.context, limit,
+                                         marker, sort_key=sort_key,
+                                         sort_dir=sort_dir, filters=filters,
+                                         fields=fields, use_slave=True)
+
+            # A conditional request is checked loading only the fields
+            # the entity tag is computed from.
+            if pecan.request.if_none_match:
+                not_modified = api_utils.check_etag(
+                    list_nodes(api_utils.ETAG_FIELDS))
+                if not_modified is not None:
+                    return not_modified
+            nodes = list_nodes(None if expand else
+                               _SUMMARY_FIELDS + api_utils.ETAG_FIELDS)
+
+        not_modified = api_utils.check_etag(nodes)
+        if not_modified is not None:
+            return not_modified
 
         parameters = {'sort_key': sort_key, 'sort_dir': sort_dir}
         if associated:
@@ -730,7 +791,8 @@ class NodesController(rest.RestController):
         """
         try:
             node = objects.Node.get_by_instance_uuid(pecan.request.context,
-                                                     instance_uuid)
+                                                     instance_uuid,
+                                                     use_slave=True)
             return [node]
         except exception.InstanceNotFound:
             return []
@@ -818,7 +880,11 @@ class NodesController(rest.RestController):
         if self.from_chassis:
             raise exception.OperationNotPermitted
 
-        rpc_node = objects.Node.get_by_uuid(pecan.request.context, node_uuid)
+        rpc_node = objects.Node.get_by_uuid(pecan.request.context, node_uuid,
+                                            use_slave=True)
+        not_modified = api_utils.check_etag([rpc_node])
+        if not_modified is not None:
+            return not_modified
         return Node.convert_with_links(rpc_node)
 
     @wsme_pecan.wsexpose(Node, body=Node, status_code=201)
@@ -853,6 +919,60 @@ class NodesController(rest.RestController):
         pecan.response.location = link.build_url('nodes', new_node.uuid)
         return Node.convert_with_links(new_node)
 
+    @wsme_pecan.wsexpose(BulkNodeResultCollection, body=[BulkNode])
+    def bulk(self, nodes):
+        """Create a batch of nodes, with their ports.
+
+        The nodes which can be created are created in a single
+        transaction, the result of each of the others tells why it was not.
+
+        :param nodes: a list of nodes within the request body, each with
+                      an optional list of ports.
+        """
+        if self.from_chassis:
+            raise exception.OperationNotPermitted
+
+        context = pecan.request.context
+        driver_errors = {}
+        for node in nodes:
+            if not node.uuid:
+                node.uuid = utils.generate_uuid()
+            # NOTE: the nodes of a batch usually share a few drivers, each
+            #       driver is only looked up in the hash ring once.
+            if node.driver not in driver_errors:
+                try:
+                    pecan.request.rpcapi.get_topic_for(node)
+                    driver_errors[node.driver] = None
+                except exception.NoValidHost as e:
+                    e.code = 400
+                    driver_errors[node.driver] = e
+
+        batch = []
+        for node in nodes:
+            if driver_errors[node.driver] is None:
+                new_node = objects.Node(context, **node.as_dict())
+                new_ports = [objects.Port(context, **p.as_dict())
+                             for p in node.ports or []]
+                batch.append((new_node, new_ports))
+        errors = iter(objects.Node.create_batch(context, batch))
+        batch = iter(batch)
+
+        results = []
+        for node in nodes:
+            result = BulkNodeResult(uuid=node.uuid)
+            error = driver_errors[node.driver]
+            if error is None:
+                new_node, new_ports = next(batch)
+                error = next(errors)
+            if error is None:
+                result.node = Node.convert_with_links(new_node)
+                result.ports = [BulkPort(**p.as_dict()) for p in new_ports]
+            else:
+                result.error = six.text_type(error)
+                result.code = error.code
+            results.append(result)
+        return BulkNodeResultCollection(results=results)
+
     @wsme.validate(types.uuid, [NodePatchType])
     @wsme_pecan.wsexpose(Node, types.uuid, body=[NodePatchType])
     def patch(self, node_uuid, patch):
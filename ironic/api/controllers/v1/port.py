@@ -31,6 +31,10 @@ from ironic.common.i18n import _
 from ironic import objects
 
 
+# The fields of the ports shown when listing ports without detail.
+_SUMMARY_FIELDS = ['uuid', 'address']
+
+
 class PortPatchType(types.JsonPatchType):
 
     @staticmethod
@@ -109,7 +113,7 @@ class Port(base.APIBase):
     @staticmethod
     def _convert_with_links(port, url, expand=True):
         if not expand:
-            port.unset_fields_except(['uuid', 'address'])
+            port.unset_fields_except(_SUMMARY_FIELDS)
 
         # never expose the node_id attribute
         port.node_id = wtypes.Unset
@@ -185,27 +189,42 @@ class PortsController(rest.RestController):
         limit = api_utils.validate_limit(limit)
         sort_dir = api_utils.validate_sort_dir(sort_dir)
 
-        marker_obj = None
-        if marker:
-            marker_obj = objects.Port.get_by_uuid(pecan.request.context,
-                                                  marker)
-
-        if node_uuid:
-            # FIXME(comstud): Since all we need is the node ID, we can
-            #                 make this more efficient by only querying
-            #                 for that column. This will get cleaned up
-            #                 as we move to the object interface.
-            node = objects.Node.get_by_uuid(pecan.request.context, node_uuid)
-            ports = objects.Port.list_by_node_id(pecan.request.context,
-                                                 node.id, limit, marker_obj,
-                                                 sort_key=sort_key,
-                                                 sort_dir=sort_dir)
-        elif address:
+        if address and not node_uuid:
             ports = self._get_ports_by_address(address)
         else:
-            ports = objects.Port.list(pecan.request.context, limit,
-                                      marker_obj, sort_key=sort_key,
-                                      sort_dir=sort_dir)
+            if node_uuid:
+                # FIXME(comstud): Since all we need is the node ID, we can
+                #                 make this more efficient by only querying
+                #                 for that column. This will get cleaned up
+                #                 as we move to the object interface.
+                node = objects.Node.get_by_uuid(pecan.request.context,
+                                                node_uuid, use_slave=True)
+
+                def list_ports(fields):
+                    return objects.Port.list_by_node_id(
+                        pecan.request.context, node.id, limit, marker,
+                        sort_key=sort_key, sort_dir=sort_dir, fields=fields,
+                        use_slave=True)
+            else:
+                def list_ports(fields):
+                    return objects.Port.list(pecan.request.context, limit,
+                                             marker, sort_key=sort_key,
+                                             sort_dir=sort_dir, fields=fields,
+                                             use_slave=True)
+
+            # A conditional request is checked loading only the fields
+            # the entity tag is computed from.
+            if pecan.request.if_none_match:
+                not_modified = api_utils.check_etag(
+                    list_ports(api_utils.ETAG_FIELDS))
+                if not_modified is not None:
+                    return not_modified
+            ports = list_ports(None if expand else
+                               _SUMMARY_FIELDS + api_utils.ETAG_FIELDS)
+
+        not_modified = api_utils.check_etag(ports)
+        if not_modified is not None:
+            return not_modified
 
         return PortCollection.convert_with_links(ports, limit,
                                                  url=resource_url,
@@ -279,6 +298,9 @@ class PortsController(rest.RestController):
             raise exception.OperationNotPermitted
 
         rpc_port = objects.Port.get_by_uuid(pecan.request.context, port_uuid)
+        not_modified = api_utils.check_etag([rpc_port])
+        if not_modified is not None:
+            return not_modified
         return Port.convert_with_links(rpc_port)
 
     @wsme_pecan.wsexpose(Port, body=Port, status_code=201)
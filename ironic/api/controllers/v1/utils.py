@@ -13,14 +13,31 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import hashlib
+import time
+
 import jsonpatch
 from oslo.config import cfg
+from oslo.utils import timeutils
+import pecan
 import wsme
 
 from ironic.common.i18n import _
+from ironic.openstack.common import log
 
 CONF = cfg.CONF
 
+LOG = log.getLogger(__name__)
+
+# The fields of the resources which their entity tag is computed from.
+ETAG_FIELDS = ['uuid', 'created_at', 'updated_at']
+
+# NOTE: the update times are stored with a precision of one second, two
+#       updates within the same second would have the same entity tag. So
+#       no tag is given for the resources which changed in the last
+#       seconds.
+_ETAG_MIN_AGE = 2
+
 
 JSONPATCH_EXCEPTIONS = (jsonpatch.JsonPatchException,
                         jsonpatch.JsonPointerException,
@@ -50,3 +67,98 @@ def apply_jsonpatch(doc, patch):
                         ' the resource is not allowed')
                 raise wsme.exc.ClientSideError(msg % p['path'])
     return jsonpatch.apply_patch(doc, jsonpatch.JsonPatch(patch))
+
+
+def _get_etag(resources):
+    digest = hashlib.md5(pecan.request.url.encode('utf-8'))
+    now = timeutils.utcnow()
+    for resource in resources:
+        changed_at = resource.updated_at or resource.created_at
+        if changed_at is not None:
+            changed_at = timeutils.normalize_time(changed_at)
+            if timeutils.delta_seconds(changed_at, now) < _ETAG_MIN_AGE:
+                return None
+        digest.update(('%s %s %s\n' % (resource.uuid, resource.created_at,
+                                       resource.updated_at)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def check_etag(resources):
+    """Set the entity tag of a response and check the request against it.
+
+    The tag is computed from the URL of the request, which selects the
+    resources and the fields of the response, and from the uuid and the
+    update time of each resource of the response.
+
+    :param resources: the objects the response is built from. Only the
+                      fields in ETAG_FIELDS of the objects are used.
+    :returns: a 304 (Not Modified) response if the If-None-Match header
+              of the request matches the tag, else None.
+    """
+    etag = _get_etag(resources)
+    if etag is None:
+        return None
+    pecan.response.headers['ETag'] = 'W/"%s"' % etag
+    if etag in pecan.request.if_none_match:
+        return wsme.api.Response(None, status_code=304)
+
+
+class DriverCache(object):
+    """A cache of the answers of the conductors about drivers.
+
+    A conductor answers the same about a driver, like its properties or its
+    vendor passthru methods, until it is restarted. So the answers are kept
+    for [api]driver_cache_ttl seconds. The drivers of the active conductors
+    are checked at most once per TTL as well, and all the answers are
+    dropped when they have changed.
+
+    rpc_calls_avoided counts the cache hits. It is only reported in the
+    debug log.
+    """
+
+    def __init__(self):
+        self.clear()
+        self.rpc_calls_avoided = 0
+
+    def clear(self):
+        self._entries = {}
+        self._driver_dict = None
+        self._drivers_checked_at = None
+
+    def _check_drivers(self, now, ttl):
+        if (self._drivers_checked_at is not None and
+                now < self._drivers_checked_at + ttl):
+            return
+        driver_dict = pecan.request.dbapi.get_active_driver_dict()
+        if driver_dict != self._driver_dict:
+            self._entries = {}
+            self._driver_dict = driver_dict
+        self._drivers_checked_at = now
+
+    def get(self, key, fetch):
+        """Return the cached answer for a key, or fetch it.
+
+        :param key: the key of the answer, e.g. a (call name, driver name)
+                    tuple.
+        :param fetch: a function returning the answer with an RPC call.
+        """
+        ttl = CONF.api.driver_cache_ttl
+        if ttl <= 0:
+            return fetch()
+
+        now = time.time()
+        self._check_drivers(now, ttl)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > now:
+            self.rpc_calls_avoided += 1
+            LOG.debug("Answered %(key)s from the driver cache, %(count)d RPC "
+                      "calls avoided so far.",
+                      {'key': key, 'count': self.rpc_calls_avoided})
+            return entry[1]
+
+        value = fetch()
+        self._entries[key] = (now + ttl, value)
+        return value
+
+
+DRIVER_CACHE = DriverCache()
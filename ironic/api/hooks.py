@@ -147,3 +147,15 @@ class NoExceptionTracebackHook(hooks.PecanHook):
             # Replace the whole json. Cannot change original one beacause it's
             # generated on the fly.
             state.response.json = json_body
+
+
+class NotModifiedHook(hooks.PecanHook):
+    """Empty the body of the 304 (Not Modified) responses.
+
+    The controllers return an empty result when the client has the current
+    version of a resource already, which WSME renders as 'null'.
+
+    """
+    def after(self, state):
+        if state.response.status_int == 304:
+            state.response.body = b''
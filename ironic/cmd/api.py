@@ -19,44 +19,42 @@
 
 import logging
 import sys
-from wsgiref import simple_server
 
 from oslo.config import cfg
-from six.moves import socketserver
 
 from ironic.api import app
+from ironic.common import exception
+from ironic.common.i18n import _
 from ironic.common.i18n import _LI
 from ironic.common import service as ironic_service
+from ironic.common import wsgi_service
 from ironic.openstack.common import log
+from ironic.openstack.common import service
 
 CONF = cfg.CONF
 
 
-class ThreadedSimpleServer(socketserver.ThreadingMixIn,
-                           simple_server.WSGIServer):
-    """A Mixin class to make the API service greenthread-able."""
-    pass
-
-
 def main():
     # Pase config file and command line options, then start logging
     ironic_service.prepare_service(sys.argv)
 
-    # Build and start the WSGI app
-    host = CONF.api.host_ip
-    port = CONF.api.port
-    wsgi = simple_server.make_server(
-            host, port,
-            app.VersionSelectorApplication(),
-            server_class=ThreadedSimpleServer)
+    workers = CONF.api.api_workers
+    if workers < 1:
+        raise exception.ConfigInvalid(
+            error_msg=_('api_workers must be greater than 0, got %d.')
+            % workers)
+
+    # Build the WSGI app and bind its socket, before forking the workers
+    server = wsgi_service.WSGIService('ironic-api',
+                                      app.VersionSelectorApplication(),
+                                      CONF.api.host_ip, CONF.api.port)
 
     LOG = log.getLogger(__name__)
-    LOG.info(_LI("Serving on http://%(host)s:%(port)s"),
-             {'host': host, 'port': port})
+    LOG.info(_LI("Serving on http://%(host)s:%(port)s with %(workers)d "
+                 "workers"),
+             {'host': server.host, 'port': server.port, 'workers': workers})
     LOG.info(_LI("Configuration:"))
     CONF.log_opt_values(LOG, logging.INFO)
 
-    try:
-        wsgi.serve_forever()
-    except KeyboardInterrupt:
-        pass
+    launcher = service.launch(server, workers=workers)
+    launcher.wait()
@@ -247,6 +247,10 @@ class ChassisNotFound(NotFound):
     message = _("Chassis %(chassis)s could not be found.")
 
 
+class MarkerNotFound(NotFound):
+    message = _("Marker %(marker)s could not be found.")
+
+
 class NoDriversLoaded(IronicException):
     message = _("Conductor %(conductor)s cannot be started "
                 "because no drivers were loaded.")
@@ -388,6 +392,11 @@ class ConfigNotFound(IronicException):
     message = _("Could not find config at %(path)s")
 
 
+class NodeUpdateConflict(Conflict):
+    message = _("Node %(node)s was updated by another process since it "
+                "was read, please reload it and retry.")
+
+
 class NodeLocked(Conflict):
     message = _("Node %(node)s is locked by host %(host)s, please retry "
                 "after the current operation is completed.")
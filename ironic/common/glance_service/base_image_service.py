@@ -16,6 +16,7 @@
 
 
 import functools
+import hashlib
 import logging
 import os
 import sys
@@ -28,12 +29,15 @@ import six.moves.urllib.parse as urlparse
 
 from ironic.common import exception
 from ironic.common.glance_service import service_utils
+from ironic.common.i18n import _
 from ironic.common.i18n import _LE
 
 
 LOG = logging.getLogger(__name__)
 CONF = cfg.CONF
 
+_CHUNK_SIZE = 64 * 1024
+
 
 def _translate_image_exception(image_id, exc_value):
     if isinstance(exc_value, (exception.Forbidden,
@@ -57,6 +61,32 @@ def _translate_plain_exception(exc_value):
     return exc_value
 
 
+def _write_image_data(image_id, chunks, data, checksum):
+    """Write image data to a file object, checking it on the way.
+
+    :param image_id: The opaque image identifier.
+    :param chunks: Iterator over the image data.
+    :param data: File object to write data to.
+    :param checksum: MD5 checksum of the image from Glance, or None.
+    :returns: True if the data was checked, False if there is no checksum.
+    :raises: ImageUnacceptable if the data does not match the checksum.
+    """
+    md5 = hashlib.md5() if checksum else None
+    for chunk in chunks:
+        if md5 is not None:
+            md5.update(chunk)
+        data.write(chunk)
+
+    if md5 is None:
+        return False
+    if md5.hexdigest() != checksum:
+        raise exception.ImageUnacceptable(image_id=image_id,
+            reason=_("downloaded data has checksum %(actual)s, expected "
+                     "%(expected)s") % {'actual': md5.hexdigest(),
+                                        'expected': checksum})
+    return True
+
+
 def check_image_service(func):
     """Creates a glance client if doesn't exists and calls the function."""
     @functools.wraps(func)
@@ -188,15 +218,26 @@ class BaseImageService(object):
         return base_image_meta
 
     @check_image_service
-    def _download(self, image_id, data=None, method='data'):
+    def _download(self, image_id, data=None, method='data', checksum=None):
         """Calls out to Glance for data and writes data.
 
+        Data written to a file object is checked against the checksum
+        while it is downloaded.
+
         :param image_id: The opaque image identifier.
         :param data: (Optional) File object to write data to.
+        :param checksum: (Optional) MD5 checksum from the image metadata.
+        :returns: The image data if no file object is given, otherwise
+                  True if the data matched the checksum and False if no
+                  checksum was given.
+        :raises: ImageUnacceptable if the data does not match the checksum.
         """
         (image_id, self.glance_host,
          self.glance_port, use_ssl) = service_utils.parse_image_ref(image_id)
 
+        if data is None:
+            return self.call(method, image_id)
+
         if (self.version == 2 and
                 'file' in CONF.glance.allowed_direct_url_schemes):
 
@@ -204,17 +245,20 @@ class BaseImageService(object):
             url = urlparse.urlparse(location)
             if url.scheme == "file":
                 with open(url.path, "r") as f:
-                    filesize = os.path.getsize(f.name)
-                    sendfile.sendfile(data.fileno(), f.fileno(), 0, filesize)
-                return
-
-        image_chunks = self.call(method, image_id)
-
-        if data is None:
-            return image_chunks
-        else:
-            for chunk in image_chunks:
-                data.write(chunk)
+                    if checksum is None:
+                        filesize = os.path.getsize(f.name)
+                        sendfile.sendfile(data.fileno(), f.fileno(), 0,
+                                          filesize)
+                        return False
+                    # NOTE: the file has to be read to check it, so it is
+                    # copied through Python instead of with sendfile
+                    chunks = iter(functools.partial(f.read, _CHUNK_SIZE), '')
+                    return _write_image_data(image_id, chunks, data,
+                                             checksum)
+
+        # NOTE: the client does not need to compute the checksum again
+        image_chunks = self.call(method, image_id, do_checksum=False)
+        return _write_image_data(image_id, image_chunks, data, checksum)
 
     @check_image_service
     def _create(self, image_meta, data=None, method='create'):
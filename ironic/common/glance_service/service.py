@@ -41,11 +41,13 @@ class ImageService(object):
         """
 
     @abc.abstractmethod
-    def download(self, image_id, data=None):
+    def download(self, image_id, data=None, checksum=None):
         """Calls out to Glance for data and writes data.
 
         :param image_id: The opaque image identifier.
         :param data: (Optional) File object to write data to.
+        :param checksum: (Optional) MD5 checksum to check the data written
+                         to the file object against.
         """
 
     @abc.abstractmethod
@@ -13,8 +13,10 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import array
 import bisect
 import hashlib
+import struct
 import threading
 
 from oslo.config import cfg
@@ -22,6 +24,7 @@ from oslo.config import cfg
 from ironic.common import exception
 from ironic.common.i18n import _
 from ironic.db import api as dbapi
+from ironic.openstack.common import log as logging
 
 hash_opts = [
     cfg.IntOpt('hash_partition_exponent',
@@ -51,6 +54,44 @@ hash_opts = [
 CONF = cfg.CONF
 CONF.register_opts(hash_opts)
 
+LOG = logging.getLogger(__name__)
+
+# Bounds of the number of bits of a hash used to index the partition table.
+MIN_TABLE_BITS = 8
+MAX_TABLE_BITS = 16
+
+# Maximum number of get_hosts() results remembered by each HashRing.
+MAX_MEMO_SIZE = 100000
+
+# Number of leading bits of the hash of a node's UUID which are stored in
+# the database as its hash partition. Changing this requires recomputing
+# the hash partition of every node.
+HASH_PARTITION_BITS = 16
+
+
+def get_hash_partition(data):
+    """Get the hash partition of a string identifier.
+
+    The hash partition is the leading HASH_PARTITION_BITS bits of the hash
+    used to map data onto a ring, so that the data mapped onto a host can
+    be looked up by the hash partitions which the host serves.
+
+    :param data: A string identifier, e.g. a node UUID.
+    :returns: an integer from 0 to 2**HASH_PARTITION_BITS - 1.
+    """
+    digest = hashlib.md5(data).digest()
+    return struct.unpack_from('>I', digest)[0] >> (32 - HASH_PARTITION_BITS)
+
+
+def _merge_ranges(ranges):
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1][1] = max(last, merged[-1][1])
+        else:
+            merged.append([first, last])
+    return [tuple(r) for r in merged]
+
 
 class HashRing(object):
     """A stable hash ring.
@@ -63,6 +104,12 @@ class HashRing(object):
     - we hash each host many times to spread load more finely
       as otherwise adding a host gets (on average) 50% of the load of
       just one other host assigned to it.
+
+    To avoid bisecting the whole list of dividers on every lookup, a
+    partition table indexed by the leading bits of the hash gives the few
+    dividers which may follow it. The results of get_hosts() are also
+    remembered; a ring is never modified, so they stay valid until the
+    ring is replaced.
     """
 
     def __init__(self, hosts, replicas=None):
@@ -95,6 +142,29 @@ class HashRing(object):
         # Gather the (possibly colliding) resulting hashes into a bisectable
         # list.
         self._partitions = sorted(self._host_hashes.keys())
+        self._build_partition_table()
+        self._memo = {}
+        self._hash_partition_ranges = {}
+
+    def _build_partition_table(self):
+        """Index the dividers by the leading bits of their hash.
+
+        Entry N of the table is the position in self._partitions of the
+        first divider whose leading bits are N or more, so that the
+        dividers sharing the leading bits of a hash are found between
+        entries N and N + 1.
+        """
+        bits = len(self._partitions).bit_length() + 1
+        self._table_bits = max(MIN_TABLE_BITS, min(bits, MAX_TABLE_BITS))
+        shift = 128 - self._table_bits
+        table = array.array('l', [0] * ((1 << self._table_bits) + 1))
+        position = 0
+        for bucket in range(len(table)):
+            while (position < len(self._partitions) and
+                   self._partitions[position] >> shift < bucket):
+                position += 1
+            table[bucket] = position
+        self._partition_table = table
 
     def _hash2int(self, key_hash):
         """Convert the given hash's digest to a numerical value for the ring.
@@ -106,12 +176,20 @@ class HashRing(object):
     def _get_partition(self, data):
         try:
             key_hash = hashlib.md5(data)
-            hashed_key = self._hash2int(key_hash)
-            position = bisect.bisect(self._partitions, hashed_key)
-            return position if position < len(self._partitions) else 0
         except TypeError:
             raise exception.Invalid(
                     _("Invalid data supplied to HashRing.get_hosts."))
+        bucket = (struct.unpack_from('>I', key_hash.digest())[0] >>
+                  (32 - self._table_bits))
+        lo = self._partition_table[bucket]
+        hi = self._partition_table[bucket + 1]
+        if lo == hi:
+            # no divider shares the leading bits of this hash
+            position = lo
+        else:
+            position = bisect.bisect(self._partitions,
+                                     self._hash2int(key_hash), lo, hi)
+        return position if position < len(self._partitions) else 0
 
     def get_hosts(self, data, ignore_hosts=None):
         """Get the list of hosts which the supplied data maps onto.
@@ -126,13 +204,30 @@ class HashRing(object):
                   this `HashRing` was created with. It may be less than this
                   if ignore_hosts is not None.
         """
-        hosts = []
+        if not ignore_hosts:
+            try:
+                return list(self._memo[data])
+            except KeyError:
+                pass
+            except TypeError:
+                raise exception.Invalid(
+                        _("Invalid data supplied to HashRing.get_hosts."))
+
         if ignore_hosts is None:
             ignore_hosts = set()
         else:
             ignore_hosts = set(ignore_hosts)
             ignore_hosts.intersection_update(self.hosts)
-        partition = self._get_partition(data)
+        hosts = self._get_hosts_from(self._get_partition(data), ignore_hosts)
+
+        if not ignore_hosts:
+            if len(self._memo) >= MAX_MEMO_SIZE:
+                self._memo.clear()
+            self._memo[data] = tuple(hosts)
+        return hosts
+
+    def _get_hosts_from(self, partition, ignore_hosts):
+        hosts = []
         for replica in range(0, self.replicas):
             if len(hosts) + len(ignore_hosts) == len(self.hosts):
                 # prevent infinite loop - cannot allocate more fallbacks.
@@ -147,6 +242,45 @@ class HashRing(object):
             hosts.append(host)
         return hosts
 
+    def get_hash_partition_ranges(self, host):
+        """Get the hash partitions which hold the data mapped onto a host.
+
+        A hash partition can be split between hosts, so some of the data
+        in the returned hash partitions may map onto other hosts; the
+        result is meant to narrow down a search before get_hosts() is
+        checked.
+
+        :param host: A host of this ring.
+        :returns: a sorted list of (first, last) tuples of inclusive ranges
+                  of hash partitions, see get_hash_partition().
+        """
+        try:
+            return self._hash_partition_ranges[host]
+        except KeyError:
+            pass
+
+        shift = 128 - HASH_PARTITION_BITS
+        count = len(self._partitions)
+        ranges = []
+        if host in self.hosts:
+            for position in range(count):
+                if host not in self._get_hosts_from(position, set()):
+                    continue
+                # the hashes mapped to a position are those from the
+                # previous divider up to, but excluding, its own divider.
+                if position == 0:
+                    segments = [(self._partitions[-1], 2 ** 128 - 1),
+                                (0, self._partitions[0] - 1)]
+                else:
+                    segments = [(self._partitions[position - 1],
+                                 self._partitions[position] - 1)]
+                for start, end in segments:
+                    if start <= end:
+                        ranges.append((start >> shift, end >> shift))
+        ranges = _merge_ranges(ranges)
+        self._hash_partition_ranges[host] = ranges
+        return ranges
+
     def _get_host(self, partition):
         """Find what host is serving a partition.
 
@@ -159,6 +293,9 @@ class HashRing(object):
 
 class HashRingManager(object):
     _hash_rings = None
+    # The rings built by the last load and what each was built from, so a
+    # reload only rebuilds the rings whose conductors have changed.
+    _ring_sources = {}
     _lock = threading.Lock()
 
     def __init__(self):
@@ -178,17 +315,46 @@ class HashRingManager(object):
 
     def _load_hash_rings(self):
         rings = {}
+        sources = {}
         d2c = self.dbapi.get_active_driver_dict()
 
         for driver_name, hosts in d2c.iteritems():
-            rings[driver_name] = HashRing(hosts)
+            source = (frozenset(hosts), CONF.hash_partition_exponent,
+                      CONF.hash_distribution_replicas)
+            previous = self._ring_sources.get(driver_name)
+            if previous is not None and previous[0] == source:
+                rings[driver_name] = previous[1]
+            else:
+                LOG.debug("Building hash ring for driver %(driver)s with "
+                          "conductors %(hosts)s.",
+                          {'driver': driver_name, 'hosts': sorted(hosts)})
+                rings[driver_name] = HashRing(hosts)
+            sources[driver_name] = (source, rings[driver_name])
+        self.__class__._ring_sources = sources
         return rings
 
     @classmethod
     def reset(cls):
+        """Reload the hash rings from the database on next use.
+
+        Only the rings of drivers whose set of active conductors has
+        changed since the last load are rebuilt.
+        """
         with cls._lock:
             cls._hash_rings = None
 
+    def get_hash_partitions(self, host):
+        """Get the hash partitions which hold the nodes mapped onto a host.
+
+        :param host: The hostname of a conductor.
+        :returns: a dict mapping the name of each driver whose ring
+                  includes the host to the ranges of hash partitions the
+                  host serves, see HashRing.get_hash_partition_ranges().
+        """
+        return dict((driver_name, ring.get_hash_partition_ranges(host))
+                    for driver_name, ring in self.ring.items()
+                    if host in ring.hosts)
+
     def __getitem__(self, driver_name):
         try:
             return self.ring[driver_name]
@@ -21,6 +21,7 @@ Handling of VM disk images.
 
 import os
 import shutil
+import struct
 
 import jinja2
 from oslo.config import cfg
@@ -53,6 +54,24 @@ image_opts = [
 CONF = cfg.CONF
 CONF.register_opts(image_opts)
 
+# Signatures of the formats probed by qemu-img, as (format, offset, magic).
+# Images matching none of them are raw.
+_FORMAT_SIGNATURES = [
+    ('qcow2', 0, b'QFI\xfb'),
+    ('qed', 0, b'QED\x00'),
+    ('vmdk', 0, b'KDMV'),
+    ('vmdk', 0, b'# Disk DescriptorFile'),
+    ('vdi', 0x40, b'\x7f\x10\xda\xbe'),
+    ('vhdx', 0, b'vhdxfile'),
+    ('vpc', 0, b'conectix'),
+    ('parallels', 0, b'WithoutFreeSpace'),
+    ('parallels', 0, b'WithouFreSpacExt'),
+    ('bochs', 0, b'Bochs Virtual HD Image'),
+    ('cloop', 0, b'#!/bin/sh\n#V2.0 Format\n'),
+    ('luks', 0, b'LUKS\xba\xbe'),
+]
+_FORMAT_HEADER_SIZE = 512
+
 
 def _create_root_fs(root_directory, files_info):
     """Creates a filesystem root in given directory.
@@ -231,7 +250,61 @@ def convert_image(source, dest, out_format, run_as_root=False):
     utils.execute(*cmd, run_as_root=run_as_root)
 
 
-def fetch(context, image_href, path, image_service=None, force_raw=False):
+def detect_format(header):
+    """Detect the format of an image from its first bytes.
+
+    :param header: first bytes of the image, 512 bytes are enough.
+    :returns: tuple (format, virtual size in bytes or None if it is not
+        known from the header).
+    """
+    for fmt, offset, magic in _FORMAT_SIGNATURES:
+        if header[offset:offset + len(magic)] == magic:
+            if fmt == 'qcow2' and len(header) >= 32:
+                return fmt, struct.unpack('>Q', header[24:32])[0]
+            return fmt, None
+    return 'raw', None
+
+
+class _FormatDetector(object):
+    """File wrapper detecting the format of an image being written."""
+
+    def __init__(self, image_file, callback):
+        self._file = image_file
+        self._callback = callback
+        self._header = b''
+
+    def write(self, data):
+        if self._callback is not None:
+            self._header += data[:_FORMAT_HEADER_SIZE - len(self._header)]
+            if len(self._header) >= _FORMAT_HEADER_SIZE:
+                self.finish()
+        self._file.write(data)
+
+    def fileno(self):
+        # NOTE: data sent to the file descriptor is not seen, the format
+        # stays unknown then
+        return self._file.fileno()
+
+    def finish(self):
+        """Report the format, if any data was seen and not reported yet."""
+        if self._callback is not None and self._header:
+            callback, self._callback = self._callback, None
+            callback(*detect_format(self._header))
+
+
+def fetch(context, image_href, path, image_service=None, force_raw=False,
+          format_callback=None, checksum=None):
+    """Fetch an image to a path.
+
+    :param format_callback: if present, called with the format and the
+        virtual size returned by detect_format() as soon as the start of
+        the image is downloaded. It is not called if the image service
+        did not pass the data through Python.
+    :param checksum: if present, the checksum from the image metadata
+        to check the data against.
+    :returns: True if the image service checked the data against the
+        checksum.
+    """
     # TODO(vish): Improve context handling and add owner and auth data
     #             when it is added to glance.  Right now there is no
     #             auth checking in glance, so we assume that access was
@@ -241,10 +314,18 @@ def fetch(context, image_href, path, image_service=None, force_raw=False):
 
     with fileutils.remove_path_on_error(path):
         with open(path, "wb") as image_file:
-            image_service.download(image_href, image_file)
+            if format_callback is None:
+                verified = image_service.download(image_href, image_file,
+                                                  checksum=checksum)
+            else:
+                detector = _FormatDetector(image_file, format_callback)
+                verified = image_service.download(image_href, detector,
+                                                  checksum=checksum)
+                detector.finish()
 
     if force_raw:
         image_to_raw(image_href, path, "%s.part" % path)
+    return bool(verified)
 
 
 def image_to_raw(image_href, path, path_tmp):
@@ -283,10 +364,14 @@ def image_to_raw(image_href, path, path_tmp):
             os.rename(path_tmp, path)
 
 
-def download_size(context, image_href, image_service=None):
+def image_show(context, image_href, image_service=None):
     if not image_service:
         image_service = service.Service(version=1, context=context)
-    return image_service.show(image_href)['size']
+    return image_service.show(image_href)
+
+
+def download_size(context, image_href, image_service=None):
+    return image_show(context, image_href, image_service)['size']
 
 
 def converted_size(path):
@@ -26,8 +26,10 @@ import random
 import re
 import shutil
 import tempfile
+import time
 import uuid
 
+from eventlet import semaphore
 import netaddr
 from oslo.config import cfg
 from oslo.utils import excutils
@@ -48,6 +50,14 @@ utils_opts = [
                     'running commands as root.'),
     cfg.StrOpt('tempdir',
                help='Explicitly specify the temporary working directory.'),
+    cfg.IntOpt('ssh_connection_idle_timeout',
+               default=60,
+               help='Time, in seconds, after which an unused pooled SSH '
+                    'connection is closed.'),
+    cfg.IntOpt('ssh_max_channels_per_host',
+               default=5,
+               help='Maximum number of commands run at the same time over '
+                    'a pooled SSH connection.'),
 ]
 
 CONF = cfg.CONF
@@ -134,6 +144,152 @@ def ssh_connect(connection):
     return ssh
 
 
+class _SSHPoolEntry(object):
+
+    def __init__(self, key, client):
+        self.key = key
+        self.client = client
+        self.channels = semaphore.Semaphore(CONF.ssh_max_channels_per_host)
+        self.users = 0
+        self.last_used = time.time()
+
+
+def _ssh_is_active(ssh):
+    transport = ssh.get_transport()
+    return transport is not None and transport.is_active()
+
+
+class SSHConnectionPool(object):
+    """SSH connections kept open to be reused by later operations.
+
+    Connections are keyed on the host, port, user and credentials used to
+    open them. A connection is checked before being handed out, and is
+    opened again if it is no longer active. Connections left unused for
+    CONF.ssh_connection_idle_timeout seconds are closed whenever a
+    connection is handed out or a channel is released.
+    """
+
+    _KEY_FIELDS = ('host', 'port', 'username', 'password', 'key_contents',
+                   'key_filename')
+
+    def __init__(self):
+        self._entries = {}
+        self._entries_by_client = {}
+        self._lock = semaphore.Semaphore()
+
+    def _pop(self, key):
+        entry = self._entries.pop(key)
+        del self._entries_by_client[entry.client]
+        return entry.client
+
+    def _pop_idle(self, now):
+        return [self._pop(key) for key, entry in list(self._entries.items())
+                if not entry.users and
+                now - entry.last_used > CONF.ssh_connection_idle_timeout]
+
+    def close_idle(self):
+        """Close the connections left unused for too long."""
+        with self._lock:
+            to_close = self._pop_idle(time.time())
+        for ssh in to_close:
+            ssh.close()
+
+    def get(self, connection):
+        """Get an active ssh connection to a remote system.
+
+        :param connection: a dict of connection parameters, as accepted by
+                           :func:`ssh_connect`.
+        :returns: paramiko.SSHClient -- an active ssh connection.
+        :raises: SSHConnectFailed
+
+        """
+        key = tuple(connection.get(field) for field in self._KEY_FIELDS)
+        now = time.time()
+        with self._lock:
+            to_close = self._pop_idle(now)
+            entry = self._entries.get(key)
+            if entry is not None and not _ssh_is_active(entry.client):
+                to_close.append(self._pop(key))
+                entry = None
+            if entry is not None:
+                entry.last_used = now
+        for ssh in to_close:
+            ssh.close()
+        if entry is not None:
+            return entry.client
+
+        ssh = ssh_connect(connection)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = _SSHPoolEntry(key, ssh)
+                self._entries[key] = entry
+                self._entries_by_client[ssh] = entry
+                return ssh
+            entry.last_used = time.time()
+        # Another connection was opened in the meantime, use it instead.
+        ssh.close()
+        return entry.client
+
+    @contextlib.contextmanager
+    def channel(self, ssh):
+        """Wait for a free channel on a pooled connection.
+
+        At most CONF.ssh_max_channels_per_host commands run at the same
+        time over each connection. Connections not coming from the pool
+        are not limited.
+
+        :param ssh: paramiko.SSHClient, an active ssh connection.
+        """
+        entry = self._entries_by_client.get(ssh)
+        if entry is None:
+            yield
+            return
+
+        entry.users += 1
+        try:
+            with entry.channels:
+                yield
+        finally:
+            entry.users -= 1
+            entry.last_used = time.time()
+            self.close_idle()
+
+    def close_all(self):
+        """Close all the pooled connections."""
+        with self._lock:
+            clients = [self._pop(key) for key in list(self._entries)]
+        for ssh in clients:
+            ssh.close()
+
+
+_SSH_CONNECTION_POOL = SSHConnectionPool()
+
+
+def ssh_connect_pooled(connection):
+    """Get a pooled connection to a remote system using ssh protocol.
+
+    The connection is shared with the other users of the same host and
+    credentials, and must not be closed by the caller.
+
+    :param connection: a dict of connection parameters.
+    :returns: paramiko.SSHClient -- an active ssh connection.
+    :raises: SSHConnectFailed
+
+    """
+    return _SSH_CONNECTION_POOL.get(connection)
+
+
+def ssh_channel(ssh):
+    """Wait for a free channel on an ssh connection.
+
+    :param ssh: paramiko.SSHClient, an active ssh connection.
+    :returns: a context manager holding the channel.
+
+    """
+    return _SSH_CONNECTION_POOL.channel(ssh)
+
+
 def generate_uid(topic, size=8):
     characters = '01234567890abcdefghijklmnopqrstuvwxyz'
     choices = [random.choice(characters) for _x in range(size)]
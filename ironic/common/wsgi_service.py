@@ -0,0 +1,72 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import socket
+
+import eventlet
+from eventlet import wsgi
+from oslo.config import cfg
+from oslo.utils import netutils
+
+from ironic.openstack.common import log
+from ironic.openstack.common import service
+
+CONF = cfg.CONF
+CONF.import_opt('wsgi_keep_alive', 'ironic.api', group='api')
+CONF.import_opt('client_socket_timeout', 'ironic.api', group='api')
+
+LOG = log.getLogger(__name__)
+
+
+class WSGIService(service.Service):
+    """Serves a WSGI application with an eventlet WSGI server.
+
+    The listening socket is bound when the service is created, before it
+    is launched, so that the worker processes forked by a ProcessLauncher
+    all accept the connections of the same socket.
+    """
+
+    def __init__(self, name, application, host, port, pool_size=1000):
+        super(WSGIService, self).__init__()
+        self.name = name
+        self.application = application
+        self.pool_size = pool_size
+        if netutils.is_valid_ipv6(host):
+            family = socket.AF_INET6
+        else:
+            family = socket.AF_INET
+        self._socket = eventlet.listen((host, port), family=family)
+        self.host, self.port = self._socket.getsockname()[:2]
+        self._pool = None
+        self._server = None
+
+    def start(self):
+        super(WSGIService, self).start()
+        self._pool = eventlet.GreenPool(self.pool_size)
+        # NOTE: the server closes its socket when it is stopped, it is
+        #       given a copy so that the service can be restarted.
+        self._server = eventlet.spawn(
+            wsgi.server, self._socket.dup(), self.application,
+            custom_pool=self._pool,
+            log=log.WritableLogger(LOG),
+            keepalive=CONF.api.wsgi_keep_alive,
+            socket_timeout=CONF.api.client_socket_timeout or None,
+            debug=False)
+
+    def stop(self, graceful=True):
+        if self._server is not None:
+            # Stop accepting connections, then let the requests being
+            # served complete.
+            self._server.kill()
+            self._server = None
+            self._pool.waitall()
+        super(WSGIService, self).stop(graceful)
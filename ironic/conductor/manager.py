@@ -44,6 +44,7 @@ a change, etc.
 import collections
 import datetime
 import threading
+import time
 
 import eventlet
 from eventlet import greenpool
@@ -69,7 +70,6 @@ from ironic.common import utils as ironic_utils
 from ironic.conductor import task_manager
 from ironic.conductor import utils
 from ironic.db import api as dbapi
-from ironic import objects
 from ironic.openstack.common import context as ironic_context
 from ironic.openstack.common import log
 from ironic.openstack.common import periodic_task
@@ -95,6 +95,16 @@ conductor_opts = [
                    default=60,
                    help='Interval between syncing the node power state to the '
                         'database, in seconds.'),
+        cfg.IntOpt('sync_power_state_workers',
+                   default=8,
+                   help='Maximum number of nodes whose power state is '
+                        'synced concurrently. These workers are separate '
+                        'from the workers_pool_size pool.'),
+        cfg.IntOpt('sync_power_state_workers_per_bmc',
+                   default=1,
+                   help='Maximum number of concurrent power state syncs '
+                        'against a single management controller (eg. BMC '
+                        'or SSH host) shared by several nodes.'),
         cfg.IntOpt('check_provision_state_interval',
                    default=60,
                    help='Interval between checks of provision timeouts, '
@@ -120,6 +130,10 @@ conductor_opts = [
                    help='Maximum number of worker threads that can be started '
                         'simultaneously by a periodic task. Should be less '
                         'than RPC thread pool size.'),
+        cfg.IntOpt('periodic_batch_size',
+                   default=50,
+                   help='Number of nodes which a periodic task reserves, '
+                        'and loads from the database, in a single batch.'),
         cfg.IntOpt('workers_pool_size',
                    default=100,
                    help='The size of the workers greenthread pool.'),
@@ -157,6 +171,13 @@ conductor_opts = [
 CONF = cfg.CONF
 CONF.register_opts(conductor_opts, 'conductor')
 
+# driver_info keys which hold the address of the management controller of
+# a node. Nodes sharing a controller are throttled together during
+# _sync_power_states.
+BMC_ADDRESS_KEYS = ('ipmi_address', 'ssh_address', 'drac_host',
+                    'ilo_address', 'iboot_address', 'snmp_address',
+                    'seamicro_api_endpoint')
+
 
 class ConductorManager(periodic_task.PeriodicTasks):
     """Ironic Conductor manager main class."""
@@ -226,6 +247,10 @@ class ConductorManager(periodic_task.PeriodicTasks):
                                 size=CONF.conductor.workers_pool_size)
         """GreenPool of background workers for performing tasks async."""
 
+        self._power_sync_pool = greenpool.GreenPool(
+                                size=CONF.conductor.sync_power_state_workers)
+        """GreenPool dedicated to the _sync_power_states periodic task."""
+
         # Spawn a dedicated greenthread for the keepalive
         try:
             self._keepalive_evt = threading.Event()
@@ -253,6 +278,7 @@ class ConductorManager(periodic_task.PeriodicTasks):
         # benefit of releasing locks workers placed on nodes, as well as
         # having work complete normally.
         self._worker_pool.waitall()
+        self._power_sync_pool.waitall()
 
     def periodic_tasks(self, context, raise_on_error=False):
         """Periodic tasks are run at pre-specified interval."""
@@ -287,6 +313,7 @@ class ConductorManager(periodic_task.PeriodicTasks):
     @messaging.expected_exceptions(exception.InvalidParameterValue,
                                    exception.MissingParameterValue,
                                    exception.NodeLocked,
+                                   exception.NodeUpdateConflict,
                                    exception.NodeInWrongPowerState)
     def update_node(self, context, node_obj):
         """Update a node with the supplied data.
@@ -735,58 +762,186 @@ class ConductorManager(periodic_task.PeriodicTasks):
         here to avoid failing a brand new deploy to a node that we've
         locked here, though.
         """
-        # FIXME(comstud): Since our initial state checks are outside
-        # of the lock (to try to avoid the lock), some checks are
-        # repeated after grabbing the lock so we can unlock quickly.
-        # The node mapping is not re-checked because it doesn't much
-        # matter if things happened to re-balance.
-        #
-        # This is inefficient and racey. We end up with calling DB API's
-        # get_node() twice (once here, and once in acquire(). Ideally we
-        # add a way to pass constraints to task_manager.acquire()
-        # (through to its DB API call) so that we can eliminate our call
-        # and first set of checks below.
-
-        filters = {'reserved': False, 'maintenance': False}
-        columns = ['id', 'uuid', 'driver']
-        node_list = self.dbapi.get_nodeinfo_list(columns=columns,
-                                                 filters=filters)
-        for (node_id, node_uuid, driver) in node_list:
+        # NOTE(deva): we should not acquire a lock on a node in
+        #             DEPLOYWAIT, as this could cause an error within
+        #             a deploy ramdisk POSTing back at the same time.
+        filters = {'reserved': False, 'maintenance': False,
+                   'provision_state_not_in': [states.DEPLOYWAIT]}
+        columns = ['id', 'uuid', 'driver', 'driver_info']
+        node_list = self.dbapi.get_nodeinfo_list(
+                                columns=columns,
+                                filters=self._add_mapped_filter(filters))
+
+        # NOTE: Nodes are grouped by management controller (eg. the BMC,
+        # or the hypervisor of ssh driven VMs) and driver, so that a power
+        # interface able to report the power state of several nodes at
+        # once can query each controller once per group.
+        groups = collections.OrderedDict()
+        for (node_id, node_uuid, driver, driver_info) in node_list:
+            if not self._mapped_to_this_conductor(node_uuid, driver):
+                continue
+            bmc = _get_bmc_address(node_uuid, driver_info)
+            groups.setdefault((bmc, driver), []).append(node_id)
+
+        # NOTE: Each controller gets a queue of groups, split so that up
+        # to sync_power_state_workers_per_bmc workers can share it.
+        per_bmc = CONF.conductor.sync_power_state_workers_per_bmc
+        queues = collections.OrderedDict()
+        for (bmc, driver), ids in groups.items():
+            size = min(CONF.conductor.periodic_batch_size,
+                       (len(ids) + per_bmc - 1) // per_bmc)
+            queue = queues.setdefault(bmc, collections.deque())
+            queue.extend(ids[i:i + size] for i in range(0, len(ids), size))
+
+        # NOTE: The queues are drained by the dedicated _power_sync_pool.
+        # A worker only takes a group from a controller which is not
+        # already being queried by per_bmc workers, and only reserves the
+        # nodes once it has taken them, so nodes behind a slow controller
+        # neither hold a worker nor stay locked while waiting for it.
+        stats = {'succeeded': 0, 'failed': 0}
+        busy = collections.Counter()
+        start = time.time()
+        workers = min(self._power_sync_pool.size,
+                      sum(len(queue) for queue in queues.values()))
+        for i in range(workers):
+            self._power_sync_pool.spawn_n(self._sync_power_state_queues,
+                                          context, queues, busy, stats)
+        self._power_sync_pool.waitall()
+
+        duration = time.time() - start
+        LOG.debug("Power state sync of %(total)d nodes finished in "
+                  "%(duration).2f seconds: %(succeeded)d succeeded, "
+                  "%(failed)d failed.",
+                  {'total': stats['succeeded'] + stats['failed'],
+                   'duration': duration,
+                   'succeeded': stats['succeeded'],
+                   'failed': stats['failed']})
+        if duration > CONF.conductor.sync_power_state_interval:
+            LOG.warning(_LW("Power state sync took %(duration).2f seconds, "
+                            "which is longer than sync_power_state_interval "
+                            "(%(interval)d seconds). Consider increasing "
+                            "sync_power_state_workers."),
+                        {'duration': duration,
+                         'interval': CONF.conductor.sync_power_state_interval})
+
+    def _sync_power_state_queues(self, context, queues, busy, stats):
+        """Sync groups of nodes taken from per-controller queues.
+
+        Each iteration takes the next group of node IDs from the first
+        queue whose management controller has a free slot, then moves that
+        queue to the back so that controllers are served in turn. The
+        worker exits once every queue is either empty or at its limit, as
+        the workers busy with those controllers will empty them.
+
+        :param context: an admin context.
+        :param queues: an OrderedDict mapping management controller
+                       addresses to deques of lists of node IDs.
+        :param busy: a Counter of the workers querying each controller.
+        :param stats: a dict of 'succeeded' and 'failed' counters for the
+                      current cycle, updated in place.
+        """
+        per_bmc = CONF.conductor.sync_power_state_workers_per_bmc
+        lock_filters = {'maintenance': False,
+                        'provision_state_not_in': [states.DEPLOYWAIT]}
+        while True:
+            for bmc, queue in queues.items():
+                if busy[bmc] < per_bmc:
+                    break
+            else:
+                return
+            node_ids = queue.popleft()
+            del queues[bmc]
+            if queue:
+                queues[bmc] = queue
+
+            busy[bmc] += 1
             try:
-                if not self._mapped_to_this_conductor(node_uuid, driver):
-                    continue
-                # NOTE(deva): we should not acquire a lock on a node in
-                #             DEPLOYWAIT, as this could cause an error within
-                #             a deploy ramdisk POSTing back at the same time.
-                # TODO(deva): refactor this check, because it needs to be done
-                #             in every periodic task, not just this one.
-                node = objects.Node.get_by_id(context, node_id)
-                if (node.provision_state == states.DEPLOYWAIT or
-                        node.maintenance or node.reservation is not None):
-                    continue
-
-                with task_manager.acquire(context, node_id) as task:
-                    if (task.node.provision_state == states.DEPLOYWAIT or
-                            task.node.maintenance):
-                        continue
-                    count = do_sync_power_state(
-                            task, self.power_state_sync_count[node_uuid])
-                    if count:
-                        self.power_state_sync_count[node_uuid] = count
-                    else:
-                        # don't bloat the dict with non-failing nodes
-                        del self.power_state_sync_count[node_uuid]
-            except exception.NodeNotFound:
-                LOG.info(_LI("During sync_power_state, node %(node)s was not "
-                             "found and presumed deleted by another process."),
-                         {'node': node_uuid})
-            except exception.NodeLocked:
-                LOG.info(_LI("During sync_power_state, node %(node)s was "
-                             "already locked by another process. Skip."),
-                         {'node': node_uuid})
+                # NOTE: The filters are applied again by the conditional
+                # UPDATE which reserves the nodes, so nodes which changed
+                # state or were locked by another process in the meantime
+                # are skipped. The node mapping is not re-checked because
+                # it doesn't much matter if things happened to re-balance.
+                tasks = []
+                try:
+                    for task in task_manager.acquire_batch(
+                            context, node_ids, filters=lock_filters):
+                        tasks.append(task)
+                except Exception:
+                    # acquire_batch() only releases the nodes it has not
+                    # yielded yet.
+                    with excutils.save_and_reraise_exception():
+                        for task in tasks:
+                            task.release_resources()
+                if tasks:
+                    self._do_sync_power_state_tasks(tasks, stats)
+            except Exception:
+                LOG.exception(_LE("During sync_power_state, unexpected "
+                                  "error while syncing nodes %(nodes)s."),
+                              {'nodes': node_ids})
             finally:
-                # Yield on every iteration
-                eventlet.sleep(0)
+                busy[bmc] -= 1
+
+    def _do_sync_power_state_tasks(self, tasks, stats):
+        """Sync the power states of locked nodes, then release them.
+
+        The power states of all the nodes are fetched with a single call
+        to the get_power_states() method of their power interface. Each
+        node is then released as soon as its own sync is done.
+
+        :param tasks: a list of TaskManager instances with exclusive locks,
+                      for nodes sharing the same driver and management
+                      controller.
+        :param stats: a dict of 'succeeded' and 'failed' counters for the
+                      current cycle, updated in place.
+        """
+        pending = collections.deque(tasks)
+        try:
+            try:
+                power_states = tasks[0].driver.power.get_power_states(tasks)
+            except Exception as e:
+                power_states = dict((task.node.uuid, e) for task in tasks)
+
+            while pending:
+                task = pending.popleft()
+                current_state = power_states.get(task.node.uuid)
+                self._do_sync_power_state_task(task, stats,
+                                               current_state=current_state)
+        finally:
+            # eg. if the worker is killed while syncing
+            for task in pending:
+                task.release_resources()
+
+    def _do_sync_power_state_task(self, task, stats, current_state=None):
+        """Sync the power state of a locked node, then release it.
+
+        :param task: a TaskManager instance with an exclusive lock.
+        :param stats: a dict of 'succeeded' and 'failed' counters for the
+                      current cycle, updated in place.
+        :param current_state: the power state of the node if already known,
+                              or the exception raised while getting it.
+        """
+        node_uuid = task.node.uuid
+        count = 1
+        try:
+            with task:
+                count = do_sync_power_state(
+                        task, self.power_state_sync_count[node_uuid],
+                        current_state=current_state)
+                if count:
+                    self.power_state_sync_count[node_uuid] = count
+                else:
+                    # don't bloat the dict with non-failing nodes
+                    del self.power_state_sync_count[node_uuid]
+        except exception.NodeNotFound:
+            LOG.info(_LI("During sync_power_state, node %(node)s was not "
+                         "found and presumed deleted by another process."),
+                     {'node': node_uuid})
+        except Exception:
+            LOG.exception(_LE("During sync_power_state, unexpected error "
+                              "while syncing node %(node)s."),
+                          {'node': node_uuid})
+        finally:
+            stats['failed' if count else 'succeeded'] += 1
 
     @periodic_task.periodic_task(
             spacing=CONF.conductor.check_provision_state_interval)
@@ -802,7 +957,7 @@ class ConductorManager(periodic_task.PeriodicTasks):
         columns = ['uuid', 'driver']
         node_list = self.dbapi.get_nodeinfo_list(
                                     columns=columns,
-                                    filters=filters,
+                                    filters=self._add_mapped_filter(filters),
                                     sort_key='provision_updated_at',
                                     sort_dir='asc')
 
@@ -862,7 +1017,7 @@ class ConductorManager(periodic_task.PeriodicTasks):
         columns = ['id', 'uuid', 'driver', 'conductor_affinity']
         node_list = self.dbapi.get_nodeinfo_list(
                                     columns=columns,
-                                    filters=filters)
+                                    filters=self._add_mapped_filter(filters))
 
         admin_context = None
         workers_count = 0
@@ -916,6 +1071,20 @@ class ConductorManager(periodic_task.PeriodicTasks):
 
         return self.host in ring.get_hosts(node_uuid)
 
+    def _add_mapped_filter(self, filters):
+        """Restrict node filters to the nodes mapped to this conductor.
+
+        The database then only returns the nodes in the hash partitions
+        served by this conductor. Hash partitions can be split between
+        conductors, so _mapped_to_this_conductor() must still be checked.
+
+        :param filters: node filters, see dbapi.get_nodeinfo_list().
+        :returns: the filters, updated.
+        """
+        filters['hash_partitions'] = self.ring_manager.get_hash_partitions(
+                self.host)
+        return filters
+
     @messaging.expected_exceptions(exception.NodeLocked)
     def validate_driver_interfaces(self, context, node_id):
         """Validate the `core` and `standardized` interfaces for drivers.
@@ -1141,8 +1310,9 @@ class ConductorManager(periodic_task.PeriodicTasks):
 
         filters = {'associated': True}
         columns = ['uuid', 'driver', 'instance_uuid']
-        node_list = self.dbapi.get_nodeinfo_list(columns=columns,
-                                                 filters=filters)
+        node_list = self.dbapi.get_nodeinfo_list(
+                                columns=columns,
+                                filters=self._add_mapped_filter(filters))
 
         for (node_uuid, driver, instance_uuid) in node_list:
             # only handle the nodes mapped to this conductor
@@ -1297,6 +1467,20 @@ class ConductorManager(periodic_task.PeriodicTasks):
             return task.driver.management.get_supported_boot_devices()
 
 
+def _get_bmc_address(node_uuid, driver_info):
+    """Return the address of a node's management controller.
+
+    Falls back to the node's UUID when the driver_info does not contain
+    any of the known address keys, so that such nodes are not throttled
+    together.
+    """
+    driver_info = driver_info or {}
+    for key in BMC_ADDRESS_KEYS:
+        if driver_info.get(key):
+            return driver_info[key]
+    return node_uuid
+
+
 def get_vendor_passthru_metadata(route_dict):
     d = {}
     for method, metadata in route_dict.iteritems():
@@ -1458,7 +1642,7 @@ def handle_sync_power_state_max_retries_exceeded(task,
     LOG.error(msg)
 
 
-def do_sync_power_state(task, count):
+def do_sync_power_state(task, count, current_state=None):
     """Sync the power state for this node, incrementing the counter on failure.
 
     When the limit of power_state_sync_max_retries is reached, the node is put
@@ -1466,6 +1650,10 @@ def do_sync_power_state(task, count):
 
     :param task: a TaskManager instance with an exclusive lock
     :param count: number of times this node has previously failed a sync
+    :param current_state: the power state of the node, if it was already
+                          fetched from the driver, or the exception raised
+                          while fetching it. By default, it is fetched with
+                          the get_power_state() method of the driver.
     :returns: Count of failed attempts.
               On success, the counter is set to 0.
               On failure, the count is incremented by one
@@ -1486,7 +1674,12 @@ def do_sync_power_state(task, count):
     try:
         # The driver may raise an exception, or may return ERROR.
         # Handle both the same way.
-        power_state = task.driver.power.get_power_state(task)
+        if isinstance(current_state, Exception):
+            raise current_state
+        elif current_state is not None:
+            power_state = current_state
+        else:
+            power_state = task.driver.power.get_power_state(task)
         if power_state == states.ERROR:
             raise exception.PowerStateFailure(
                     _("Power driver returned ERROR state "
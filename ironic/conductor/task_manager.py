@@ -92,8 +92,20 @@ raised in the background thread.):
         task.spawn_after(self._spawn_worker,
                          utils.node_power_action, task, new_state)
 
+Periodic tasks which need to lock many nodes in turn should use
+:func:`acquire_batch`, which reserves the nodes, and loads their ports,
+a batch at a time rather than one node at a time:
+
+::
+
+    for task in task_manager.acquire_batch(context, node_ids,
+                                           filters={'maintenance': False}):
+        with task:
+            <do some work>
+
 """
 
+import collections
 import functools
 
 from oslo.config import cfg
@@ -144,6 +156,56 @@ def acquire(context, node_id, shared=False, driver_name=None):
                        driver_name=driver_name)
 
 
+def acquire_batch(context, node_ids, filters=None, batch_size=None):
+    """Lock a set of nodes, a batch at a time.
+
+    Each batch of nodes is reserved with a single conditional UPDATE, and
+    the ports of the whole batch are loaded with a single query. Nodes
+    which are already locked, or which do not match the filters, are
+    skipped silently rather than raising NodeLocked.
+
+    The yielded tasks must be used as context managers, exactly like the
+    ones returned by :func:`acquire`. Nodes of the current batch which
+    have not been yielded yet are released when the generator is closed,
+    eg. if the caller breaks out of the loop.
+
+    :param context: Request context.
+    :param node_ids: A list of node ids to lock.
+    :param filters: Filters the nodes must match to be locked. See
+                    :meth:`ironic.db.api.Connection.get_nodeinfo_list`.
+    :param batch_size: Number of nodes to reserve at once.
+                       Default: CONF.conductor.periodic_batch_size.
+    :returns: A generator of :class:`TaskManager` instances, each holding
+              an exclusive lock.
+
+    """
+    if batch_size is None:
+        batch_size = CONF.conductor.periodic_batch_size
+
+    for start in range(0, len(node_ids), batch_size):
+        batch_ids = node_ids[start:start + batch_size]
+        LOG.debug("Attempting to reserve nodes %(nodes)s",
+                  {'nodes': batch_ids})
+        nodes = objects.Node.reserve_batch(context, CONF.host, batch_ids,
+                                           filters=filters)
+        try:
+            ports = collections.defaultdict(list)
+            if nodes:
+                node_ports = objects.Port.list_by_node_ids(
+                        context, [node.id for node in nodes])
+                for port in node_ports:
+                    ports[port.node_id].append(port)
+
+            while nodes:
+                node = nodes.pop(0)
+                yield TaskManager._from_reserved_node(context, node,
+                                                      ports[node.id])
+        finally:
+            if nodes:
+                objects.Node.release_batch(context, CONF.host,
+                                           [node.id for node in nodes])
+
+
 class TaskManager(object):
     """Context manager for tasks.
 
@@ -191,14 +253,16 @@ class TaskManager(object):
         def reserve_node():
             LOG.debug("Attempting to reserve node %(node)s",
                       {'node': node_id})
-            self.node = objects.Node.reserve(context, CONF.host, node_id)
+            self.node, self.ports = objects.Node.reserve_with_ports(
+                context, CONF.host, node_id)
 
         try:
             if not self.shared:
                 reserve_node()
             else:
                 self.node = objects.Node.get(context, node_id)
-            self.ports = objects.Port.list_by_node_id(context, self.node.id)
+                self.ports = objects.Port.list_by_node_id(context,
+                                                          self.node.id)
             self.driver = driver_factory.get_driver(driver_name or
                                                     self.node.driver)
             self.fsm.initialize(self.node.provision_state)
@@ -207,6 +271,39 @@ class TaskManager(object):
             with excutils.save_and_reraise_exception():
                 self.release_resources()
 
+    @classmethod
+    def _from_reserved_node(cls, context, node, ports):
+        """Create a TaskManager for a node this host has already reserved.
+
+        This skips the reservation and port queries done by
+        :meth:`__init__`, for use by :func:`acquire_batch`.
+
+        :param context: request context
+        :param node: a :class:`ironic.objects.node.Node` reserved by
+                     CONF.host.
+        :param ports: the list of ports belonging to the node.
+        :raises: DriverNotFound
+
+        """
+        task = cls.__new__(cls)
+        task._spawn_method = None
+        task._on_error_method = None
+
+        task.context = context
+        task.node = node
+        task.ports = ports
+        task.shared = False
+
+        task.fsm = states.machine.copy()
+
+        try:
+            task.driver = driver_factory.get_driver(node.driver)
+            task.fsm.initialize(node.provision_state)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                task.release_resources()
+        return task
+
     def spawn_after(self, _spawn_method, *args, **kwargs):
         """Call this to spawn a thread to complete the task.
 
@@ -60,12 +60,18 @@ class Connection(object):
                         :chassis_uuid: uuid of chassis
                         :driver: driver's name
                         :provision_state: provision state of node
+                        :provision_state_not_in:
+                            list of provision states to exclude
                         :provisioned_before:
                             nodes with provision_updated_at field before this
                             interval in seconds
+                        :hash_partitions:
+                            dict of driver names to lists of (first, last)
+                            ranges of hash partitions, as returned by
+                            HashRingManager.get_hash_partitions()
         :param limit: Maximum number of nodes to return.
-        :param marker: the last item of the previous page; we return the next
-                       result set.
+        :param marker: the last item of the previous page, or its uuid; we
+                       return the next result set.
         :param sort_key: Attribute by which results should be sorted.
         :param sort_dir: direction in which results should be sorted.
                          (asc, desc)
@@ -74,7 +80,8 @@ class Connection(object):
 
     @abc.abstractmethod
     def get_node_list(self, filters=None, limit=None, marker=None,
-                      sort_key=None, sort_dir=None):
+                      sort_key=None, sort_dir=None, columns=None,
+                      use_slave=False):
         """Return a list of nodes.
 
         :param filters: Filters to apply. Defaults to None.
@@ -85,15 +92,20 @@ class Connection(object):
                         :chassis_uuid: uuid of chassis
                         :driver: driver's name
                         :provision_state: provision state of node
+                        :provision_state_not_in:
+                            list of provision states to exclude
                         :provisioned_before:
                             nodes with provision_updated_at field before this
                             interval in seconds
         :param limit: Maximum number of nodes to return.
-        :param marker: the last item of the previous page; we return the next
-                       result set.
+        :param marker: the last item of the previous page, or its uuid; we
+                       return the next result set.
         :param sort_key: Attribute by which results should be sorted.
         :param sort_dir: direction in which results should be sorted.
                          (asc, desc)
+        :param columns: List of column names to load. The other columns
+                        are loaded when they are first accessed. Defaults
+                        to all columns.
         """
 
     @abc.abstractmethod
@@ -110,6 +122,20 @@ class Connection(object):
         :raises: NodeLocked if the node is already reserved.
         """
 
+    @abc.abstractmethod
+    def reserve_node_with_ports(self, tag, node_id):
+        """Reserve a node and get its ports.
+
+        Like :meth:`reserve_node`, but the ports of the node are fetched
+        together with the node, within the same transaction.
+
+        :param tag: A string uniquely identifying the reservation holder.
+        :param node_id: A node id or uuid.
+        :returns: A tuple of the Node object and a list of its Port objects.
+        :raises: NodeNotFound if the node is not found.
+        :raises: NodeLocked if the node is already reserved.
+        """
+
     @abc.abstractmethod
     def release_node(self, tag, node_id):
         """Release the reservation on a node.
@@ -122,6 +148,33 @@ class Connection(object):
                  reservation at all.
         """
 
+    @abc.abstractmethod
+    def reserve_nodes(self, tag, node_ids, filters=None):
+        """Reserve a set of nodes at once.
+
+        Only the nodes which are not already reserved and which match
+        the supplied filters are reserved; the others are silently
+        skipped. This lets periodic tasks lock a batch of nodes with a
+        constant number of database round-trips.
+
+        :param tag: A string uniquely identifying the reservation holder.
+        :param node_ids: A list of node ids.
+        :param filters: Filters to apply, as accepted by
+                        :meth:`get_nodeinfo_list`. Defaults to None.
+        :returns: A list of the nodes which were reserved.
+        """
+
+    @abc.abstractmethod
+    def release_nodes(self, tag, node_ids):
+        """Release the reservations held by tag on a set of nodes.
+
+        Nodes which are not reserved by tag are left untouched.
+
+        :param tag: A string uniquely identifying the reservation holder.
+        :param node_ids: A list of node ids.
+        :returns: The number of nodes which were released.
+        """
+
     @abc.abstractmethod
     def create_node(self, values):
         """Create a new node.
@@ -145,6 +198,21 @@ class Connection(object):
         :returns: A node.
         """
 
+    @abc.abstractmethod
+    def create_nodes(self, nodes):
+        """Create a batch of new nodes, with their ports.
+
+        The nodes and ports are checked first and the ones which can be
+        created are inserted within a single transaction.
+
+        :param nodes: A list of (node values, list of port values) tuples,
+                      see create_node() and create_port(). The ports are
+                      created for their node.
+        :returns: A list with, for each tuple of the input, either a
+                  (node, list of ports) tuple or the exception explaining
+                  why the node was not created.
+        """
+
     @abc.abstractmethod
     def get_node_by_id(self, node_id):
         """Return a node.
@@ -154,18 +222,24 @@ class Connection(object):
         """
 
     @abc.abstractmethod
-    def get_node_by_uuid(self, node_uuid):
+    def get_node_by_uuid(self, node_uuid, use_slave=False):
         """Return a node.
 
         :param node_uuid: The uuid of a node.
+        :param use_slave: Whether to read from the slave database, if one
+                          is configured. Its data may lag behind the
+                          master database.
         :returns: A node.
         """
 
     @abc.abstractmethod
-    def get_node_by_instance(self, instance):
+    def get_node_by_instance(self, instance, use_slave=False):
         """Return a node.
 
         :param instance: The instance name or uuid to search for.
+        :param use_slave: Whether to read from the slave database, if one
+                          is configured. Its data may lag behind the
+                          master database.
         :returns: A node.
         """
 
@@ -199,6 +273,28 @@ class Connection(object):
         :raises: NodeNotFound
         """
 
+    @abc.abstractmethod
+    def update_node_columns(self, node_id, values, version_id):
+        """Update columns of a node, unless it was updated meanwhile.
+
+        The node is updated with a single UPDATE, without being read or
+        locked, as long as its version_id still matches the one last read
+        by the caller. When an instance is being associated with the node,
+        the node is locked and checked as by :meth:`update_node`.
+
+        :param node_id: The id or uuid of a node.
+        :param values: Dict of the columns to update, which should not
+                       include JSON columns.
+        :param version_id: The version_id of the node, as last read by
+                           the caller.
+        :returns: The new version_id of the node.
+        :raises: NodeNotFound
+        :raises: NodeUpdateConflict if the node was updated since
+                 version_id.
+        :raises: NodeAssociated
+        :raises: InstanceAssociated
+        """
+
     @abc.abstractmethod
     def get_port_by_id(self, port_id):
         """Return a network port representation.
@@ -225,29 +321,51 @@ class Connection(object):
 
     @abc.abstractmethod
     def get_port_list(self, limit=None, marker=None,
-                      sort_key=None, sort_dir=None):
+                      sort_key=None, sort_dir=None, columns=None,
+                      use_slave=False):
         """Return a list of ports.
 
         :param limit: Maximum number of ports to return.
-        :param marker: the last item of the previous page; we return the next
-                       result set.
+        :param marker: the last item of the previous page, or its uuid; we
+                       return the next result set.
         :param sort_key: Attribute by which results should be sorted.
         :param sort_dir: direction in which results should be sorted.
                          (asc, desc)
+        :param columns: List of column names to load. The other columns
+                        are loaded when they are first accessed. Defaults
+                        to all columns.
+        :param use_slave: Whether to read from the slave database, if one
+                          is configured. Its data may lag behind the
+                          master database.
         """
 
     @abc.abstractmethod
     def get_ports_by_node_id(self, node_id, limit=None, marker=None,
-                             sort_key=None, sort_dir=None):
+                             sort_key=None, sort_dir=None, columns=None,
+                             use_slave=False):
         """List all the ports for a given node.
 
         :param node_id: The integer node ID.
         :param limit: Maximum number of ports to return.
-        :param marker: the last item of the previous page; we return the next
-                       result set.
+        :param marker: the last item of the previous page, or its uuid; we
+                       return the next result set.
         :param sort_key: Attribute by which results should be sorted
         :param sort_dir: direction in which results should be sorted
                          (asc, desc)
+        :param columns: List of column names to load. The other columns
+                        are loaded when they are first accessed. Defaults
+                        to all columns.
+        :param use_slave: Whether to read from the slave database, if one
+                          is configured. Its data may lag behind the
+                          master database.
+        :returns: A list of ports.
+        """
+
+    @abc.abstractmethod
+    def get_ports_by_node_ids(self, node_ids):
+        """List all the ports for a set of nodes in a single query.
+
+        :param node_ids: A list of integer node IDs.
         :returns: A list of ports.
         """
 
@@ -299,15 +417,22 @@ class Connection(object):
 
     @abc.abstractmethod
     def get_chassis_list(self, limit=None, marker=None,
-                         sort_key=None, sort_dir=None):
+                         sort_key=None, sort_dir=None, columns=None,
+                         use_slave=False):
         """Return a list of chassis.
 
         :param limit: Maximum number of chassis to return.
-        :param marker: the last item of the previous page; we return the next
-                       result set.
+        :param marker: the last item of the previous page, or its uuid; we
+                       return the next result set.
         :param sort_key: Attribute by which results should be sorted.
         :param sort_dir: direction in which results should be sorted.
                          (asc, desc)
+        :param columns: List of column names to load. The other columns
+                        are loaded when they are first accessed. Defaults
+                        to all columns.
+        :param use_slave: Whether to read from the slave database, if one
+                          is configured. Its data may lag behind the
+                          master database.
         """
 
     @abc.abstractmethod
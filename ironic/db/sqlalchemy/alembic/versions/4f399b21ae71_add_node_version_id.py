@@ -0,0 +1,35 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Add Node.version_id
+
+Revision ID: 4f399b21ae71
+Revises: 9dc00eeae27e
+Create Date: 2015-01-27 16:02:45.612097
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4f399b21ae71'
+down_revision = '9dc00eeae27e'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('nodes', sa.Column('version_id', sa.Integer(),
+                                     nullable=False, server_default='0'))
+
+
+def downgrade():
+    op.drop_column('nodes', 'version_id')
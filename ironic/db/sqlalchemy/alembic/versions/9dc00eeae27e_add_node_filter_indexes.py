@@ -0,0 +1,42 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Add indexes for the node filters of periodic tasks
+
+Revision ID: 9dc00eeae27e
+Revises: d74820bcf393
+Create Date: 2015-01-22 14:37:05.218339
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '9dc00eeae27e'
+down_revision = 'd74820bcf393'
+
+from alembic import op
+
+
+def upgrade():
+    # unreserved nodes, optionally out of maintenance and mapped to a
+    # conductor, eg. _sync_power_states() and GET /v1/nodes?maintenance=
+    op.create_index('node_maintenance_reservation_idx', 'nodes',
+                    ['maintenance', 'reservation', 'driver',
+                     'hash_partition'])
+    # nodes in a provision state, optionally since a given time, eg.
+    # _check_deploy_timeouts() and _sync_local_state()
+    op.create_index('node_provision_state_idx', 'nodes',
+                    ['provision_state', 'provision_updated_at'])
+
+
+def downgrade():
+    op.drop_index('node_provision_state_idx', 'nodes')
+    op.drop_index('node_maintenance_reservation_idx', 'nodes')
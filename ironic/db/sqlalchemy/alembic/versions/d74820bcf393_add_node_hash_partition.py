@@ -0,0 +1,64 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Add Node.hash_partition
+
+Revision ID: d74820bcf393
+Revises: 242cc6a923b3
+Create Date: 2015-01-20 10:12:31.528470
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'd74820bcf393'
+down_revision = '242cc6a923b3'
+
+import hashlib
+import struct
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import sql
+
+# NOTE: a copy of ironic.common.hash_ring.get_hash_partition() as of this
+#       revision, so that later changes to the hash ring do not change
+#       what this migration computes.
+HASH_PARTITION_BITS = 16
+
+
+def _get_hash_partition(data):
+    digest = hashlib.md5(data).digest()
+    return struct.unpack_from('>I', digest)[0] >> (32 - HASH_PARTITION_BITS)
+
+
+def upgrade():
+    op.add_column('nodes', sa.Column('hash_partition',
+                                     sa.Integer(),
+                                     nullable=True))
+    op.create_index('node_driver_hash_partition_idx', 'nodes',
+                    ['driver', 'hash_partition'])
+
+    nodes = sql.table('nodes',
+                      sql.column('id', sa.Integer),
+                      sql.column('uuid', sa.String(36)),
+                      sql.column('hash_partition', sa.Integer))
+    connection = op.get_bind()
+    for node_id, node_uuid in connection.execute(
+            sql.select([nodes.c.id, nodes.c.uuid])).fetchall():
+        connection.execute(
+            nodes.update().where(nodes.c.id == node_id).values(
+                hash_partition=_get_hash_partition(str(node_uuid))))
+
+
+def downgrade():
+    op.drop_index('node_driver_hash_partition_idx', 'nodes')
+    op.drop_column('nodes', 'hash_partition')
@@ -24,9 +24,13 @@ from oslo.db import exception as db_exc
 from oslo.db.sqlalchemy import session as db_session
 from oslo.db.sqlalchemy import utils as db_utils
 from oslo.utils import timeutils
+import six
+from sqlalchemy import orm
 from sqlalchemy.orm.exc import NoResultFound
+from sqlalchemy import sql
 
 from ironic.common import exception
+from ironic.common import hash_ring
 from ironic.common.i18n import _
 from ironic.common import states
 from ironic.common import utils
@@ -41,6 +45,10 @@ CONF.import_opt('heartbeat_timeout',
 
 LOG = log.getLogger(__name__)
 
+# NOTE: the number of values bound to a single IN clause. SQLite accepts
+#       999 parameters per statement at most.
+_MAX_IN_VALUES = 500
+
 
 _FACADE = None
 
@@ -52,9 +60,9 @@ def _create_facade_lazily():
     return _FACADE
 
 
-def get_engine():
+def get_engine(use_slave=False):
     facade = _create_facade_lazily()
-    return facade.get_engine()
+    return facade.get_engine(use_slave=use_slave)
 
 
 def get_session(**kwargs):
@@ -71,9 +79,12 @@ def model_query(model, *args, **kwargs):
     """Query helper for simpler session usage.
 
     :param session: if present, the session to use
+    :param use_slave: if True and no session is given, read from the slave
+                      database when one is configured
     """
 
-    session = kwargs.get('session') or get_session()
+    session = kwargs.get('session') or get_session(
+        use_slave=kwargs.get('use_slave', False))
     query = session.query(model, *args)
     return query
 
@@ -141,16 +152,245 @@ def _check_port_change_forbidden(port, session):
                                        host=node_ref['reservation'])
 
 
+class _MarkerRow(object):
+    """The sort keys of a pagination marker, selected by the database.
+
+    Passed as the marker of paginate_query(), each sort key of the row
+    with the given uuid becomes a subquery of the page query, so the next
+    page is fetched without first loading the marker row.
+    """
+
+    def __init__(self, model, uuid):
+        self._model = model
+        self._uuid = uuid
+
+    def __getattr__(self, name):
+        column = getattr(self._model, name)
+        return (sql.select([column])
+                .where(self._model.uuid == self._uuid)
+                .as_scalar())
+
+
 def _paginate_query(model, limit=None, marker=None, sort_key=None,
-                    sort_dir=None, query=None):
+                    sort_dir=None, query=None, columns=None,
+                    use_slave=False):
     if not query:
-        query = model_query(model)
+        query = model_query(model, use_slave=use_slave)
+    if columns is not None:
+        query = query.options(orm.load_only(*columns))
+    marker_uuid = None
+    if (isinstance(marker, six.string_types) and use_slave and
+            CONF.database.slave_connection):
+        # NOTE: the marker may be a resource which was just created, and
+        #       which the slave does not have yet. So it is looked up on
+        #       the master.
+        marker_row = model_query(model).filter_by(uuid=marker).first()
+        if marker_row is None:
+            raise exception.MarkerNotFound(marker=marker)
+        marker = marker_row
+    elif isinstance(marker, six.string_types):
+        marker_uuid = marker
+        marker = _MarkerRow(model, marker_uuid)
     sort_keys = ['id']
     if sort_key and sort_key not in sort_keys:
         sort_keys.insert(0, sort_key)
     query = db_utils.paginate_query(query, model, limit, sort_keys,
                                     marker=marker, sort_dir=sort_dir)
-    return query.all()
+    result = query.all()
+    # NOTE: the page after an unknown marker is empty, so the marker is
+    #       only looked up when nothing was found.
+    if not result and marker_uuid is not None:
+        if not model_query(model.id).filter_by(uuid=marker_uuid).count():
+            raise exception.MarkerNotFound(marker=marker_uuid)
+    return result
+
+
+def _add_provision_state_not_in_filter(query, provision_states):
+    excluded = set(provision_states)
+    # NOTE: NOSTATE is stored as NULL, and NULL never compares unequal to
+    #       anything, so it is matched explicitly.
+    if states.NOSTATE in excluded:
+        excluded.discard(states.NOSTATE)
+        query = query.filter(models.Node.provision_state != None)
+        if excluded:
+            query = query.filter(~models.Node.provision_state.in_(excluded))
+    elif excluded:
+        query = query.filter(sql.or_(
+            models.Node.provision_state == None,
+            ~models.Node.provision_state.in_(excluded)))
+    return query
+
+
+def _add_hash_partitions_filter(query, hash_partitions):
+    mapped = []
+    for driver, ranges in hash_partitions.items():
+        # NOTE: nodes whose hash partition was never computed are returned
+        #       too, callers check the mapping of the nodes anyway.
+        in_ranges = [models.Node.hash_partition == None]
+        in_ranges.extend(models.Node.hash_partition.between(first, last)
+                         for first, last in ranges)
+        mapped.append(sql.and_(models.Node.driver == driver,
+                               sql.or_(*in_ranges)))
+    return query.filter(sql.or_(*mapped) if mapped else sql.false())
+
+
+def _query_in(query, column, values):
+    """Return the rows of a query whose column is in a list of values.
+
+    The values are split in chunks, so that long lists do not exceed the
+    number of parameters a statement can have.
+    """
+    values = list(values)
+    result = []
+    for start in range(0, len(values), _MAX_IN_VALUES):
+        chunk = values[start:start + _MAX_IN_VALUES]
+        result.extend(query.filter(column.in_(chunk)).all())
+    return result
+
+
+def _get_existing(session, column, values):
+    """Return the set of values of a column which are in the table."""
+    values = set(v for v in values if v is not None)
+    if not values:
+        return set()
+    query = model_query(column, session=session)
+    return set(row[0] for row in _query_in(query, column, values))
+
+
+def bulk_insert(session, model, rows):
+    """Insert rows in a table with a single executemany() call.
+
+    Most drivers turn it into multi-row INSERT statements, rather than
+    one statement per row as the ORM would do.
+
+    :param session: the session, within a transaction, to insert with.
+    :param model: the model whose table the rows are inserted in.
+    :param rows: a list of dicts of column values. Like the ORM does, the
+                 columns which are None or missing from a row are set to
+                 their default value, if they have one.
+    """
+    if not rows:
+        return
+    table = model.__table__
+    keys = set()
+    for row in rows:
+        keys.update(row)
+    defaults = {}
+    for key in keys:
+        default = table.c[key].default
+        if default is not None and default.is_callable:
+            defaults[key] = default.arg
+        elif default is not None and default.is_scalar:
+            defaults[key] = lambda ctx, value=default.arg: value
+        else:
+            defaults[key] = lambda ctx: None
+    params = []
+    for row in rows:
+        params.append(dict((key, row[key] if row.get(key) is not None
+                            else defaults[key](None))
+                           for key in keys))
+    session.execute(table.insert(), params)
+
+
+def _prepare_node_values(values):
+    # ensure defaults are present for new nodes
+    if not values.get('uuid'):
+        values['uuid'] = utils.generate_uuid()
+    if not values.get('power_state'):
+        values['power_state'] = states.NOSTATE
+    if not values.get('provision_state'):
+        values['provision_state'] = states.NOSTATE
+    values['hash_partition'] = hash_ring.get_hash_partition(
+            values['uuid'])
+
+
+def _prepare_port_values(values):
+    if not values.get('uuid'):
+        values['uuid'] = utils.generate_uuid()
+
+
+def _check_new_nodes(session, nodes):
+    """Find the nodes of a batch which conflict with existing resources.
+
+    :param session: the session to query with.
+    :param nodes: a list of (node values, list of port values) tuples.
+    :returns: a dict of the exception for the nodes which can not be
+              created, by index in the list.
+    """
+    new_ports = [port for node, ports in nodes for port in ports]
+    node_uuids = _get_existing(session, models.Node.uuid,
+                               [n['uuid'] for n, p in nodes])
+    instance_uuids = _get_existing(session, models.Node.instance_uuid,
+                                   [n.get('instance_uuid') for n, p in nodes])
+    port_uuids = _get_existing(session, models.Port.uuid,
+                               [p['uuid'] for p in new_ports])
+    addresses = _get_existing(session, models.Port.address,
+                              [p.get('address') for p in new_ports])
+
+    errors = {}
+    for index, (node, ports) in enumerate(nodes):
+        instance_uuid = node.get('instance_uuid')
+        if node['uuid'] in node_uuids:
+            errors[index] = exception.NodeAlreadyExists(uuid=node['uuid'])
+        elif instance_uuid is not None and instance_uuid in instance_uuids:
+            errors[index] = exception.InstanceAssociated(
+                instance_uuid=instance_uuid, node=node['uuid'])
+        new_port_uuids = set()
+        new_addresses = set()
+        for port in ports:
+            if index in errors:
+                break
+            address = port.get('address')
+            if (port['uuid'] in port_uuids
+                    or port['uuid'] in new_port_uuids):
+                errors[index] = exception.PortAlreadyExists(
+                    uuid=port['uuid'])
+            elif address is not None and (address in addresses
+                                          or address in new_addresses):
+                errors[index] = exception.MACAlreadyExists(mac=address)
+            new_port_uuids.add(port['uuid'])
+            new_addresses.add(address)
+        if index in errors:
+            continue
+        # NOTE: the later nodes of the batch conflict with this one.
+        node_uuids.add(node['uuid'])
+        instance_uuids.add(instance_uuid)
+        port_uuids.update(new_port_uuids)
+        addresses.update(new_addresses)
+    return errors
+
+
+def _create_nodes(nodes):
+    session = get_session()
+    with session.begin():
+        errors = _check_new_nodes(session, nodes)
+        created = [(index, node, ports)
+                   for index, (node, ports) in enumerate(nodes)
+                   if index not in errors]
+        bulk_insert(session, models.Node, [n for i, n, p in created])
+        node_refs = _query_in(model_query(models.Node, session=session),
+                              models.Node.uuid,
+                              [n['uuid'] for i, n, p in created])
+        node_refs = dict((ref.uuid, ref) for ref in node_refs)
+
+        port_values = []
+        for index, node, ports in created:
+            for port in ports:
+                port['node_id'] = node_refs[node['uuid']].id
+                port_values.append(port)
+        bulk_insert(session, models.Port, port_values)
+        port_refs = _query_in(model_query(models.Port, session=session),
+                              models.Port.uuid,
+                              [p['uuid'] for p in port_values])
+        port_refs = dict((ref.uuid, ref) for ref in port_refs)
+
+    result = list(nodes)
+    for index, node, ports in created:
+        result[index] = (node_refs[node['uuid']],
+                         [port_refs[p['uuid']] for p in ports])
+    for index, error in errors.items():
+        result[index] = error
+    return result
 
 
 class Connection(api.Connection):
@@ -184,6 +424,12 @@ class Connection(api.Connection):
             query = query.filter_by(driver=filters['driver'])
         if 'provision_state' in filters:
             query = query.filter_by(provision_state=filters['provision_state'])
+        if 'provision_state_not_in' in filters:
+            query = _add_provision_state_not_in_filter(
+                        query, filters['provision_state_not_in'])
+        if 'hash_partitions' in filters:
+            query = _add_hash_partitions_filter(query,
+                                                filters['hash_partitions'])
         if 'provisioned_before' in filters:
             limit = timeutils.utcnow() - datetime.timedelta(
                                          seconds=filters['provisioned_before'])
@@ -206,11 +452,13 @@ class Connection(api.Connection):
                                sort_key, sort_dir, query)
 
     def get_node_list(self, filters=None, limit=None, marker=None,
-                      sort_key=None, sort_dir=None):
-        query = model_query(models.Node)
+                      sort_key=None, sort_dir=None, columns=None,
+                      use_slave=False):
+        query = model_query(models.Node, use_slave=use_slave)
         query = self._add_nodes_filters(query, filters)
         return _paginate_query(models.Node, limit, marker,
-                               sort_key, sort_dir, query)
+                               sort_key, sort_dir, query, columns,
+                               use_slave)
 
     def reserve_node(self, tag, node_id):
         session = get_session()
@@ -231,33 +479,134 @@ class Connection(api.Connection):
             except NoResultFound:
                 raise exception.NodeNotFound(node_id)
 
+    def reserve_node_with_ports(self, tag, node_id):
+        session = get_session()
+        with session.begin():
+            if session.get_bind().dialect.name == 'postgresql':
+                node = self._reserve_node_returning(session, tag, node_id)
+                query = model_query(models.Port, session=session)
+                ports = query.filter_by(node_id=node['id']).all()
+                return node, ports
+
+            # Fetch the node and its ports in a single SELECT, locking the
+            # node row until the reservation below is committed.
+            query = model_query(models.Node, models.Port, session=session)
+            # NOTE: filter_by() applies to the last joined entity, so the
+            #       identity filter must be added before the join.
+            query = add_identity_filter(query, node_id)
+            query = query.outerjoin(models.Port,
+                                    models.Port.node_id == models.Node.id)
+            rows = query.with_lockmode('update').all()
+            if not rows:
+                raise exception.NodeNotFound(node_id)
+            node = rows[0][0]
+            if node['reservation'] is not None:
+                raise exception.NodeLocked(node=node_id,
+                                           host=node['reservation'])
+
+            query = model_query(models.Node, session=session)
+            count = query.filter_by(id=node['id'], reservation=None).update(
+                        {'reservation': tag}, synchronize_session=False)
+            if count != 1:
+                # NOTE: backends without row locks (eg. SQLite) may let
+                #       another reservation slip in after the SELECT.
+                node = query.filter_by(id=node['id']).populate_existing().one()
+                raise exception.NodeLocked(node=node_id,
+                                           host=node['reservation'])
+
+        # The UPDATE bypassed the ORM, so reflect the reservation on the
+        # row being returned. The session is not flushed again.
+        node['reservation'] = tag
+        return node, [port for _node, port in rows if port is not None]
+
+    def _reserve_node_returning(self, session, tag, node_id):
+        """Reserve a node and read it back with UPDATE ... RETURNING."""
+        nodes = models.Node.__table__
+        if utils.is_int_like(node_id):
+            where = nodes.c.id == int(node_id)
+        elif utils.is_uuid_like(node_id):
+            where = nodes.c.uuid == node_id
+        else:
+            raise exception.InvalidIdentity(identity=node_id)
+        statement = (nodes.update()
+                     .where(sql.and_(where, nodes.c.reservation == sql.null()))
+                     .values(reservation=tag)
+                     .returning(*nodes.c))
+        row = session.execute(statement).first()
+        if row is None:
+            # Nothing updated, find out why.
+            query = model_query(models.Node, session=session)
+            node = add_identity_filter(query, node_id).first()
+            if node is None:
+                raise exception.NodeNotFound(node_id)
+            raise exception.NodeLocked(node=node_id, host=node['reservation'])
+        return models.Node(**dict(row.items()))
+
     def release_node(self, tag, node_id):
+        # NOTE: this runs outside of an explicit transaction, so that
+        #       releasing a reservation is a single UPDATE. The node is
+        #       only read back to report why nothing was released.
+        query = model_query(models.Node)
+        query = add_identity_filter(query, node_id)
+        # be optimistic and assume we usually release a reservation
+        count = query.filter_by(reservation=tag).update(
+                    {'reservation': None}, synchronize_session=False)
+        if count == 1:
+            return
+        node = query.first()
+        if node is None:
+            raise exception.NodeNotFound(node_id)
+        if node['reservation'] is None:
+            raise exception.NodeNotLocked(node=node_id)
+        raise exception.NodeLocked(node=node_id, host=node['reservation'])
+
+    def reserve_nodes(self, tag, node_ids, filters=None):
+        if not node_ids:
+            return []
+        filters = dict(filters or {}, reserved=False)
+
         session = get_session()
         with session.begin():
             query = model_query(models.Node, session=session)
-            query = add_identity_filter(query, node_id)
-            # be optimistic and assume we usually release a reservation
-            count = query.filter_by(reservation=tag).update(
+            query = query.filter(models.Node.id.in_(node_ids))
+            query = self._add_nodes_filters(query, filters)
+            # lock the candidate rows, so that the UPDATE below reserves
+            # exactly the set of nodes which is returned to the caller
+            nodes = query.with_lockmode('update').all()
+            if not nodes:
+                return []
+
+            ids = [node['id'] for node in nodes]
+            query = model_query(models.Node, session=session)
+            query = query.filter(models.Node.id.in_(ids))
+            count = query.filter_by(reservation=None).update(
+                        {'reservation': tag}, synchronize_session=False)
+            if count != len(ids):
+                # NOTE: backends without row locks (eg. SQLite) may let
+                #       another reservation slip in between the SELECT and
+                #       the UPDATE; only return what we actually hold.
+                nodes = (query.filter_by(reservation=tag)
+                         .populate_existing().all())
+
+        # The UPDATE bypassed the ORM, so reflect the reservation on the
+        # rows being returned. The session is not flushed again.
+        for node in nodes:
+            node['reservation'] = tag
+        return nodes
+
+    def release_nodes(self, tag, node_ids):
+        if not node_ids:
+            return 0
+
+        session = get_session()
+        with session.begin():
+            query = model_query(models.Node, session=session)
+            query = query.filter(models.Node.id.in_(node_ids))
+            return query.filter_by(reservation=tag).update(
                         {'reservation': None}, synchronize_session=False)
-            try:
-                if count != 1:
-                    node = query.one()
-                    if node['reservation'] is None:
-                        raise exception.NodeNotLocked(node=node_id)
-                    else:
-                        raise exception.NodeLocked(node=node_id,
-                                                   host=node['reservation'])
-            except NoResultFound:
-                raise exception.NodeNotFound(node_id)
 
     def create_node(self, values):
-        # ensure defaults are present for new nodes
-        if not values.get('uuid'):
-            values['uuid'] = utils.generate_uuid()
-        if not values.get('power_state'):
-            values['power_state'] = states.NOSTATE
-        if not values.get('provision_state'):
-            values['provision_state'] = states.NOSTATE
+        _prepare_node_values(values)
 
         node = models.Node()
         node.update(values)
@@ -271,6 +620,18 @@ class Connection(api.Connection):
             raise exception.NodeAlreadyExists(uuid=values['uuid'])
         return node
 
+    def create_nodes(self, nodes):
+        for node, ports in nodes:
+            _prepare_node_values(node)
+            for port in ports:
+                _prepare_port_values(port)
+        try:
+            return _create_nodes(nodes)
+        except db_exc.DBDuplicateEntry:
+            # NOTE: a conflicting node or port was created after the batch
+            #       was checked, checking it again finds it.
+            return _create_nodes(nodes)
+
     def get_node_by_id(self, node_id):
         query = model_query(models.Node).filter_by(id=node_id)
         try:
@@ -278,18 +639,19 @@ class Connection(api.Connection):
         except NoResultFound:
             raise exception.NodeNotFound(node=node_id)
 
-    def get_node_by_uuid(self, node_uuid):
-        query = model_query(models.Node).filter_by(uuid=node_uuid)
+    def get_node_by_uuid(self, node_uuid, use_slave=False):
+        query = model_query(models.Node, use_slave=use_slave)
+        query = query.filter_by(uuid=node_uuid)
         try:
             return query.one()
         except NoResultFound:
             raise exception.NodeNotFound(node=node_uuid)
 
-    def get_node_by_instance(self, instance):
+    def get_node_by_instance(self, instance, use_slave=False):
         if not utils.is_uuid_like(instance):
             raise exception.InvalidUUID(uuid=instance)
 
-        query = (model_query(models.Node)
+        query = (model_query(models.Node, use_slave=use_slave)
                  .filter_by(instance_uuid=instance))
 
         try:
@@ -334,7 +696,37 @@ class Connection(api.Connection):
                 instance_uuid=values['instance_uuid'],
                 node=node_id)
 
-    def _do_update_node(self, node_id, values):
+    def update_node_columns(self, node_id, values, version_id):
+        if 'uuid' in values:
+            msg = _("Cannot overwrite UUID for an existing Node.")
+            raise exception.InvalidParameterValue(err=msg)
+
+        # Associating an instance needs the checks done under the row lock
+        if values.get('instance_uuid'):
+            try:
+                ref = self._do_update_node(node_id, values,
+                                           version_id=version_id)
+            except db_exc.DBDuplicateEntry:
+                raise exception.InstanceAssociated(
+                    instance_uuid=values['instance_uuid'],
+                    node=node_id)
+            return ref.version_id
+
+        values = dict(values, version_id=models.Node.version_id + 1)
+        if 'provision_state' in values:
+            values['provision_updated_at'] = timeutils.utcnow()
+
+        query = model_query(models.Node)
+        query = add_identity_filter(query, node_id)
+        count = query.filter_by(version_id=version_id).update(
+                values, synchronize_session=False)
+        if count != 1:
+            if not query.count():
+                raise exception.NodeNotFound(node=node_id)
+            raise exception.NodeUpdateConflict(node=node_id)
+        return version_id + 1
+
+    def _do_update_node(self, node_id, values, version_id=None):
         session = get_session()
         with session.begin():
             query = model_query(models.Node, session=session)
@@ -344,6 +736,9 @@ class Connection(api.Connection):
             except NoResultFound:
                 raise exception.NodeNotFound(node=node_id)
 
+            if version_id is not None and ref.version_id != version_id:
+                raise exception.NodeUpdateConflict(node=node_id)
+
             # Prevent instance_uuid overwriting
             if values.get("instance_uuid") and ref.instance_uuid:
                 raise exception.NodeAssociated(node=node_id,
@@ -353,6 +748,7 @@ class Connection(api.Connection):
                 values['provision_updated_at'] = timeutils.utcnow()
 
             ref.update(values)
+            ref.version_id += 1
         return ref
 
     def get_port_by_id(self, port_id):
@@ -377,20 +773,27 @@ class Connection(api.Connection):
             raise exception.PortNotFound(port=address)
 
     def get_port_list(self, limit=None, marker=None,
-                      sort_key=None, sort_dir=None):
+                      sort_key=None, sort_dir=None, columns=None,
+                      use_slave=False):
         return _paginate_query(models.Port, limit, marker,
-                               sort_key, sort_dir)
+                               sort_key, sort_dir, columns=columns,
+                               use_slave=use_slave)
 
     def get_ports_by_node_id(self, node_id, limit=None, marker=None,
-                             sort_key=None, sort_dir=None):
-        query = model_query(models.Port)
+                             sort_key=None, sort_dir=None, columns=None,
+                             use_slave=False):
+        query = model_query(models.Port, use_slave=use_slave)
         query = query.filter_by(node_id=node_id)
         return _paginate_query(models.Port, limit, marker,
-                               sort_key, sort_dir, query)
+                               sort_key, sort_dir, query, columns,
+                               use_slave)
+
+    def get_ports_by_node_ids(self, node_ids):
+        query = model_query(models.Port)
+        return _query_in(query, models.Port.node_id, node_ids)
 
     def create_port(self, values):
-        if not values.get('uuid'):
-            values['uuid'] = utils.generate_uuid()
+        _prepare_port_values(values)
         port = models.Port()
         port.update(values)
         try:
@@ -449,9 +852,11 @@ class Connection(api.Connection):
             raise exception.ChassisNotFound(chassis=chassis_uuid)
 
     def get_chassis_list(self, limit=None, marker=None,
-                         sort_key=None, sort_dir=None):
+                         sort_key=None, sort_dir=None, columns=None,
+                         use_slave=False):
         return _paginate_query(models.Chassis, limit, marker,
-                               sort_key, sort_dir)
+                               sort_key, sort_dir, columns=columns,
+                               use_slave=use_slave)
 
     def create_chassis(self, values):
         if not values.get('uuid'):
@@ -18,11 +18,10 @@
 SQLAlchemy models for baremetal data.
 """
 
-import json
-
 from oslo.config import cfg
 from oslo.db import options as db_options
 from oslo.db.sqlalchemy import models
+from oslo.utils import importutils
 import six.moves.urllib.parse as urlparse
 from sqlalchemy import Boolean, Column, DateTime
 from sqlalchemy import ForeignKey, Integer
@@ -36,7 +35,12 @@ from ironic.common import paths
 sql_opts = [
     cfg.StrOpt('mysql_engine',
                default='InnoDB',
-               help='MySQL engine to use.')
+               help='MySQL engine to use.'),
+    cfg.StrOpt('json_codec',
+               default='json',
+               help='Module used to encode and decode the JSON columns. '
+                    'It must provide the dumps() and loads() functions of '
+                    'the standard json module, eg. "simplejson".'),
 ]
 
 _DEFAULT_SQL_CONNECTION = 'sqlite:///' + paths.state_path_def('ironic.sqlite')
@@ -54,6 +58,16 @@ def table_args():
     return None
 
 
+_json_codecs = {}
+
+
+def _get_json_codec():
+    name = cfg.CONF.database.json_codec
+    if name not in _json_codecs:
+        _json_codecs[name] = importutils.import_module(name)
+    return _json_codecs[name]
+
+
 class JsonEncodedType(TypeDecorator):
     """Abstract base type serialized as json-encoded string in db."""
     type = None
@@ -69,12 +83,12 @@ class JsonEncodedType(TypeDecorator):
                             % (self.__class__.__name__,
                                self.type.__name__,
                                type(value).__name__))
-        serialized_value = json.dumps(value)
+        serialized_value = _get_json_codec().dumps(value)
         return serialized_value
 
     def process_result_value(self, value, dialect):
         if value is not None:
-            value = json.loads(value)
+            value = _get_json_codec().loads(value)
         return value
 
 
@@ -146,9 +160,19 @@ class Node(Base):
         schema.UniqueConstraint('uuid', name='uniq_nodes0uuid'),
         schema.UniqueConstraint('instance_uuid',
                                 name='uniq_nodes0instance_uuid'),
+        schema.Index('node_driver_hash_partition_idx',
+                     'driver', 'hash_partition'),
+        schema.Index('node_maintenance_reservation_idx',
+                     'maintenance', 'reservation', 'driver', 'hash_partition'),
+        schema.Index('node_provision_state_idx',
+                     'provision_state', 'provision_updated_at'),
         table_args())
     id = Column(Integer, primary_key=True)
     uuid = Column(String(36))
+    # NOTE: the leading bits of the hash of the uuid, which let conductors
+    #       select the nodes mapped to them by the hash ring in the database.
+    #       See ironic.common.hash_ring.get_hash_partition().
+    hash_partition = Column(Integer, nullable=True)
     # NOTE(deva): we store instance_uuid directly on the node so that we can
     #             filter on it more efficiently, even though it is
     #             user-settable, and would otherwise be in node.properties.
@@ -183,6 +207,11 @@ class Node(Base):
     maintenance_reason = Column(Text, nullable=True)
     console_enabled = Column(Boolean, default=False)
     extra = Column(JSONEncodedDict)
+    # NOTE: incremented by every update of the node, so that an update can
+    #       be made conditional on the node not having changed since it
+    #       was read. See Connection.update_node_columns().
+    version_id = Column(Integer, nullable=False, default=0,
+                        server_default='0')
 
 
 class Port(Base):
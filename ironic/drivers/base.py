@@ -267,6 +267,26 @@ class PowerInterface(object):
         :raises: MissingParameterValue if a required parameter is missing.
         """
 
+    def get_power_states(self, tasks):
+        """Return the power states of several nodes at once.
+
+        Called for nodes sharing the same management controller. This
+        implementation calls get_power_state() for each node in turn;
+        interfaces able to query the controller once for all the nodes
+        should override it.
+
+        :param tasks: a list of TaskManager instances.
+        :returns: a dict mapping the UUID of each node to its power state,
+                  or to the exception raised while getting it.
+        """
+        power_states = {}
+        for task in tasks:
+            try:
+                power_states[task.node.uuid] = self.get_power_state(task)
+            except Exception as e:
+                power_states[task.node.uuid] = e
+        return power_states
+
 
 @six.add_metaclass(abc.ABCMeta)
 class ConsoleInterface(object):
@@ -543,9 +543,14 @@ def fetch_images(ctx, cache, images_info, force_raw=True):
                       format
     :raises: InstanceDeployFailure if unable to find enough disk space
     """
+    # NOTE: the metadata gives both the space needed and the checksums
+    # to check the downloads against
+    image_metas = dict((href, images.image_show(ctx, href))
+                       for href, path in images_info)
 
     try:
-        image_cache.clean_up_caches(ctx, cache.master_dir, images_info)
+        image_cache.clean_up_caches(ctx, cache.master_dir, images_info,
+                                    image_metas)
     except exception.InsufficientDiskSpace as e:
         raise exception.InstanceDeployFailure(reason=e)
 
@@ -554,7 +559,8 @@ def fetch_images(ctx, cache, images_info, force_raw=True):
     # This is probably unavoidable, as we can't control other
     # (probably unrelated) processes
     for href, path in images_info:
-        cache.fetch_image(href, path, ctx=ctx, force_raw=force_raw)
+        cache.fetch_image(href, path, ctx=ctx, force_raw=force_raw,
+                          checksum=image_metas[href].get('checksum'))
 
 
 def set_failed_state(task, msg):
@@ -18,8 +18,13 @@
 Utility for caching master images.
 """
 
+import contextlib
+import errno
+import heapq
 import os
+import stat
 import tempfile
+import threading
 import time
 
 from oslo.config import cfg
@@ -52,6 +57,265 @@ CONF.register_opts(img_cache_opts)
 # order of priority.
 _cache_cleanup_list = []
 
+# Indexes of master images, one per master directory. They are shared by all
+# instances of ImageCache working on the same directory.
+_master_indexes = {}
+_master_indexes_lock = threading.Lock()
+
+# Suffix of the file next to a master image which holds the checksum the
+# downloaded data matched.
+_CHECKSUM_SUFFIX = '.checksum'
+
+
+class _MasterImageIndex(object):
+    """In-memory index of the master images in a cache directory.
+
+    Records the size and the last use time of every master image, so that
+    cleaning up does not need to list and stat the whole directory. The
+    images are kept in a heap ordered by last use time, stale heap items
+    left behind by updates are skipped when popped.
+
+    It also counts the references taken to link each image, an image is
+    only evicted when nobody holds a reference to it, and references wait
+    for an eviction in progress to finish.
+    """
+
+    def __init__(self, master_dir):
+        self.master_dir = master_dir
+        self.total_size = 0
+        self._entries = {}
+        self._heap = []
+        self._refs = {}
+        self._evicting = set()
+        self._lock = threading.Lock()
+        self._evicted = threading.Condition(self._lock)
+        for file_name in os.listdir(master_dir):
+            try:
+                st = os.stat(os.path.join(master_dir, file_name))
+            except OSError:
+                continue
+            if (not stat.S_ISREG(st.st_mode) or
+                    file_name.endswith(_CHECKSUM_SUFFIX)):
+                continue
+            # NOTE(dtantsur): Detect most recently accessed files,
+            # seeing atime can be disabled by the mount option
+            # Also include ctime as it changes when image is linked to
+            last_used = max(st.st_mtime, st.st_atime, st.st_ctime)
+            self._set(file_name, st.st_size, last_used)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _set(self, file_name, size, last_used):
+        old = self._entries.get(file_name)
+        if old is not None:
+            self.total_size -= old[0]
+        self._entries[file_name] = (size, last_used)
+        self.total_size += size
+        heapq.heappush(self._heap, (last_used, file_name))
+        # NOTE: drop the stale items once they outnumber the live ones
+        if len(self._heap) > 2 * len(self._entries) + 16:
+            self._heap = [(entry[1], name)
+                          for name, entry in self._entries.items()]
+            heapq.heapify(self._heap)
+
+    def record_use(self, file_name, size=None):
+        """Record that a master image was just used or added.
+
+        :param file_name: name of the master image
+        :param size: size of the image in bytes, None to keep the known
+                     size or to get it from the file system
+        """
+        if size is None and file_name not in self._entries:
+            try:
+                size = os.path.getsize(os.path.join(self.master_dir,
+                                                    file_name))
+            except OSError:
+                return
+        with self._lock:
+            if size is None:
+                entry = self._entries.get(file_name)
+                if entry is None:
+                    return
+                size = entry[0]
+            self._set(file_name, size, time.time())
+
+    def _remove(self, file_name):
+        entry = self._entries.pop(file_name, None)
+        if entry is not None:
+            self.total_size -= entry[0]
+
+    def remove(self, file_name):
+        """Forget about a master image."""
+        with self._lock:
+            self._remove(file_name)
+
+    @contextlib.contextmanager
+    def reference(self, file_name):
+        """Hold a reference to a master image, so that it is not evicted.
+
+        Waits for an eviction of this image in progress to finish, the
+        image may not exist anymore afterwards.
+
+        :param file_name: name of the master image
+        """
+        with self._lock:
+            while file_name in self._evicting:
+                self._evicted.wait()
+            self._refs[file_name] = self._refs.get(file_name, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._refs[file_name] -= 1
+                if not self._refs[file_name]:
+                    del self._refs[file_name]
+
+    def begin_eviction(self, file_name):
+        """Mark a master image as being evicted.
+
+        :param file_name: name of the master image
+        :returns: False if someone holds a reference to the image
+        """
+        with self._lock:
+            if self._refs.get(file_name):
+                return False
+            self._evicting.add(file_name)
+            return True
+
+    def end_eviction(self, file_name, removed):
+        """Finish the eviction of a master image.
+
+        :param file_name: name of the master image
+        :param removed: whether the image no longer exists
+        """
+        with self._lock:
+            self._evicting.discard(file_name)
+            if removed:
+                self._remove(file_name)
+            self._evicted.notify_all()
+
+    def pop_oldest(self):
+        """Take the least recently used image out of the heap.
+
+        The image stays in the index, the caller has to either remove it
+        or give it back with push_back().
+
+        :returns: tuple (file name, size, last used time) or None if there
+                  are no more images
+        """
+        with self._lock:
+            while self._heap:
+                last_used, file_name = heapq.heappop(self._heap)
+                entry = self._entries.get(file_name)
+                if entry is not None and entry[1] == last_used:
+                    return file_name, entry[0], last_used
+
+    def push_back(self, items):
+        """Give back images taken with pop_oldest() and not removed."""
+        with self._lock:
+            for file_name, size, last_used in items:
+                heapq.heappush(self._heap, (last_used, file_name))
+
+
+class _SharedImages(object):
+    """Master images shared between caches with different directories.
+
+    An image downloaded by one cache is hard linked into the master
+    directory of another cache needing it, instead of being downloaded
+    again. Copies are looked up by image file name and raw format flag,
+    since a converted image differs from the original one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._master_dirs = set()
+        self._copies = {}
+
+    def add_master_dir(self, master_dir):
+        """Register the master directory of a cache."""
+        with self._lock:
+            self._master_dirs.add(master_dir)
+
+    def record(self, file_name, force_raw, master_dir):
+        """Record that a master directory holds a copy of an image.
+
+        :param file_name: name of the master image
+        :param force_raw: whether the image was converted to raw format
+        :param master_dir: master directory with the copy
+        """
+        with self._lock:
+            self._copies.setdefault((file_name, force_raw),
+                                    set()).add(master_dir)
+
+    def link(self, file_name, force_raw, master_dir):
+        """Link a copy of an image from another cache.
+
+        Copies on another file system or gone in the meantime are skipped.
+        The checksum file of the copy is linked along with it.
+
+        :param file_name: name of the master image
+        :param force_raw: whether the image has to be in raw format
+        :param master_dir: master directory to link the image into
+        :returns: True if the image was linked, False otherwise
+        """
+        with self._lock:
+            copies = self._copies.get((file_name, force_raw), set())
+            copies = [d for d in copies if d != master_dir]
+        for copy_dir in copies:
+            try:
+                os.link(os.path.join(copy_dir, file_name),
+                        os.path.join(master_dir, file_name))
+            except OSError as exc:
+                if exc.errno == errno.ENOENT:
+                    with self._lock:
+                        self._copies[(file_name, force_raw)].discard(
+                            copy_dir)
+                continue
+            try:
+                os.link(os.path.join(copy_dir, file_name + _CHECKSUM_SUFFIX),
+                        os.path.join(master_dir,
+                                     file_name + _CHECKSUM_SUFFIX))
+            except OSError:
+                # NOTE: without its checksum file, the image is downloaded
+                # again the next time it is fetched with a checksum
+                pass
+            self.record(file_name, force_raw, master_dir)
+            return True
+        return False
+
+    def count_copies(self, file_name, st):
+        """Count the master images that are links to the same file.
+
+        :param file_name: name of the master image
+        :param st: stat result of the master image
+        :returns: number of master directories holding this file
+        """
+        with self._lock:
+            master_dirs = list(self._master_dirs)
+        count = 0
+        for master_dir in master_dirs:
+            try:
+                other = os.stat(os.path.join(master_dir, file_name))
+            except OSError:
+                continue
+            if (other.st_ino, other.st_dev) == (st.st_ino, st.st_dev):
+                count += 1
+        return max(count, 1)
+
+
+_shared_images = _SharedImages()
+
+
+def _get_master_index(master_dir):
+    """Get the index of a master directory, building it on first use."""
+    with _master_indexes_lock:
+        index = _master_indexes.get(master_dir)
+        if index is None:
+            index = _MasterImageIndex(master_dir)
+            _master_indexes[master_dir] = index
+    return index
+
 
 class ImageCache(object):
     """Class handling access to cache for master images."""
@@ -71,8 +335,10 @@ class ImageCache(object):
         self._image_service = image_service
         if master_dir is not None:
             fileutils.ensure_tree(master_dir)
+            _shared_images.add_master_dir(master_dir)
 
-    def fetch_image(self, href, dest_path, ctx=None, force_raw=True):
+    def fetch_image(self, href, dest_path, ctx=None, force_raw=True,
+                    checksum=None):
         """Fetch image by given href to the destination path.
 
         Does nothing if destination path exists.
@@ -84,6 +350,10 @@ class ImageCache(object):
         :param ctx: context
         :param force_raw: boolean value, whether to convert the image to raw
                           format
+        :param checksum: checksum from the image metadata, if present the
+                         downloaded data is checked against it and a master
+                         image downloaded with another checksum, or without
+                         one, is not used
         """
         img_download_lock_name = 'download-image'
         if self.master_dir is None:
@@ -91,9 +361,10 @@ class ImageCache(object):
             if not CONF.parallel_image_downloads:
                 with lockutils.lock(img_download_lock_name, 'ironic-'):
                     _fetch(ctx, href, dest_path, self._image_service,
-                           force_raw)
+                           force_raw, checksum)
             else:
-                _fetch(ctx, href, dest_path, self._image_service, force_raw)
+                _fetch(ctx, href, dest_path, self._image_service, force_raw,
+                       checksum)
             return
 
         # TODO(ghe): have hard links and counts the same behaviour in all fs
@@ -106,6 +377,14 @@ class ImageCache(object):
 
         # TODO(dtantsur): lock expiration time
         with lockutils.lock(img_download_lock_name, 'ironic-'):
+            index = _get_master_index(self.master_dir)
+            if (checksum is not None and os.path.exists(master_path) and
+                    _read_checksum(master_path) != checksum):
+                LOG.info(_LI("Master image for %(uuid)s was not downloaded "
+                             "with checksum %(checksum)s, downloading it "
+                             "again"), {'uuid': href, 'checksum': checksum})
+                self._remove_master_image(index, master_file_name)
+
             if os.path.exists(dest_path):
                 # NOTE(vdrok): After rebuild requested image can change, so we
                 # should ensure that dest_path and master_path (if exists) are
@@ -122,7 +401,7 @@ class ImageCache(object):
 
             try:
                 # NOTE(dtantsur): ensure we're not in the middle of clean up
-                with lockutils.lock('master_image', 'ironic-'):
+                with index.reference(master_file_name):
                     os.link(master_path, dest_path)
             except OSError:
                 LOG.info(_LI("Master cache miss for image %(uuid)s, "
@@ -131,16 +410,33 @@ class ImageCache(object):
             else:
                 LOG.debug("Master cache hit for image %(uuid)s",
                           {'uuid': href})
+                index.record_use(master_file_name)
                 return
 
+            # NOTE: download locks are named after the image, so a cache
+            # with another directory waits here for the download in
+            # progress and links the result
+            if _shared_images.link(master_file_name, force_raw,
+                                   self.master_dir):
+                if (checksum is None or
+                        _read_checksum(master_path) == checksum):
+                    with index.reference(master_file_name):
+                        os.link(master_path, dest_path)
+                    LOG.debug("Image %(uuid)s linked from another master "
+                              "image cache", {'uuid': href})
+                    index.record_use(master_file_name)
+                    return
+                self._remove_master_image(index, master_file_name)
+
             self._download_image(
-                href, master_path, dest_path, ctx=ctx, force_raw=force_raw)
+                href, master_path, dest_path, ctx=ctx, force_raw=force_raw,
+                checksum=checksum)
 
         # NOTE(dtantsur): we increased cache size - time to clean up
         self.clean_up()
 
     def _download_image(self, href, master_path, dest_path, ctx=None,
-                        force_raw=True):
+                        force_raw=True, checksum=None):
         """Download image by href and store at a given path.
 
         This method should be called with uuid-specific lock taken.
@@ -151,6 +447,9 @@ class ImageCache(object):
         :param ctx: context
         :param force_raw: boolean value, whether to convert the image to raw
                           format
+        :param checksum: checksum from the image metadata to check the
+                         downloaded data against, recorded next to the
+                         master image when they match
         """
         # TODO(ghe): timeout and retry for downloads
         # TODO(ghe): logging when image cannot be created
@@ -158,21 +457,53 @@ class ImageCache(object):
         tmp_path = os.path.join(tmp_dir, href.split('/')[-1])
 
         try:
-            _fetch(ctx, href, tmp_path, self._image_service, force_raw)
+            # NOTE: data not matching the image checksum raises here, so
+            # it never becomes a master image
+            verified = _fetch(ctx, href, tmp_path, self._image_service,
+                              force_raw, checksum)
             # NOTE(dtantsur): no need for global lock here - master_path
             # will have link count >1 at any moment, so won't be cleaned up
             os.link(tmp_path, master_path)
             os.link(master_path, dest_path)
+            if verified:
+                with open(tmp_path + _CHECKSUM_SUFFIX, 'w') as f:
+                    f.write(checksum)
+                os.rename(tmp_path + _CHECKSUM_SUFFIX,
+                          master_path + _CHECKSUM_SUFFIX)
+            master_file_name = os.path.basename(master_path)
+            _get_master_index(self.master_dir).record_use(
+                master_file_name, size=os.path.getsize(master_path))
+            _shared_images.record(master_file_name, force_raw,
+                                  self.master_dir)
         finally:
             utils.rmtree_without_raise(tmp_dir)
 
-    @lockutils.synchronized('master_image', 'ironic-')
+    def _remove_master_image(self, index, file_name):
+        """Remove a master image and its checksum file.
+
+        This method should be called with uuid-specific lock taken. Files
+        linked to the image are left alone.
+
+        :param index: index of the master images
+        :param file_name: name of the master image
+        """
+        path = os.path.join(self.master_dir, file_name)
+        for name in (path, path + _CHECKSUM_SUFFIX):
+            try:
+                os.unlink(name)
+            except OSError as exc:
+                if exc.errno != errno.ENOENT:
+                    raise
+        index.remove(file_name)
+
     def clean_up(self, amount=None):
         """Clean up directory with images, keeping cache of the latest images.
 
-        Files with link count >1 are never deleted.
-        Protected by global lock, so that no one messes with master images
-        after we get listing and before we actually delete files.
+        Images older than TTL are deleted, then the least recently used
+        ones until the cache fits in its size. Files with link count >1
+        are never deleted. Candidates are taken from the in-memory index of
+        master images, an image is only deleted while nobody holds a
+        reference to link it.
 
         :param amount: if present, amount of space to reclaim in bytes,
                        cleaning will stop, if this goal was reached,
@@ -184,112 +515,80 @@ class ImageCache(object):
         LOG.debug("Starting clean up for master image cache %(dir)s" %
                   {'dir': self.master_dir})
 
+        index = _get_master_index(self.master_dir)
+        threshold = time.time() - self._cache_ttl
         amount_copy = amount
-        listing = _find_candidates_for_deletion(self.master_dir)
-        survived, amount = self._clean_up_too_old(listing, amount)
-        if amount is not None and amount <= 0:
-            return
-        amount = self._clean_up_ensure_cache_size(survived, amount)
+        kept = []
+        try:
+            while True:
+                if amount is not None and amount <= 0:
+                    break
+                entry = index.pop_oldest()
+                if entry is None:
+                    break
+                file_name, size, last_used = entry
+                if (amount is None and last_used >= threshold and
+                        index.total_size <= self._cache_size):
+                    kept.append(entry)
+                    break
+                freed = self._delete_master_image(index, file_name, size)
+                if freed is None:
+                    kept.append(entry)
+                elif amount is not None:
+                    amount -= freed
+        finally:
+            index.push_back(kept)
+
+        if index.total_size > self._cache_size:
+            LOG.info(_LI("After cleaning up cache dir %(dir)s "
+                         "cache size %(actual)d is still larger than "
+                         "threshold %(expected)d"),
+                     {'dir': self.master_dir, 'actual': index.total_size,
+                      'expected': self._cache_size})
         if amount is not None and amount > 0:
             LOG.warn(_LW("Cache clean up was unable to reclaim %(required)d "
                        "MiB of disk space, still %(left)d MiB required"),
                      {'required': amount_copy / 1024 / 1024,
                       'left': amount / 1024 / 1024})
 
-    def _clean_up_too_old(self, listing, amount):
-        """Clean up stage 1: drop images that are older than TTL.
-
-        This method removes files all files older than TTL seconds
-        unless 'amount' is non-None. If 'amount' is non-None,
-        it starts removing files older than TTL seconds,
-        oldest first, until the required 'amount' of space is reclaimed.
-
-        :param listing: list of tuples (file name, last used time)
-        :param amount: if not None, amount of space to reclaim in bytes,
-                       cleaning will stop, if this goal was reached,
-                       even if it is possible to clean up more files
-        :returns: tuple (list of files left after clean up,
-                         amount still to reclaim)
-        """
-        threshold = time.time() - self._cache_ttl
-        survived = []
-        for file_name, last_used, stat in listing:
-            if last_used < threshold:
-                try:
-                    os.unlink(file_name)
-                except EnvironmentError as exc:
-                    LOG.warn(_LW("Unable to delete file %(name)s from "
-                                 "master image cache: %(exc)s"),
-                             {'name': file_name, 'exc': exc})
-                else:
-                    if amount is not None:
-                        amount -= stat.st_size
-                        if amount <= 0:
-                            amount = 0
-                            break
-            else:
-                survived.append((file_name, last_used, stat))
-        return survived, amount
-
-    def _clean_up_ensure_cache_size(self, listing, amount):
-        """Clean up stage 2: try to ensure cache size < threshold.
+    def _delete_master_image(self, index, file_name, size):
+        """Delete a master image unless it is linked to.
 
-        Try to delete the oldest files until conditions is satisfied
-        or no more files are eligable for delition.
+        Links from copies of the image in other caches do not count, but
+        the space is only reclaimed when the last copy is deleted.
 
-        :param listing: list of tuples (file name, last used time)
-        :param amount: amount of space to reclaim, if possible.
-                       if amount is not None, it has higher priority than
-                       cache size in settings
-        :returns: amount of space still required after clean up
+        :param index: index of the master images
+        :param file_name: name of the master image
+        :param size: size of the image in bytes
+        :returns: amount of space reclaimed in bytes, None if the image
+                  has to stay
         """
-        # NOTE(dtantsur): Sort listing to delete the oldest files first
-        listing = sorted(listing,
-                         key=lambda entry: entry[1],
-                         reverse=True)
-        total_listing = (os.path.join(self.master_dir, f)
-                         for f in os.listdir(self.master_dir))
-        total_size = sum(os.path.getsize(f)
-                         for f in total_listing)
-        while listing and (total_size > self._cache_size or
-               (amount is not None and amount > 0)):
-            file_name, last_used, stat = listing.pop()
-            try:
-                os.unlink(file_name)
-            except EnvironmentError as exc:
+        if not index.begin_eviction(file_name):
+            return None
+        path = os.path.join(self.master_dir, file_name)
+        deleted = gone = False
+        try:
+            # NOTE: link counts change outside of the cache, when the
+            # destination files are removed, so check the file itself
+            st = os.stat(path)
+            if st.st_nlink <= _shared_images.count_copies(file_name, st):
+                os.unlink(path)
+                deleted = True
+                utils.unlink_without_raise(path + _CHECKSUM_SUFFIX)
+        except EnvironmentError as exc:
+            # NOTE: already gone, nothing was reclaimed by us
+            gone = exc.errno == errno.ENOENT
+            if not gone:
                 LOG.warn(_LW("Unable to delete file %(name)s from "
                              "master image cache: %(exc)s"),
-                         {'name': file_name, 'exc': exc})
-            else:
-                total_size -= stat.st_size
-                if amount is not None:
-                    amount -= stat.st_size
-
-        if total_size > self._cache_size:
-            LOG.info(_LI("After cleaning up cache dir %(dir)s "
-                         "cache size %(actual)d is still larger than "
-                         "threshold %(expected)d"),
-                     {'dir': self.master_dir, 'actual': total_size,
-                      'expected': self._cache_size})
-        return max(amount, 0)
-
-
-def _find_candidates_for_deletion(master_dir):
-    """Find files eligible for deletion i.e. with link count ==1.
-
-    :param master_dir: directory to operate on
-    :returns: iterator yielding tuples (file name, last used time, stat)
-    """
-    for filename in os.listdir(master_dir):
-        filename = os.path.join(master_dir, filename)
-        stat = os.stat(filename)
-        if not os.path.isfile(filename) or stat.st_nlink > 1:
-            continue
-        # NOTE(dtantsur): Detect most recently accessed files,
-        # seeing atime can be disabled by the mount option
-        # Also include ctime as it changes when image is linked to
-        last_used_time = max(stat.st_mtime, stat.st_atime, stat.st_ctime)
-        yield filename, last_used_time, stat
+                         {'name': path, 'exc': exc})
+        finally:
+            index.end_eviction(file_name, deleted or gone)
+        if gone:
+            return 0
+        if deleted:
+            return size if st.st_nlink == 1 else 0
+        return None
 
 
 def _free_disk_space_for(path):
@@ -298,20 +597,52 @@ def _free_disk_space_for(path):
     return stat.f_frsize * stat.f_bavail
 
 
-def _fetch(context, image_href, path, image_service=None, force_raw=False):
-    """Fetch image and convert to raw format if needed."""
+def _fetch(context, image_href, path, image_service=None, force_raw=False,
+           checksum=None):
+    """Fetch image and convert to raw format if needed.
+
+    :returns: True if the downloaded data matched the checksum
+    """
     path_tmp = "%s.part" % path
-    images.fetch(context, image_href, path_tmp, image_service,
-                 force_raw=False)
+    detected = []
+
+    def _format_detected(fmt, virtual_size):
+        detected.append((fmt, virtual_size))
+
+    verified = images.fetch(
+        context, image_href, path_tmp, image_service, force_raw=False,
+        format_callback=_format_detected if force_raw else None,
+        checksum=checksum)
     # Notes(yjiang5): If glance can provide the virtual size information,
     # then we can firstly clean cach and then invoke images.fetch().
     if force_raw:
-        required_space = images.converted_size(path_tmp)
-        directory = os.path.dirname(path_tmp)
-        _clean_up_caches(directory, required_space)
+        # NOTE: the format is detected from the start of the download,
+        # raw images are only renamed, so no space is needed for them
+        fmt, required_space = detected[0] if detected else (None, None)
+        if fmt == 'raw':
+            required_space = 0
+        elif required_space is None:
+            required_space = images.converted_size(path_tmp)
+        if required_space:
+            directory = os.path.dirname(path_tmp)
+            _clean_up_caches(directory, required_space)
         images.image_to_raw(image_href, path, path_tmp)
     else:
         os.rename(path_tmp, path)
+    return verified
+
+
+def _read_checksum(master_path):
+    """Get the checksum the data of a master image matched.
+
+    :returns: the checksum, None if the data was not checked
+    """
+    try:
+        with open(master_path + _CHECKSUM_SUFFIX) as f:
+            return f.read()
+    except IOError as exc:
+        if exc.errno != errno.ENOENT:
+            raise
 
 
 def _clean_up_caches(directory, amount):
@@ -345,7 +676,7 @@ def _clean_up_caches(directory, amount):
                                               )
 
 
-def clean_up_caches(ctx, directory, images_info):
+def clean_up_caches(ctx, directory, images_info, image_metas=None):
     """Explicitly cleanup caches based on their priority (if required).
 
     This cleans up the caches to free up the amount of space required for the
@@ -357,11 +688,15 @@ def clean_up_caches(ctx, directory, images_info):
     :param directory: the directory (of the cache) to be freed up.
     :param images_info: a list of tuples of the form (image_uuid,path)
         for which space is to be created in cache.
+    :param image_metas: a dict mapping image UUIDs to their metadata, the
+        sizes of the other images are asked to the image service.
     :raises: InsufficientDiskSpace exception, if we cannot free up enough space
     after trying all the caches.
     """
-    total_size = sum(images.download_size(ctx, uuid)
-            for (uuid, path) in images_info)
+    image_metas = image_metas or {}
+    total_size = sum(image_metas[uuid]['size'] if uuid in image_metas
+                     else images.download_size(ctx, uuid)
+                     for (uuid, path) in images_info)
     _clean_up_caches(directory, total_size)
 
 
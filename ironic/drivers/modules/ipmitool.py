@@ -29,16 +29,25 @@ WHICH PROVIDES DIFFERENT COMMAND-LINE OPTIONS AND *IS NOT SUPPORTED* BY THIS
 DRIVER.
 """
 
+import collections
 import contextlib
+import errno
+import fcntl
 import os
 import re
+import select
 import stat
+import subprocess
 import tempfile
 import time
 
+from eventlet import event
+from eventlet import greenthread
+from eventlet import semaphore
 from oslo.config import cfg
 from oslo.utils import excutils
 from oslo_concurrency import processutils
+import six
 
 from ironic.common import boot_devices
 from ironic.common import exception
@@ -53,8 +62,22 @@ from ironic.drivers.modules import console_utils
 from ironic.openstack.common import log as logging
 from ironic.openstack.common import loopingcall
 
+opts = [
+    cfg.BoolOpt('use_shell_sessions',
+                default=False,
+                help='Send read-only ipmitool commands, like power '
+                     'status, through a long-lived "ipmitool shell" process '
+                     'per BMC, instead of starting a new ipmitool process, '
+                     'and a new IPMI session, for every command.'),
+    cfg.IntOpt('shell_session_idle_timeout',
+               default=300,
+               help='Time, in seconds, after which an unused ipmitool '
+                    'shell session is closed. Only used when '
+                    'use_shell_sessions is enabled.'),
+    ]
 
 CONF = cfg.CONF
+CONF.register_opts(opts, group='ipmi')
 CONF.import_opt('retry_timeout',
                 'ironic.drivers.modules.ipminative',
                 group='ipmi')
@@ -100,7 +123,21 @@ BRIDGING_OPTIONS = [('local_address', '-m'),
                     ('transit_channel', '-B'), ('transit_address', '-T'),
                     ('target_channel', '-b'), ('target_address', '-t')]
 
-LAST_CMD_TIME = {}
+SHELL_PROMPT = 'ipmitool> '
+
+# Commands which may be sent to a shell session. They only read the
+# state of the node: the shell does not report the exit status of its
+# commands, so commands changing the state always run in a new ipmitool
+# process, whose exit status tells reliably whether they failed.
+SHELL_SESSION_COMMANDS = ('power status', 'chassis bootparam get', 'sdr')
+
+# What ipmitool writes on stderr when a command fails, as opposed to
+# warnings like "Get HPM.x Capabilities request failed, compcode = d4".
+SHELL_ERROR_RE = re.compile(r'^(Error|Unable to|Invalid|Insufficient)'
+                            r'|^.* failed: ', re.MULTILINE)
+
+# Maximum number of BMC addresses remembered to space out commands.
+MAX_TRACKED_BMCS = 1024
 TIMING_SUPPORT = None
 SINGLE_BRIDGE_SUPPORT = None
 DUAL_BRIDGE_SUPPORT = None
@@ -294,17 +331,246 @@ def _parse_driver_info(node):
             }
 
 
-def _exec_ipmitool(driver_info, command):
-    """Execute the ipmitool command.
+class _ShellSessionError(Exception):
+    """Raised when an ipmitool shell process is no longer usable."""
+
+
+class _IPMIShellSession(object):
+    """A long-lived 'ipmitool shell' process bound to a single BMC.
+
+    The IPMI session with the BMC is established once, by the first
+    command, and then reused by every following command until the
+    process exits.
+    """
+
+    def __init__(self, args, password):
+        self._args = args
+        self._password = password
+        self._proc = None
+        self.lock = semaphore.Semaphore()
+        self.last_used = time.time()
+
+    def is_alive(self):
+        return self._proc is not None and self._proc.poll() is None
+
+    def _command_timeout(self):
+        # ipmitool gives up on its own after about retry_timeout seconds
+        # (see the -R and -N options), so a shell which stays silent for
+        # much longer than that is considered hung.
+        return 2 * CONF.ipmi.retry_timeout
+
+    def start(self):
+        """Start the ipmitool shell and wait for its first prompt.
+
+        :raises: PasswordFileFailedToCreate from creating or writing to the
+                 temporary file.
+        :raises: _ShellSessionError if the shell could not be started.
+        """
+        error = None
+        with _make_password_file(self._password) as pw_file:
+            # ipmitool reads the password file before it shows its first
+            # prompt, so the file is not needed once the prompt is seen.
+            try:
+                self._proc = subprocess.Popen(
+                    self._args + ['-f', pw_file, 'shell'],
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    close_fds=True)
+                for pipe in (self._proc.stdout, self._proc.stderr):
+                    flags = fcntl.fcntl(pipe, fcntl.F_GETFL)
+                    fcntl.fcntl(pipe, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+                self._read_response()
+            except (OSError, _ShellSessionError) as e:
+                error = e
+        if error is not None:
+            self.close()
+            raise _ShellSessionError(error)
+
+    def _read_available(self, fd):
+        data = ''
+        while True:
+            try:
+                chunk = os.read(fd, 4096)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            if not chunk:
+                break
+            data += chunk
+        return data
+
+    def _read_response(self):
+        """Read the output of the shell up to its next prompt.
+
+        :returns: (stdout, stderr) written before the prompt.
+        :raises: _ShellSessionError if the shell exits or does not show
+                 its prompt in time.
+        """
+        fd = self._proc.stdout.fileno()
+        deadline = time.time() + self._command_timeout()
+        out = ''
+        while not out.endswith(SHELL_PROMPT):
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise _ShellSessionError(_("timed out waiting for the "
+                                           "ipmitool shell prompt"))
+            if not select.select([fd], [], [], remaining)[0]:
+                continue
+            try:
+                chunk = os.read(fd, 4096)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    continue
+                raise _ShellSessionError(e)
+            if not chunk:
+                raise _ShellSessionError(_("ipmitool shell exited "
+                                           "unexpectedly"))
+            out += chunk
+        # ipmitool writes errors before printing the next prompt, so by
+        # now anything it had to say on stderr is already in the pipe.
+        err = self._read_available(self._proc.stderr.fileno())
+        return out[:-len(SHELL_PROMPT)], err
+
+    def execute(self, command):
+        """Run a command in the shell.
+
+        :param command: the ipmitool command to be executed.
+        :returns: (stdout, stderr) from executing the command.
+        :raises: processutils.ProcessExecutionError if the command printed
+                 an error, or nothing but warnings.
+        :raises: _ShellSessionError if the shell is no longer usable.
+        """
+        try:
+            self._proc.stdin.write(command + '\n')
+            self._proc.stdin.flush()
+        except IOError as e:
+            raise _ShellSessionError(e)
+        out, err = self._read_response()
+        self.last_used = time.time()
+        # Depending on how ipmitool was built, the shell may echo the
+        # command back before its output.
+        if out.startswith(command + '\n'):
+            out = out[len(command) + 1:]
+        if SHELL_ERROR_RE.search(err) or (err and not out):
+            raise processutils.ProcessExecutionError(
+                stdout=out, stderr=err, cmd='ipmitool shell: %s' % command)
+        return out, err
+
+    def close(self):
+        """Ask the shell to exit, killing it if it does not.
+
+        The process is stopped by a background greenthread, so that the
+        caller does not wait for ipmitool to close the IPMI session.
+        """
+        if self._proc is None:
+            return
+        proc, self._proc = self._proc, None
+        greenthread.spawn_n(self._stop, proc)
+
+    @staticmethod
+    def _stop(proc):
+        try:
+            proc.stdin.write('exit\n')
+            proc.stdin.flush()
+        except IOError:
+            pass
+        # Give ipmitool a chance to close the IPMI session with the BMC.
+        for i in range(10):
+            if proc.poll() is not None:
+                break
+            time.sleep(0.1)
+        else:
+            try:
+                proc.kill()
+            except OSError:
+                pass
+        proc.wait()
 
-    This uses the lanplus interface to communicate with the BMC device driver.
+
+class _IPMIShellSessionPool(object):
+    """Long-lived ipmitool shells, one per BMC address and credentials."""
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = semaphore.Semaphore()
+
+    def _get_session(self, key, args, password):
+        now = time.time()
+        with self._lock:
+            idle = []
+            for k, session in list(self._sessions.items()):
+                if (now - session.last_used >
+                        CONF.ipmi.shell_session_idle_timeout and
+                        not session.lock.locked()):
+                    idle.append(self._sessions.pop(k))
+
+            session = self._sessions.get(key)
+            if session is None:
+                session = _IPMIShellSession(args, password)
+                self._sessions[key] = session
+            # Prevents the session from being evicted before its lock
+            # is acquired by the caller.
+            session.last_used = now
+
+        for session_to_close in idle:
+            session_to_close.close()
+        return session
+
+    def execute(self, args, password, command):
+        """Run a command in the shell for the given BMC.
+
+        Commands for the same BMC are serialized. A shell which has
+        exited, or which stops responding, is restarted and the command
+        is retried once.
+
+        :param args: the ipmitool arguments identifying the BMC.
+        :param password: the password to access the BMC.
+        :param command: the ipmitool command to be executed.
+        :returns: (stdout, stderr) from executing the command.
+        :raises: PasswordFileFailedToCreate from creating or writing to the
+                 temporary file.
+        :raises: processutils.ProcessExecutionError from executing the
+                 command.
+        """
+        session = self._get_session((tuple(args), password), args, password)
+        with session.lock:
+            for attempt in range(2):
+                try:
+                    if not session.is_alive():
+                        session.start()
+                    return session.execute(command)
+                except _ShellSessionError as e:
+                    session.close()
+                    if attempt:
+                        raise processutils.ProcessExecutionError(
+                            description=six.text_type(e),
+                            cmd='ipmitool shell: %s' % command)
+                    LOG.warning(_LW("Restarting the ipmitool shell for "
+                                    "%(args)s after error: %(error)s"),
+                                {'args': ' '.join(args), 'error': e})
+
+    def close_all(self):
+        """Close all the shells."""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+
+
+# NOTE: the shells are not closed explicitly when the conductor stops;
+#       they see EOF on stdin and exit together with it.
+_SHELL_SESSIONS = _IPMIShellSessionPool()
+
+
+def _get_ipmitool_args(driver_info):
+    """Build the ipmitool arguments to access a BMC.
 
     :param driver_info: the ipmitool parameters for accessing a node.
-    :param command: the ipmitool command to be executed.
-    :returns: (stdout, stderr) from executing the command.
-    :raises: PasswordFileFailedToCreate from creating or writing to the
-             temporary file.
-    :raises: processutils.ProcessExecutionError from executing the command.
+    :returns: a list of arguments, without the password file and the
+              command to be executed.
 
     """
     args = ['ipmitool',
@@ -333,22 +599,139 @@ def _exec_ipmitool(driver_info, command):
         args.append('-N')
         args.append(str(CONF.ipmi.min_command_interval))
 
+    return args
+
+
+class _BMCCommandQueue(object):
+    """Book-keeping of the commands sent to a single BMC."""
+
+    def __init__(self):
+        self.busy = False
+        self.users = 0
+        self.waiters = collections.deque()
+        self.last_cmd_time = 0
+
+
+class _BMCCommandScheduler(object):
+    """Spaces out the commands sent to each BMC.
+
+    Commands for the same BMC run one at a time, in the order they were
+    submitted, and each one starts at least CONF.ipmi.min_command_interval
+    seconds after the previous one finished. Commands for different BMCs
+    do not wait for each other.
+
+    Only the most recently used addresses are remembered. An address is
+    forgotten only when nobody is using it and min_command_interval has
+    elapsed since its last command, so forgetting it does not allow the
+    next command to be sent too early.
+    """
+
+    def __init__(self, max_addresses=MAX_TRACKED_BMCS):
+        self._max_addresses = max_addresses
+        self._queues = collections.OrderedDict()
+        self._lock = semaphore.Semaphore()
+
+    def _evict_idle(self, now):
+        for address, queue in list(self._queues.items()):
+            if len(self._queues) <= self._max_addresses:
+                break
+            if (not queue.users and now - queue.last_cmd_time >=
+                    CONF.ipmi.min_command_interval):
+                del self._queues[address]
+
+    def _acquire(self, address):
+        with self._lock:
+            queue = self._queues.pop(address, None)
+            if queue is None:
+                queue = _BMCCommandQueue()
+            self._queues[address] = queue
+            queue.users += 1
+            self._evict_idle(time.time())
+            if not queue.busy:
+                queue.busy = True
+                return queue
+            waiter = event.Event()
+            queue.waiters.append(waiter)
+
+        try:
+            # The releasing greenthread hands the queue over directly, so
+            # no one else can sneak in between.
+            waiter.wait()
+        except BaseException:
+            with excutils.save_and_reraise_exception():
+                with self._lock:
+                    if waiter in queue.waiters:
+                        queue.waiters.remove(waiter)
+                        queue.users -= 1
+                        waiter = None
+                if waiter is not None:
+                    self._release(queue)
+        return queue
+
+    def _release(self, queue):
+        with self._lock:
+            queue.last_cmd_time = time.time()
+            queue.users -= 1
+            if queue.waiters:
+                queue.waiters.popleft().send()
+            else:
+                queue.busy = False
+
+    @contextlib.contextmanager
+    def command(self, address):
+        """Wait for the turn to send a command to a BMC.
+
+        :param address: the address of the BMC.
+        """
+        queue = self._acquire(address)
+        try:
+            time_till_next_poll = CONF.ipmi.min_command_interval - (
+                    time.time() - queue.last_cmd_time)
+            if time_till_next_poll > 0:
+                time.sleep(time_till_next_poll)
+            yield
+        finally:
+            self._release(queue)
+
+
+_COMMAND_SCHEDULER = _BMCCommandScheduler()
+
+
+def _exec_ipmitool(driver_info, command):
+    """Execute the ipmitool command.
+
+    This uses the lanplus interface to communicate with the BMC device driver.
+    When CONF.ipmi.use_shell_sessions is set, read-only commands are sent
+    to a long-lived 'ipmitool shell' process for the BMC instead.
+
+    :param driver_info: the ipmitool parameters for accessing a node.
+    :param command: the ipmitool command to be executed.
+    :returns: (stdout, stderr) from executing the command.
+    :raises: PasswordFileFailedToCreate from creating or writing to the
+             temporary file.
+    :raises: processutils.ProcessExecutionError from executing the command.
+
+    """
+    args = _get_ipmitool_args(driver_info)
+    address = driver_info['address']
     # 'ipmitool' command will prompt password if there is no '-f' option,
     # we set it to '\0' to write a password file to support empty password
-    with _make_password_file(driver_info['password'] or '\0') as pw_file:
+    password = driver_info['password'] or '\0'
+
+    if CONF.ipmi.use_shell_sessions and any(
+            command == c or command.startswith(c + ' ')
+            for c in SHELL_SESSION_COMMANDS):
+        with _COMMAND_SCHEDULER.command(address):
+            return _SHELL_SESSIONS.execute(args, password, command)
+
+    with _make_password_file(password) as pw_file:
         args.append('-f')
         args.append(pw_file)
         args.extend(command.split(" "))
         # NOTE(deva): ensure that no communications are sent to a BMC more
         #             often than once every min_command_interval seconds.
-        time_till_next_poll = CONF.ipmi.min_command_interval - (
-                time.time() - LAST_CMD_TIME.get(driver_info['address'], 0))
-        if time_till_next_poll > 0:
-            time.sleep(time_till_next_poll)
-        try:
+        with _COMMAND_SCHEDULER.command(address):
             out, err = utils.execute(*args)
-        finally:
-            LAST_CMD_TIME[driver_info['address']] = time.time()
         return out, err
 
 
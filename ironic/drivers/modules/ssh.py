@@ -26,6 +26,7 @@ Currently supported environments are:
     Parallels   (parallels)
 """
 
+import collections
 import os
 
 from oslo.config import cfg
@@ -262,8 +263,9 @@ def _ssh_execute(ssh_obj, cmd_to_exec):
 
     """
     try:
-        output_list = processutils.ssh_execute(ssh_obj,
-                                               cmd_to_exec)[0].split('\n')
+        with utils.ssh_channel(ssh_obj):
+            output_list = processutils.ssh_execute(
+                ssh_obj, cmd_to_exec)[0].split('\n')
     except Exception as e:
         LOG.error(_LE("Cannot execute SSH cmd %(cmd)s. Reason: %(err)s."),
                   {'cmd': cmd_to_exec, 'err': e})
@@ -331,6 +333,77 @@ def _parse_driver_info(node):
     return res
 
 
+def _get_power_status_from_list(node_name, running_list):
+    """Returns a node's power state from the list of running VMs.
+
+    :param node_name: the name the host uses to reference the node.
+    :param running_list: the output of the list_running command.
+    :returns: one of ironic.common.states POWER_OFF, POWER_ON.
+
+    """
+    # Command should return a list of running vms. If the current node is
+    # not listed then we can assume it is not powered on.
+    quoted_node_name = '"%s"' % node_name
+    for node in running_list:
+        if not node:
+            continue
+        # 'node' here is an formatted output from the virt cli's. The
+        # node name is always quoted but can contain other information.
+        # vbox returns '"NodeName" {b43c4982-110c-4c29-9325-d5f41b053513}'
+        # so we must use the 'in' comparison here and not '=='
+        if quoted_node_name in node:
+            return states.POWER_ON
+    return states.POWER_OFF
+
+
+def _get_power_statuses(ssh_obj, driver_info, macs_by_node):
+    """Returns the current power state of several nodes on the same host.
+
+    The host is asked for its list of running VMs only once, whatever
+    the number of nodes.
+
+    :param ssh_obj: paramiko.SSHClient, an active ssh connection.
+    :param driver_info: information for accessing the host.
+    :param macs_by_node: a dict mapping node UUIDs to their MAC addresses.
+    :returns: a dict mapping node UUIDs to one of ironic.common.states
+              POWER_OFF, POWER_ON, or to a NodeNotFound exception.
+    :raises: SSHCommandFailed on an error from ssh.
+
+    """
+    # NOTE: the cached names are not checked against the MAC addresses of
+    #       each VM, which would cost a command per node. A name which is
+    #       no longer listed by the host is dropped from the index though,
+    #       and power actions always check the name before using it.
+    index = _get_vm_index(driver_info)
+    _refresh_vm_index(ssh_obj, driver_info, index)
+
+    cmd_to_exec = "%s %s" % (driver_info['cmd_set']['base_cmd'],
+                             driver_info['cmd_set']['list_running'])
+    running_list = _ssh_execute(ssh_obj, cmd_to_exec)
+
+    macs_by_node = dict(
+        (node_uuid, [_normalize_mac(mac) for mac in macs if mac])
+        for node_uuid, macs in macs_by_node.items())
+    if any(index.lookup(macs) is None for macs in macs_by_node.values()):
+        # The VM of a node may have been redefined with new MAC addresses
+        # under a name the index already knows.
+        _refresh_vm_index(ssh_obj, driver_info, index, full=True)
+
+    results = {}
+    for node_uuid, macs in macs_by_node.items():
+        node_name = index.lookup(macs)
+        if node_name is None:
+            LOG.error(_LE('Node "%(host)s" with MAC address %(mac)s not '
+                          'found.'), {'host': driver_info['host'],
+                                      'mac': macs})
+            results[node_uuid] = exception.NodeNotFound(
+                node=driver_info['host'])
+        else:
+            results[node_uuid] = _get_power_status_from_list(node_name,
+                                                             running_list)
+    return results
+
+
 def _get_power_status(ssh_obj, driver_info):
     """Returns a node's current power state.
 
@@ -349,22 +422,7 @@ def _get_power_status(ssh_obj, driver_info):
                                  driver_info['cmd_set']['list_running'])
         cmd_to_exec = cmd_to_exec.replace('{_NodeName_}', node_name)
         running_list = _ssh_execute(ssh_obj, cmd_to_exec)
-
-        # Command should return a list of running vms. If the current node is
-        # not listed then we can assume it is not powered on.
-        quoted_node_name = '"%s"' % node_name
-        for node in running_list:
-            if not node:
-                continue
-            # 'node' here is an formatted output from the virt cli's. The
-            # node name is always quoted but can contain other information.
-            # vbox returns '"NodeName" {b43c4982-110c-4c29-9325-d5f41b053513}'
-            # so we must use the 'in' comparison here and not '=='
-            if quoted_node_name in node:
-                power_state = states.POWER_ON
-                break
-        if not power_state:
-            power_state = states.POWER_OFF
+        power_state = _get_power_status_from_list(node_name, running_list)
     else:
         err_msg = _LE('Node "%(host)s" with MAC address %(mac)s not found.')
         LOG.error(err_msg, {'host': driver_info['host'],
@@ -378,52 +436,141 @@ def _get_power_status(ssh_obj, driver_info):
 def _get_connection(node):
     """Returns an SSH client connected to a node.
 
+    The connection comes from a pool shared by all the nodes on the same
+    host, and must not be closed by the caller.
+
     :param node: the Node.
     :returns: paramiko.SSHClient, an active ssh connection.
 
     """
-    return utils.ssh_connect(_parse_driver_info(node))
+    return utils.ssh_connect_pooled(_parse_driver_info(node))
 
 
-def _get_hosts_name_for_node(ssh_obj, driver_info):
-    """Get the name the host uses to reference the node.
+class _HostVMIndex(object):
+    """MAC addresses of the VMs known to be defined on a hypervisor."""
+
+    def __init__(self):
+        self.names_by_mac = {}
+        self.macs_by_name = {}
+
+    def add(self, name, macs):
+        self.remove(name)
+        self.macs_by_name[name] = macs
+        for mac in macs:
+            self.names_by_mac[mac] = name
+
+    def remove(self, name):
+        for mac in self.macs_by_name.pop(name, ()):
+            if self.names_by_mac.get(mac) == name:
+                del self.names_by_mac[mac]
+
+    def lookup(self, macs):
+        for mac in macs:
+            name = self.names_by_mac.get(mac)
+            if name is not None:
+                return name
+
+
+# NOTE: shared by all the nodes of a hypervisor, so that finding the VM of
+#       a node does not require querying the MACs of every VM on the
+#       hypervisor each time.
+_VM_INDEXES = {}
+
+
+def _get_vm_index(driver_info):
+    key = (driver_info['host'], driver_info['port'], driver_info['username'],
+           driver_info['cmd_set']['base_cmd'])
+    return _VM_INDEXES.setdefault(key, _HostVMIndex())
+
+
+def _get_vm_macs(ssh_obj, driver_info, vm_name):
+    """Get the normalized MAC addresses of a VM.
 
     :param ssh_obj: paramiko.SSHClient, an active ssh connection.
     :param driver_info: information for accessing the node.
-    :returns: the name or None if not found.
+    :param vm_name: the name the host uses to reference the VM.
+    :returns: a set of MAC addresses.
+    :raises: SSHCommandFailed on an error from ssh.
+
+    """
+    LOG.debug("Checking Node: %s's Mac address." % vm_name)
+    cmd_to_exec = "%s %s" % (driver_info['cmd_set']['base_cmd'],
+                             driver_info['cmd_set']['get_node_macs'])
+    cmd_to_exec = cmd_to_exec.replace('{_NodeName_}', vm_name)
+    hosts_node_mac_list = _ssh_execute(ssh_obj, cmd_to_exec)
+    return set(_normalize_mac(mac) for mac in hosts_node_mac_list if mac)
+
+
+def _refresh_vm_index(ssh_obj, driver_info, index, full=False):
+    """Bring the VM index of a host up to date.
+
+    The VMs which no longer exist are removed from the index. Unless full
+    is set, only the MAC addresses of the VMs which are not in the index
+    yet are queried.
+
+    :param ssh_obj: paramiko.SSHClient, an active ssh connection.
+    :param driver_info: information for accessing the node.
+    :param index: the _HostVMIndex of the host.
+    :param full: whether to query the MAC addresses of every VM, eg. to
+                 find a VM which was redefined under a known name.
+    :raises: SSHCommandFailed on an error from ssh.
 
     """
-    matched_name = None
     cmd_to_exec = "%s %s" % (driver_info['cmd_set']['base_cmd'],
                              driver_info['cmd_set']['list_all'])
     full_node_list = _ssh_execute(ssh_obj, cmd_to_exec)
     LOG.debug("Retrieved Node List: %s" % repr(full_node_list))
-    # for each node check Mac Addresses
-    for node in full_node_list:
-        if not node:
-            continue
-        LOG.debug("Checking Node: %s's Mac address." % node)
-        cmd_to_exec = "%s %s" % (driver_info['cmd_set']['base_cmd'],
-                                 driver_info['cmd_set']['get_node_macs'])
-        cmd_to_exec = cmd_to_exec.replace('{_NodeName_}', node)
-        hosts_node_mac_list = _ssh_execute(ssh_obj, cmd_to_exec)
+    vm_names = [name for name in full_node_list if name]
+    for name in set(index.macs_by_name) - set(vm_names):
+        index.remove(name)
+    for name in vm_names:
+        if full or name not in index.macs_by_name:
+            index.add(name, _get_vm_macs(ssh_obj, driver_info, name))
 
-        for host_mac in hosts_node_mac_list:
-            if not host_mac:
-                continue
-            for node_mac in driver_info['macs']:
-                if not node_mac:
-                    continue
-                if _normalize_mac(host_mac) in _normalize_mac(node_mac):
-                    LOG.debug("Found Mac address: %s" % node_mac)
-                    matched_name = node
-                    break
-
-            if matched_name:
-                break
-        if matched_name:
-            break
 
+def _get_hosts_name_for_node(ssh_obj, driver_info):
+    """Get the name the host uses to reference the node.
+
+    The VM names are looked up in an index of the MAC addresses of the
+    VMs on the host. A cached name is checked against the VM's current
+    MAC addresses before being used. When the node is not found, the
+    index is refreshed, first only querying the VMs it does not know yet,
+    then querying all of them.
+
+    :param ssh_obj: paramiko.SSHClient, an active ssh connection.
+    :param driver_info: information for accessing the node.
+    :returns: the name or None if not found.
+    :raises: SSHCommandFailed on an error from ssh.
+
+    """
+    index = _get_vm_index(driver_info)
+    node_macs = [_normalize_mac(mac) for mac in driver_info.get('macs', [])
+                 if mac]
+
+    matched_name = index.lookup(node_macs)
+    if matched_name is not None:
+        try:
+            current_macs = _get_vm_macs(ssh_obj, driver_info, matched_name)
+        except exception.SSHCommandFailed:
+            current_macs = set()
+        if current_macs.intersection(node_macs):
+            return matched_name
+        LOG.debug("VM %(name)s no longer has the MAC addresses of node "
+                  "%(node)s, refreshing the VM index of %(host)s.",
+                  {'name': matched_name, 'node': driver_info['uuid'],
+                   'host': driver_info['host']})
+        index.remove(matched_name)
+
+    _refresh_vm_index(ssh_obj, driver_info, index)
+    matched_name = index.lookup(node_macs)
+    if matched_name is None:
+        # The VM may have been redefined with new MAC addresses under a
+        # name the index already knows.
+        _refresh_vm_index(ssh_obj, driver_info, index, full=True)
+        matched_name = index.lookup(node_macs)
+    if matched_name is not None:
+        LOG.debug("Found Mac address for node %(node)s on VM %(name)s",
+                  {'node': driver_info['uuid'], 'name': matched_name})
     return matched_name
 
 
@@ -532,6 +679,47 @@ class SSHPower(base.PowerInterface):
         ssh_obj = _get_connection(task.node)
         return _get_power_status(ssh_obj, driver_info)
 
+    def get_power_states(self, tasks):
+        """Get the current power state of several nodes at once.
+
+        The nodes are grouped by the host and credentials used to access
+        them, and each host is polled for its running VMs only once.
+
+        :param tasks: a list of TaskManager instances.
+        :returns: a dict mapping the UUID of each node to its power state,
+                  or to the exception raised while getting it.
+        """
+        results = {}
+        groups = collections.defaultdict(list)
+        for task in tasks:
+            try:
+                driver_info = _parse_driver_info(task.node)
+            except exception.IronicException as e:
+                results[task.node.uuid] = e
+                continue
+            key = (driver_info['host'], driver_info['port'],
+                   driver_info['username'], driver_info['virt_type'])
+            groups[key].append((task, driver_info))
+
+        for group in groups.values():
+            task, driver_info = group[0]
+            if '{_NodeName_}' in driver_info['cmd_set']['list_running']:
+                # The host can only be polled one VM at a time.
+                results.update(super(SSHPower, self).get_power_states(
+                        [entry[0] for entry in group]))
+                continue
+
+            macs_by_node = dict(
+                (task.node.uuid, driver_utils.get_node_mac_addresses(task))
+                for task, _info in group)
+            try:
+                ssh_obj = _get_connection(task.node)
+                results.update(_get_power_statuses(ssh_obj, driver_info,
+                                                   macs_by_node))
+            except Exception as e:
+                results.update((node_uuid, e) for node_uuid in macs_by_node)
+        return results
+
     @task_manager.require_exclusive_lock
     def set_power_state(self, task, pstate):
         """Turn the power on or off.
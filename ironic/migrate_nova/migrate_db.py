@@ -18,8 +18,10 @@ import sys
 import sqlalchemy as sa
 from sqlalchemy.orm import sessionmaker
 
+from ironic.common import hash_ring
 from ironic.common import states as ironic_states
 from ironic.common import utils
+from ironic.db.sqlalchemy import api as db_api
 from ironic.db.sqlalchemy import models as ironic_models
 from ironic.migrate_nova import nova_baremetal_states as nova_states
 from ironic.migrate_nova import nova_models
@@ -96,6 +98,7 @@ def convert_nova_nodes(nodes, cpu_arch, nova_conf):
         # Populate basic properties
         i_node.id = n_node.id
         i_node.uuid = n_node.uuid
+        i_node.hash_partition = hash_ring.get_hash_partition(n_node.uuid)
         i_node.chassis_id = None
         i_node.last_error = None
         i_node.instance_uuid = n_node.instance_uuid
@@ -201,12 +204,16 @@ def convert_nova_ports(ports):
 
 
 def save_ironic_objects(objects):
-    Session = sessionmaker(bind=IRONIC_ENGINE)
+    if not objects:
+        return
+
+    Session = sessionmaker(bind=IRONIC_ENGINE, autocommit=True)
     session = Session()
 
     try:
-        session.add_all(objects)
-        session.commit()
+        with session.begin():
+            db_api.bulk_insert(session, type(objects[0]),
+                               [obj.as_dict() for obj in objects])
     except sa.exc.OperationalError as err:
         print("Could not send data to Ironic:\n%s" % err, file=sys.stderr)
         sys.exit(2)
@@ -26,7 +26,9 @@ class Chassis(base.IronicObject):
     #              only work with a uuid
     # Version 1.2: Add create() and destroy()
     # Version 1.3: Add list()
-    VERSION = '1.3'
+    # Version 1.4: Add fields to list()
+    # Version 1.5: Add use_slave to list()
+    VERSION = '1.5'
 
     dbapi = dbapi.get_instance()
 
@@ -38,14 +40,15 @@ class Chassis(base.IronicObject):
     }
 
     @staticmethod
-    def _from_db_object(chassis, db_chassis):
+    def _from_db_object(chassis, db_chassis, fields=None):
         """Converts a database entity to a formal :class:`Chassis` object.
 
         :param chassis: An object of :class:`Chassis`.
         :param db_chassis: A DB model of a chassis.
+        :param fields: the fields to set, defaults to all fields.
         :return: a :class:`Chassis` object.
         """
-        for field in chassis.fields:
+        for field in fields or chassis.fields:
             chassis[field] = db_chassis[field]
 
         chassis.obj_reset_changes()
@@ -90,22 +93,29 @@ class Chassis(base.IronicObject):
 
     @base.remotable_classmethod
     def list(cls, context, limit=None, marker=None,
-             sort_key=None, sort_dir=None):
+             sort_key=None, sort_dir=None, fields=None, use_slave=False):
         """Return a list of Chassis objects.
 
         :param context: Security context.
         :param limit: maximum number of resources to return in a single result.
-        :param marker: pagination marker for large data sets.
+        :param marker: pagination marker for large data sets, the last
+                       chassis of the previous page or its uuid.
         :param sort_key: column to sort results by.
         :param sort_dir: direction to sort. "asc" or "desc".
+        :param fields: the fields to load, defaults to all fields. The
+                       other fields of the chassis are left unset.
+        :param use_slave: whether to read from the slave database, if one
+                          is configured.
         :returns: a list of :class:`Chassis` object.
 
         """
         db_chassis = cls.dbapi.get_chassis_list(limit=limit,
                                                 marker=marker,
                                                 sort_key=sort_key,
-                                                sort_dir=sort_dir)
-        return [Chassis._from_db_object(cls(context), obj)
+                                                sort_dir=sort_dir,
+                                                columns=fields,
+                                                use_slave=use_slave)
+        return [Chassis._from_db_object(cls(context), obj, fields)
                 for obj in db_chassis]
 
     @base.remotable
@@ -17,6 +17,7 @@ from ironic.common import exception
 from ironic.common import utils
 from ironic.db import api as db_api
 from ironic.objects import base
+from ironic.objects import port as port_obj
 from ironic.objects import utils as obj_utils
 
 
@@ -31,7 +32,15 @@ class Node(base.IronicObject):
     # Version 1.6: Add reserve() and release()
     # Version 1.7: Add conductor_affinity
     # Version 1.8: Add maintenance_reason
-    VERSION = '1.8'
+    # Version 1.9: Add reserve_batch() and release_batch()
+    # Version 1.10: Add fields to list()
+    # Version 1.11: Add reserve_with_ports()
+    # Version 1.12: save() updates changed scalar fields with a single UPDATE
+    # Version 1.13: Add use_slave to get_by_uuid(), get_by_instance_uuid()
+    #               and list()
+    # Version 1.14: Add create_batch()
+    # Version 1.15: Add version_id, save() raises NodeUpdateConflict
+    VERSION = '1.15'
 
     dbapi = db_api.get_instance()
 
@@ -74,12 +83,18 @@ class Node(base.IronicObject):
             'last_error': obj_utils.str_or_none,
 
             'extra': obj_utils.dict_or_none,
+
+            # Incremented by every update, see save()
+            'version_id': obj_utils.int_or_none,
             }
 
     @staticmethod
-    def _from_db_object(node, db_node):
-        """Converts a database entity to a formal object."""
-        for field in node.fields:
+    def _from_db_object(node, db_node, fields=None):
+        """Converts a database entity to a formal object.
+
+        :param fields: the fields to set, defaults to all fields.
+        """
+        for field in fields or node.fields:
             node[field] = db_node[field]
         node.obj_reset_changes()
         return node
@@ -110,45 +125,57 @@ class Node(base.IronicObject):
         return node
 
     @base.remotable_classmethod
-    def get_by_uuid(cls, context, uuid):
+    def get_by_uuid(cls, context, uuid, use_slave=False):
         """Find a node based on uuid and return a Node object.
 
         :param uuid: the uuid of a node.
+        :param use_slave: whether to read from the slave database, if one
+                          is configured.
         :returns: a :class:`Node` object.
         """
-        db_node = cls.dbapi.get_node_by_uuid(uuid)
+        db_node = cls.dbapi.get_node_by_uuid(uuid, use_slave=use_slave)
         node = Node._from_db_object(cls(context), db_node)
         return node
 
     @base.remotable_classmethod
-    def get_by_instance_uuid(cls, context, instance_uuid):
+    def get_by_instance_uuid(cls, context, instance_uuid, use_slave=False):
         """Find a node based on the instance uuid and return a Node object.
 
         :param uuid: the uuid of the instance.
+        :param use_slave: whether to read from the slave database, if one
+                          is configured.
         :returns: a :class:`Node` object.
         """
-        db_node = cls.dbapi.get_node_by_instance(instance_uuid)
+        db_node = cls.dbapi.get_node_by_instance(instance_uuid,
+                                                 use_slave=use_slave)
         node = Node._from_db_object(cls(context), db_node)
         return node
 
     @base.remotable_classmethod
     def list(cls, context, limit=None, marker=None, sort_key=None,
-             sort_dir=None, filters=None):
+             sort_dir=None, filters=None, fields=None, use_slave=False):
         """Return a list of Node objects.
 
         :param context: Security context.
         :param limit: maximum number of resources to return in a single result.
-        :param marker: pagination marker for large data sets.
+        :param marker: pagination marker for large data sets, the last node
+                       of the previous page or its uuid.
         :param sort_key: column to sort results by.
         :param sort_dir: direction to sort. "asc" or "desc".
         :param filters: Filters to apply.
+        :param fields: the fields to load, defaults to all fields. The
+                       other fields of the nodes are left unset.
+        :param use_slave: whether to read from the slave database, if one
+                          is configured.
         :returns: a list of :class:`Node` object.
 
         """
         db_nodes = cls.dbapi.get_node_list(filters=filters, limit=limit,
                                            marker=marker, sort_key=sort_key,
-                                           sort_dir=sort_dir)
-        return [Node._from_db_object(cls(context), obj) for obj in db_nodes]
+                                           sort_dir=sort_dir, columns=fields,
+                                           use_slave=use_slave)
+        return [Node._from_db_object(cls(context), obj, fields)
+                for obj in db_nodes]
 
     @base.remotable_classmethod
     def reserve(cls, context, tag, node_id):
@@ -168,6 +195,25 @@ class Node(base.IronicObject):
         node = Node._from_db_object(cls(context), db_node)
         return node
 
+    @base.remotable_classmethod
+    def reserve_with_ports(cls, context, tag, node_id):
+        """Get and reserve a node, together with its ports.
+
+        :param context: Security context.
+        :param tag: A string uniquely identifying the reservation holder.
+        :param node_id: A node id or uuid.
+        :raises: NodeNotFound if the node is not found.
+        :raises: NodeLocked if the node is already reserved.
+        :returns: a tuple of the :class:`Node` object and a list of its
+                  :class:`ironic.objects.port.Port` objects.
+
+        """
+        db_node, db_ports = cls.dbapi.reserve_node_with_ports(tag, node_id)
+        node = Node._from_db_object(cls(context), db_node)
+        ports = port_obj.Port._from_db_object_list(db_ports, port_obj.Port,
+                                                   context)
+        return node, ports
+
     @base.remotable_classmethod
     def release(cls, context, tag, node_id):
         """Release the reservation on a node.
@@ -180,6 +226,35 @@ class Node(base.IronicObject):
         """
         cls.dbapi.release_node(tag, node_id)
 
+    @base.remotable_classmethod
+    def reserve_batch(cls, context, tag, node_ids, filters=None):
+        """Get and reserve a set of nodes.
+
+        Nodes which are already reserved, or which do not match the
+        filters, are skipped rather than raising NodeLocked.
+
+        :param context: Security context.
+        :param tag: A string uniquely identifying the reservation holder.
+        :param node_ids: A list of node ids.
+        :param filters: Filters to apply. See
+                        :meth:`ironic.db.api.Connection.get_nodeinfo_list`.
+        :returns: a list of the reserved :class:`Node` objects.
+
+        """
+        db_nodes = cls.dbapi.reserve_nodes(tag, node_ids, filters=filters)
+        return [Node._from_db_object(cls(context), obj) for obj in db_nodes]
+
+    @base.remotable_classmethod
+    def release_batch(cls, context, tag, node_ids):
+        """Release the reservations held by tag on a set of nodes.
+
+        :param context: Security context.
+        :param tag: A string uniquely identifying the reservation holder.
+        :param node_ids: A list of node ids.
+
+        """
+        cls.dbapi.release_nodes(tag, node_ids)
+
     @base.remotable
     def create(self, context=None):
         """Create a Node record in the DB.
@@ -201,6 +276,36 @@ class Node(base.IronicObject):
         db_node = self.dbapi.create_node(values)
         self._from_db_object(self, db_node)
 
+    @classmethod
+    def create_batch(cls, context, nodes):
+        """Create a batch of Node records, with their ports, in the DB.
+
+        :param context: Security context.
+        :param nodes: a list of (:class:`Node`, list of
+                      :class:`ironic.objects.port.Port`) tuples of new
+                      objects. The objects which are created are updated
+                      from the DB.
+        :returns: a list with, for each node, None if the node and its
+                  ports were created, or the exception explaining why
+                  they were not.
+
+        """
+        values = [(node.obj_get_changes(),
+                   [port.obj_get_changes() for port in ports])
+                  for node, ports in nodes]
+        errors = []
+        for (node, ports), result in zip(nodes,
+                                         cls.dbapi.create_nodes(values)):
+            if isinstance(result, Exception):
+                errors.append(result)
+                continue
+            db_node, db_ports = result
+            cls._from_db_object(node, db_node)
+            for port, db_port in zip(ports, db_ports):
+                port_obj.Port._from_db_object(port, db_port)
+            errors.append(None)
+        return errors
+
     @base.remotable
     def destroy(self, context=None):
         """Delete the Node from the DB.
@@ -230,9 +335,21 @@ class Node(base.IronicObject):
                         argument, even though we don't use it.
                         A context should be set when instantiating the
                         object, e.g.: Node(context)
+        :raises: NodeUpdateConflict if only scalar fields changed, and the
+                 node was updated by someone else since it was loaded.
         """
         updates = self.obj_get_changes()
-        self.dbapi.update_node(self.uuid, updates)
+        updates.pop('version_id', None)
+        # Changes of scalar fields are written without reading the node
+        # back, and only if nobody else has updated it in the meantime.
+        if (updates and self.obj_attr_is_set('version_id') and
+                not any(self.fields[field] is obj_utils.dict_or_none
+                        for field in updates)):
+            self.version_id = self.dbapi.update_node_columns(
+                self.uuid, updates, self.version_id)
+        else:
+            db_node = self.dbapi.update_node(self.uuid, updates)
+            self.version_id = db_node['version_id']
         self.obj_reset_changes()
 
     @base.remotable
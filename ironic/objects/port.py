@@ -27,7 +27,10 @@ class Port(base.IronicObject):
     # Version 1.2: Add create() and destroy()
     # Version 1.3: Add list()
     # Version 1.4: Add list_by_node_id()
-    VERSION = '1.4'
+    # Version 1.5: Add list_by_node_ids()
+    # Version 1.6: Add fields to list() and list_by_node_id()
+    # Version 1.7: Add use_slave to list() and list_by_node_id()
+    VERSION = '1.7'
 
     dbapi = dbapi.get_instance()
 
@@ -40,18 +43,22 @@ class Port(base.IronicObject):
     }
 
     @staticmethod
-    def _from_db_object(port, db_port):
-        """Converts a database entity to a formal object."""
-        for field in port.fields:
+    def _from_db_object(port, db_port, fields=None):
+        """Converts a database entity to a formal object.
+
+        :param fields: the fields to set, defaults to all fields.
+        """
+        for field in fields or port.fields:
             port[field] = db_port[field]
 
         port.obj_reset_changes()
         return port
 
     @staticmethod
-    def _from_db_object_list(db_objects, cls, context):
+    def _from_db_object_list(db_objects, cls, context, fields=None):
         """Converts a list of database entities to a list of formal objects."""
-        return [Port._from_db_object(cls(context), obj) for obj in db_objects]
+        return [Port._from_db_object(cls(context), obj, fields)
+                for obj in db_objects]
 
     @base.remotable_classmethod
     def get(cls, context, port_id):
@@ -106,41 +113,68 @@ class Port(base.IronicObject):
 
     @base.remotable_classmethod
     def list(cls, context, limit=None, marker=None,
-             sort_key=None, sort_dir=None):
+             sort_key=None, sort_dir=None, fields=None, use_slave=False):
         """Return a list of Port objects.
 
         :param context: Security context.
         :param limit: maximum number of resources to return in a single result.
-        :param marker: pagination marker for large data sets.
+        :param marker: pagination marker for large data sets, the last port
+                       of the previous page or its uuid.
         :param sort_key: column to sort results by.
         :param sort_dir: direction to sort. "asc" or "desc".
+        :param fields: the fields to load, defaults to all fields. The
+                       other fields of the ports are left unset.
+        :param use_slave: whether to read from the slave database, if one
+                          is configured.
         :returns: a list of :class:`Port` object.
 
         """
         db_ports = cls.dbapi.get_port_list(limit=limit,
                                            marker=marker,
                                            sort_key=sort_key,
-                                           sort_dir=sort_dir)
-        return Port._from_db_object_list(db_ports, cls, context)
+                                           sort_dir=sort_dir,
+                                           columns=fields,
+                                           use_slave=use_slave)
+        return Port._from_db_object_list(db_ports, cls, context, fields)
 
     @base.remotable_classmethod
     def list_by_node_id(cls, context, node_id, limit=None, marker=None,
-                        sort_key=None, sort_dir=None):
+                        sort_key=None, sort_dir=None, fields=None,
+                        use_slave=False):
         """Return a list of Port objects associated with a given node ID.
 
         :param context: Security context.
         :param node_id: the ID of the node.
         :param limit: maximum number of resources to return in a single result.
-        :param marker: pagination marker for large data sets.
+        :param marker: pagination marker for large data sets, the last port
+                       of the previous page or its uuid.
         :param sort_key: column to sort results by.
         :param sort_dir: direction to sort. "asc" or "desc".
+        :param fields: the fields to load, defaults to all fields. The
+                       other fields of the ports are left unset.
+        :param use_slave: whether to read from the slave database, if one
+                          is configured.
         :returns: a list of :class:`Port` object.
 
         """
         db_ports = cls.dbapi.get_ports_by_node_id(node_id, limit=limit,
                                                   marker=marker,
                                                   sort_key=sort_key,
-                                                  sort_dir=sort_dir)
+                                                  sort_dir=sort_dir,
+                                                  columns=fields,
+                                                  use_slave=use_slave)
+        return Port._from_db_object_list(db_ports, cls, context, fields)
+
+    @base.remotable_classmethod
+    def list_by_node_ids(cls, context, node_ids):
+        """Return a list of Port objects associated with a set of nodes.
+
+        :param context: Security context.
+        :param node_ids: a list of node IDs.
+        :returns: a list of :class:`Port` object.
+
+        """
+        db_ports = cls.dbapi.get_ports_by_node_ids(node_ids)
         return Port._from_db_object_list(db_ports, cls, context)
 
     @base.remotable
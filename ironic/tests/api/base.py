@@ -27,6 +27,7 @@ import pecan
 import pecan.testing
 from six.moves.urllib import parse as urlparse
 
+from ironic.api.controllers.v1 import utils as api_utils
 from ironic.tests.db import base
 
 PATH_PREFIX = '/v1'
@@ -49,6 +50,7 @@ class FunctionalTest(base.DbTestCase):
         cfg.CONF.set_override("admin_user", "admin",
                               group='keystone_authtoken')
         self.app = self._make_app()
+        api_utils.DRIVER_CACHE.clear()
 
         def reset_pecan():
             pecan.set_config({}, overwrite=True)
@@ -60,6 +60,28 @@ class TestListChassis(api_base.FunctionalTest):
         self.assertIn('extra', data)
         self.assertIn('nodes', data)
 
+    def test_get_one_etag(self):
+        chassis = obj_utils.create_test_chassis(
+            self.context, created_at=datetime.datetime(2000, 1, 1, 0, 0))
+        etag = self.get_json('/chassis/%s' % chassis.uuid,
+                             expect_errors=True).headers['ETag']
+        response = self.get_json('/chassis/%s' % chassis.uuid,
+                                 expect_errors=True,
+                                 headers={'If-None-Match': etag})
+        self.assertEqual(304, response.status_int)
+
+    def test_get_all_etag(self):
+        obj_utils.create_test_chassis(
+            self.context, created_at=datetime.datetime(2000, 1, 1, 0, 0))
+        etag = self.get_json('/chassis', expect_errors=True).headers['ETag']
+        response = self.get_json('/chassis', expect_errors=True,
+                                 headers={'If-None-Match': etag})
+        self.assertEqual(304, response.status_int)
+        response = self.get_json('/chassis', expect_errors=True,
+                                 headers={'If-None-Match': 'W/"other"'})
+        self.assertEqual(200, response.status_int)
+        self.assertEqual(1, len(response.json['chassis']))
+
     def test_detail(self):
         chassis = obj_utils.create_test_chassis(self.context)
         data = self.get_json('/chassis/detail')
@@ -105,6 +127,17 @@ class TestListChassis(api_base.FunctionalTest):
         next_marker = data['chassis'][-1]['uuid']
         self.assertIn(next_marker, data['next'])
 
+    def test_collection_next_page(self):
+        uuids = []
+        for id_ in range(5):
+            chassis = obj_utils.create_test_chassis(
+                    self.context, id=id_, uuid=utils.generate_uuid())
+            uuids.append(chassis.uuid)
+        data = self.get_json('/chassis/?limit=3&marker=%s' % uuids[1])
+        self.assertEqual(uuids[2:], [c['uuid'] for c in data['chassis']])
+        self.assertEqual(['description', 'links', 'uuid'],
+                         sorted(data['chassis'][0].keys()))
+
     def test_collection_links_default_limit(self):
         cfg.CONF.set_override('max_limit', 3, 'api')
         for id_ in range(5):
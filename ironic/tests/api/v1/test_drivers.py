@@ -14,13 +14,16 @@
 #    under the License.
 
 import json
+import time
 
 import mock
+from oslo.config import cfg
 from testtools.matchers import HasLength
 
-from ironic.api.controllers.v1 import driver
+from ironic.api.controllers.v1 import utils as api_utils
 from ironic.common import exception
 from ironic.conductor import rpcapi
+from ironic.db import api as dbapi
 from ironic.tests.api import base
 
 
@@ -176,7 +179,6 @@ class TestDriverProperties(base.FunctionalTest):
 
     def test_driver_properties_fake(self, mock_topic, mock_properties):
         # Can get driver properties for fake driver.
-        driver._DRIVER_PROPERTIES = {}
         driver_name = 'fake'
         mock_topic.return_value = 'fake_topic'
         mock_properties.return_value = {'prop1': 'Property 1. Required.'}
@@ -185,16 +187,14 @@ class TestDriverProperties(base.FunctionalTest):
         mock_topic.assert_called_once_with(driver_name)
         mock_properties.assert_called_once_with(mock.ANY, driver_name,
                                                 topic=mock_topic.return_value)
-        self.assertEqual(mock_properties.return_value,
-                         driver._DRIVER_PROPERTIES[driver_name])
 
     def test_driver_properties_cached(self, mock_topic, mock_properties):
         # only one RPC-conductor call will be made and the info cached
         # for subsequent requests
-        driver._DRIVER_PROPERTIES = {}
         driver_name = 'fake'
         mock_topic.return_value = 'fake_topic'
         mock_properties.return_value = {'prop1': 'Property 1. Required.'}
+        calls_avoided = api_utils.DRIVER_CACHE.rpc_calls_avoided
         data = self.get_json('/drivers/%s/properties' % driver_name)
         data = self.get_json('/drivers/%s/properties' % driver_name)
         data = self.get_json('/drivers/%s/properties' % driver_name)
@@ -202,14 +202,63 @@ class TestDriverProperties(base.FunctionalTest):
         mock_topic.assert_called_once_with(driver_name)
         mock_properties.assert_called_once_with(mock.ANY, driver_name,
                                                 topic=mock_topic.return_value)
-        self.assertEqual(mock_properties.return_value,
-                         driver._DRIVER_PROPERTIES[driver_name])
+        self.assertEqual(2, api_utils.DRIVER_CACHE.rpc_calls_avoided -
+                         calls_avoided)
+
+    @mock.patch.object(time, 'time')
+    def test_driver_properties_cache_expires(self, mock_time, mock_topic,
+                                             mock_properties):
+        cfg.CONF.set_override('driver_cache_ttl', 60, 'api')
+        mock_time.return_value = 1000
+        self.get_json('/drivers/fake/properties')
+        mock_time.return_value = 1059
+        self.get_json('/drivers/fake/properties')
+        self.assertEqual(1, mock_properties.call_count)
+        mock_time.return_value = 1060
+        self.get_json('/drivers/fake/properties')
+        self.assertEqual(2, mock_properties.call_count)
+
+    @mock.patch.object(time, 'time')
+    def test_driver_properties_cache_dropped_on_conductor_change(
+            self, mock_time, mock_topic, mock_properties):
+        cfg.CONF.set_override('driver_cache_ttl', 60, 'api')
+        mock_properties.return_value = {'prop1': 'Property 1. Required.'}
+        mock_time.return_value = 1000
+        self.get_json('/drivers/fake/properties')
+        mock_time.return_value = 1030
+        self.get_json('/drivers/other/properties')
+        self.assertEqual(2, mock_properties.call_count)
+        self.dbapi.register_conductor({'hostname': 'fake-host',
+                                       'drivers': ['fake']})
+        # the conductors are only checked again once the TTL has elapsed
+        mock_time.return_value = 1059
+        self.get_json('/drivers/other/properties')
+        self.assertEqual(2, mock_properties.call_count)
+        mock_time.return_value = 1060
+        self.get_json('/drivers/other/properties')
+        self.assertEqual(3, mock_properties.call_count)
+
+    @mock.patch.object(dbapi.IMPL, 'get_active_driver_dict')
+    def test_driver_properties_cache_checks_conductors_once(
+            self, mock_driver_dict, mock_topic, mock_properties):
+        mock_driver_dict.return_value = {'fake': set(['fake-host'])}
+        for i in range(3):
+            self.get_json('/drivers/fake/properties')
+        self.assertEqual(1, mock_properties.call_count)
+        mock_driver_dict.assert_called_once_with()
+
+    def test_driver_properties_cache_disabled(self, mock_topic,
+                                              mock_properties):
+        cfg.CONF.set_override('driver_cache_ttl', 0, 'api')
+        mock_properties.return_value = {'prop1': 'Property 1. Required.'}
+        self.get_json('/drivers/fake/properties')
+        self.get_json('/drivers/fake/properties')
+        self.assertEqual(2, mock_properties.call_count)
 
     def test_driver_properties_invalid_driver_name(self, mock_topic,
                                                    mock_properties):
         # Cannot get driver properties for an invalid driver; no RPC topic
         # exists for it.
-        driver._DRIVER_PROPERTIES = {}
         driver_name = 'bad_driver'
         mock_topic.side_effect = exception.DriverNotFound(
                 driver_name=driver_name)
@@ -223,7 +272,6 @@ class TestDriverProperties(base.FunctionalTest):
     def test_driver_properties_cannot_load(self, mock_topic, mock_properties):
         # Cannot get driver properties for the driver. Although an RPC topic
         # exists for it, the conductor wasn't able to load it.
-        driver._DRIVER_PROPERTIES = {}
         driver_name = 'driver'
         mock_topic.return_value = 'driver_topic'
         mock_properties.side_effect = exception.DriverNotFound(
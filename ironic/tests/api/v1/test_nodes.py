@@ -26,6 +26,7 @@ from testtools.matchers import HasLength
 from wsme import types as wtypes
 
 from ironic.api.controllers.v1 import node as api_node
+from ironic.api.controllers.v1 import utils as api_utils
 from ironic.common import boot_devices
 from ironic.common import exception
 from ironic.common import states
@@ -186,6 +187,114 @@ class TestListNodes(api_base.FunctionalTest):
         next_marker = data['nodes'][-1]['uuid']
         self.assertIn(next_marker, data['next'])
 
+    def test_collection_next_page(self):
+        uuids = []
+        for id in range(5):
+            node = obj_utils.create_test_node(self.context,
+                                              uuid=utils.generate_uuid())
+            uuids.append(node.uuid)
+        with mock.patch.object(objects.Node, 'get_by_uuid') as mock_get:
+            data = self.get_json('/nodes/?limit=3&marker=%s' % uuids[1])
+            self.assertFalse(mock_get.called)
+        self.assertEqual(uuids[2:], [n['uuid'] for n in data['nodes']])
+
+    def test_collection_unknown_marker(self):
+        obj_utils.create_test_node(self.context)
+        response = self.get_json('/nodes/?marker=%s' % utils.generate_uuid(),
+                                 expect_errors=True)
+        self.assertEqual(404, response.status_int)
+
+    def test_get_all_loads_summary_fields(self):
+        obj_utils.create_test_node(self.context)
+        with mock.patch.object(objects.Node, 'list') as mock_list:
+            mock_list.return_value = []
+            self.get_json('/nodes')
+            self.assertEqual(api_node._SUMMARY_FIELDS + api_utils.ETAG_FIELDS,
+                             mock_list.call_args[1]['fields'])
+            self.get_json('/nodes/detail')
+            self.assertIsNone(mock_list.call_args[1]['fields'])
+
+    def test_get_all_reads_slave(self):
+        with mock.patch.object(objects.Node, 'list') as mock_list:
+            mock_list.return_value = []
+            self.get_json('/nodes')
+            self.assertTrue(mock_list.call_args[1]['use_slave'])
+
+    def test_get_one_reads_slave(self):
+        node = obj_utils.create_test_node(self.context)
+        with mock.patch.object(objects.Node, 'get_by_uuid') as mock_get:
+            mock_get.return_value = node
+            self.get_json('/nodes/%s' % node.uuid)
+            mock_get.assert_called_once_with(mock.ANY, node.uuid,
+                                             use_slave=True)
+
+    def _create_old_node(self, **kw):
+        return obj_utils.create_test_node(
+            self.context, uuid=utils.generate_uuid(),
+            created_at=datetime.datetime(2000, 1, 1, 0, 0), **kw)
+
+    def test_get_one_etag(self):
+        node = self._create_old_node()
+        response = self.get_json('/nodes/%s' % node.uuid, expect_errors=True)
+        self.assertEqual(200, response.status_int)
+        etag = response.headers['ETag']
+
+        response = self.get_json('/nodes/%s' % node.uuid, expect_errors=True,
+                                 headers={'If-None-Match': etag})
+        self.assertEqual(304, response.status_int)
+        self.assertEqual(etag, response.headers['ETag'])
+        self.assertEqual(b'', response.body)
+
+    def test_get_one_etag_changes_with_node(self):
+        node = self._create_old_node()
+        etag = self.get_json('/nodes/%s' % node.uuid,
+                             expect_errors=True).headers['ETag']
+        self.dbapi.update_node(node.id, {
+            'extra': {'foo': 'bar'},
+            'updated_at': datetime.datetime(2000, 1, 2, 0, 0)})
+
+        response = self.get_json('/nodes/%s' % node.uuid, expect_errors=True,
+                                 headers={'If-None-Match': etag})
+        self.assertEqual(200, response.status_int)
+        self.assertEqual({'foo': 'bar'}, response.json['extra'])
+        self.assertNotEqual(etag, response.headers['ETag'])
+
+    def test_get_one_no_etag_when_recently_updated(self):
+        node = obj_utils.create_test_node(self.context)
+        response = self.get_json('/nodes/%s' % node.uuid, expect_errors=True,
+                                 headers={'If-None-Match': '*'})
+        self.assertEqual(200, response.status_int)
+        self.assertNotIn('ETag', response.headers)
+
+    def test_get_all_etag(self):
+        for i in range(3):
+            self._create_old_node()
+        etag = self.get_json('/nodes/detail',
+                             expect_errors=True).headers['ETag']
+
+        with mock.patch.object(objects.Node, 'list',
+                               wraps=objects.Node.list) as mock_list:
+            response = self.get_json('/nodes/detail', expect_errors=True,
+                                     headers={'If-None-Match': etag})
+            self.assertEqual(304, response.status_int)
+            # Only the fields the tag is computed from are loaded.
+            self.assertEqual(1, mock_list.call_count)
+            self.assertEqual(api_utils.ETAG_FIELDS,
+                             mock_list.call_args[1]['fields'])
+
+    def test_get_all_etag_depends_on_request_and_nodes(self):
+        for i in range(3):
+            self._create_old_node()
+        etag = self.get_json('/nodes', expect_errors=True).headers['ETag']
+        self.assertNotEqual(etag, self.get_json(
+            '/nodes?limit=2', expect_errors=True).headers['ETag'])
+
+        self._create_old_node()
+        response = self.get_json('/nodes', expect_errors=True,
+                                 headers={'If-None-Match': etag})
+        self.assertEqual(200, response.status_int)
+        self.assertEqual(4, len(response.json['nodes']))
+
     def test_collection_links_default_limit(self):
         cfg.CONF.set_override('max_limit', 3, 'api')
         nodes = []
@@ -997,6 +1106,77 @@ class TestPost(api_base.FunctionalTest):
         # Assert RPC method wasn't called this time
         self.assertFalse(get_methods_mock.called)
 
+    def _post_bulk_node(self, ports=None, **kw):
+        kw.setdefault('uuid', utils.generate_uuid())
+        ndict = post_get_test_node(**kw)
+        del ndict['chassis_id']
+        if ports is not None:
+            ndict['ports'] = ports
+        return ndict
+
+    def test_create_bulk(self):
+        port = {'address': '52:54:00:cf:2d:31', 'extra': {'foo': 'bar'}}
+        ndicts = [self._post_bulk_node(ports=[port]),
+                  self._post_bulk_node()]
+        response = self.post_json('/nodes/bulk', ndicts)
+        self.assertEqual(200, response.status_int)
+        results = response.json['results']
+
+        self.assertEqual([n['uuid'] for n in ndicts],
+                         [r['uuid'] for r in results])
+        self.assertEqual(ndicts[0]['uuid'], results[0]['node']['uuid'])
+        self.assertEqual(self.chassis.uuid,
+                         results[0]['node']['chassis_uuid'])
+        self.assertNotIn('error', results[0])
+        self.assertEqual([], results[1]['ports'])
+        self.assertEqual(port['address'], results[0]['ports'][0]['address'])
+        ports = self.get_json('/nodes/%s/ports' % ndicts[0]['uuid'])['ports']
+        self.assertEqual([results[0]['ports'][0]['uuid']],
+                         [p['uuid'] for p in ports])
+        self.get_json('/nodes/%s' % ndicts[1]['uuid'])
+        # The driver is only looked up once.
+        self.assertEqual(1, self.mock_gtf.call_count)
+
+    def test_create_bulk_generates_uuids(self):
+        ndict = self._post_bulk_node(ports=[{'address': '52:54:00:cf:2d:31'}])
+        del ndict['uuid']
+        result = self.post_json('/nodes/bulk', [ndict]).json['results'][0]
+        self.assertTrue(utils.is_uuid_like(result['uuid']))
+        self.assertEqual(result['uuid'], result['node']['uuid'])
+        self.assertTrue(utils.is_uuid_like(result['ports'][0]['uuid']))
+
+    def test_create_bulk_errors(self):
+        existing = obj_utils.create_test_node(self.context,
+                                              uuid=utils.generate_uuid())
+        self.mock_gtf.side_effect = [exception.NoValidHost('Fake Error'),
+                                     'test-topic']
+        ndicts = [self._post_bulk_node(driver='bad-driver'),
+                  self._post_bulk_node(),
+                  self._post_bulk_node(uuid=existing.uuid),
+                  self._post_bulk_node(driver='bad-driver')]
+        response = self.post_json('/nodes/bulk', ndicts)
+        self.assertEqual(200, response.status_int)
+        results = response.json['results']
+
+        self.assertEqual([400, None, 409, 400],
+                         [r.get('code') for r in results])
+        self.assertTrue(results[0]['error'])
+        self.assertNotIn('node', results[0])
+        self.assertEqual(ndicts[1]['uuid'], results[1]['node']['uuid'])
+        self.assertIn(existing.uuid, results[2]['error'])
+
+    def test_create_bulk_invalid_port_address(self):
+        ndict = self._post_bulk_node(ports=[{'address': 'invalid'}])
+        response = self.post_json('/nodes/bulk', [ndict], expect_errors=True)
+        self.assertEqual(400, response.status_int)
+        self.assertEqual([], objects.Node.list(self.context))
+
+    def test_create_bulk_from_chassis(self):
+        response = self.post_json('/chassis/nodes/bulk',
+                                  [self._post_bulk_node()],
+                                  expect_errors=True)
+        self.assertEqual(403, response.status_int)
+
 
 class TestDelete(api_base.FunctionalTest):
 
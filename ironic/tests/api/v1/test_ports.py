@@ -82,6 +82,28 @@ class TestListPorts(api_base.FunctionalTest):
         # never expose the node_id
         self.assertNotIn('node_id', data)
 
+    def test_get_one_etag(self):
+        port = obj_utils.create_test_port(
+            self.context, node_id=self.node.id,
+            created_at=datetime.datetime(2000, 1, 1, 0, 0))
+        etag = self.get_json('/ports/%s' % port.uuid,
+                             expect_errors=True).headers['ETag']
+        response = self.get_json('/ports/%s' % port.uuid, expect_errors=True,
+                                 headers={'If-None-Match': etag})
+        self.assertEqual(304, response.status_int)
+
+    def test_get_all_by_node_etag(self):
+        obj_utils.create_test_port(
+            self.context, node_id=self.node.id,
+            created_at=datetime.datetime(2000, 1, 1, 0, 0))
+        path = '/nodes/%s/ports' % self.node.uuid
+        etag = self.get_json(path, expect_errors=True).headers['ETag']
+        response = self.get_json(path, expect_errors=True,
+                                 headers={'If-None-Match': etag})
+        self.assertEqual(304, response.status_int)
+        self.assertNotEqual(etag, self.get_json(
+            '/ports', expect_errors=True).headers['ETag'])
+
     def test_detail(self):
         port = obj_utils.create_test_port(self.context, node_id=self.node.id)
         data = self.get_json('/ports/detail')
@@ -138,6 +160,19 @@ class TestListPorts(api_base.FunctionalTest):
         next_marker = data['ports'][-1]['uuid']
         self.assertIn(next_marker, data['next'])
 
+    def test_collection_next_page(self):
+        uuids = []
+        for id_ in range(5):
+            port = obj_utils.create_test_port(self.context,
+                                            node_id=self.node.id,
+                                            uuid=utils.generate_uuid(),
+                                            address='52:54:00:cf:2d:3%s' % id_)
+            uuids.append(port.uuid)
+        data = self.get_json('/ports/?limit=3&marker=%s' % uuids[1])
+        self.assertEqual(uuids[2:], [p['uuid'] for p in data['ports']])
+        self.assertEqual(['address', 'links', 'uuid'],
+                         sorted(data['ports'][0].keys()))
+
     def test_collection_links_default_limit(self):
         cfg.CONF.set_override('max_limit', 3, 'api')
         ports = []
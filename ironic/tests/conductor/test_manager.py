@@ -1342,6 +1342,16 @@ class MiscTestCase(_ServiceSetUpMixin, tests_db_base.DbTestCase):
         self.assertFalse(self.service._mapped_to_this_conductor(n['uuid'],
                                                                 'otherdriver'))
 
+    def test__add_mapped_filter(self):
+        self._start_service()
+        node = obj_utils.create_test_node(self.context, driver='fake')
+        filters = self.service._add_mapped_filter({'maintenance': False})
+        self.assertEqual(['fake'], list(filters['hash_partitions']))
+        self.assertFalse(filters['maintenance'])
+        node_list = self.dbapi.get_nodeinfo_list(columns=['uuid'],
+                                                 filters=filters)
+        self.assertEqual([(node.uuid,)], node_list)
+
     def test_validate_driver_interfaces(self):
         node = obj_utils.create_test_node(self.context, driver='fake')
         ret = self.service.validate_driver_interfaces(self.context,
@@ -1913,6 +1923,26 @@ class ManagerDoSyncPowerStateTestCase(tests_db_base.DbTestCase):
         self.assertEqual(1,
                          self.service.power_state_sync_count[self.node.uuid])
 
+    def test_current_state_given(self, node_power_action):
+        self.node.power_state = states.POWER_ON
+        count = manager.do_sync_power_state(self.task, 0,
+                                            current_state=states.POWER_ON)
+
+        self.assertEqual(0, count)
+        self.assertFalse(self.power.get_power_state.called)
+        self.assertFalse(node_power_action.called)
+
+    def test_current_state_exception(self, node_power_action):
+        self.node.power_state = states.POWER_ON
+        count = manager.do_sync_power_state(
+                self.task, 0,
+                current_state=exception.NodeNotFound(node='fake'))
+
+        self.assertEqual(1, count)
+        self.assertFalse(self.power.get_power_state.called)
+        self.assertFalse(self.node.save.called)
+        self.assertFalse(node_power_action.called)
+
     def test_get_power_state_error(self, node_power_action):
         self._do_sync_power_state('fake', states.ERROR)
         self.assertFalse(self.power.validate.called)
@@ -2037,23 +2067,52 @@ class ManagerDoSyncPowerStateTestCase(tests_db_base.DbTestCase):
 
 
 @mock.patch.object(manager, 'do_sync_power_state')
-@mock.patch.object(task_manager, 'acquire')
+@mock.patch.object(task_manager, 'acquire_batch')
 @mock.patch.object(manager.ConductorManager, '_mapped_to_this_conductor')
-@mock.patch.object(objects.Node, 'get_by_id')
 @mock.patch.object(dbapi.IMPL, 'get_nodeinfo_list')
 class ManagerSyncPowerStatesTestCase(_CommonMixIn, tests_db_base.DbTestCase):
     def setUp(self):
         super(ManagerSyncPowerStatesTestCase, self).setUp()
         self.service = manager.ConductorManager('hostname', 'test-topic')
         self.service.dbapi = self.dbapi
+        self.service._power_sync_pool = eventlet.greenpool.GreenPool(
+                size=CONF.conductor.sync_power_state_workers)
         self.node = self._create_node()
-        self.filters = {'reserved': False, 'maintenance': False}
-        self.columns = ['id', 'uuid', 'driver']
+        self.hash_partitions = {'fake': [(0, 65535)]}
+        self.service.ring_manager = mock.Mock()
+        self.service.ring_manager.get_hash_partitions.return_value = (
+                self.hash_partitions)
+        self.filters = {'reserved': False, 'maintenance': False,
+                        'provision_state_not_in': [states.DEPLOYWAIT],
+                        'hash_partitions': self.hash_partitions}
+        self.lock_filters = {'maintenance': False,
+                             'provision_state_not_in': [states.DEPLOYWAIT]}
+        self.columns = ['id', 'uuid', 'driver', 'driver_info']
+
+    def _create_node(self, **kwargs):
+        kwargs.setdefault('driver', 'fake')
+        kwargs.setdefault('driver_info', {})
+        return super(ManagerSyncPowerStatesTestCase, self)._create_node(
+                **kwargs)
+
+    def _mock_acquire_batch(self, acquire_mock, tasks):
+        # nodes which are locked, or which no longer match the filters,
+        # are simply not yielded by acquire_batch()
+        tasks = dict((task.node.id, task) for task in tasks)
+        acquire_mock.side_effect = lambda context, node_ids, filters: iter(
+                [tasks[i] for i in node_ids if i in tasks])
+
+    def _create_batch_task(self, node):
+        task = mock.MagicMock()
+        task.node = node
+        task.__enter__.return_value = task
+        task.__exit__.return_value = False
+        task.driver.power.get_power_states.return_value = {}
+        return task
 
-    def test_node_not_mapped(self, get_nodeinfo_mock, get_node_mock,
-                             mapped_mock, acquire_mock, sync_mock):
+    def test_node_not_mapped(self, get_nodeinfo_mock, mapped_mock,
+                             acquire_mock, sync_mock):
         get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response()
-        get_node_mock.return_value = self.node
         mapped_mock.return_value = False
 
         self.service._sync_power_states(self.context)
@@ -2062,66 +2121,65 @@ class ManagerSyncPowerStatesTestCase(_CommonMixIn, tests_db_base.DbTestCase):
                 columns=self.columns, filters=self.filters)
         mapped_mock.assert_called_once_with(self.node.uuid,
                                             self.node.driver)
-        self.assertFalse(get_node_mock.called)
         self.assertFalse(acquire_mock.called)
         self.assertFalse(sync_mock.called)
 
-    def test_node_disappeared(self, get_nodeinfo_mock, get_node_mock,
-                              mapped_mock, acquire_mock, sync_mock):
+    def test_node_skipped_on_acquire(self, get_nodeinfo_mock, mapped_mock,
+                                     acquire_mock, sync_mock):
         get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response()
-        get_node_mock.return_value = self.node
         mapped_mock.return_value = True
-        get_node_mock.side_effect = exception.NodeNotFound(node=self.node.uuid)
+        self._mock_acquire_batch(acquire_mock, [])
 
         self.service._sync_power_states(self.context)
 
-        get_nodeinfo_mock.assert_called_once_with(
-                columns=self.columns, filters=self.filters)
-        mapped_mock.assert_called_once_with(self.node.uuid,
-                                            self.node.driver)
-        get_node_mock.assert_called_once_with(self.context, self.node.id)
-        self.assertFalse(acquire_mock.called)
+        acquire_mock.assert_called_once_with(self.context, [self.node.id],
+                                             filters=self.lock_filters)
         self.assertFalse(sync_mock.called)
 
-    def test_node_in_deploywait(self, get_nodeinfo_mock, get_node_mock,
-                                mapped_mock, acquire_mock, sync_mock):
+    def test_node_disappears_during_sync(self, get_nodeinfo_mock,
+                                         mapped_mock, acquire_mock,
+                                         sync_mock):
         get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response()
-        get_node_mock.return_value = self.node
-        self.node.provision_state = states.DEPLOYWAIT
-        self.node.target_provision_state = states.ACTIVE
-        self.node.save()
+        mapped_mock.return_value = True
+        task = self._create_batch_task(node=self.node)
+        self._mock_acquire_batch(acquire_mock, [task])
+        sync_mock.side_effect = exception.NodeNotFound(node=self.node.uuid)
 
         self.service._sync_power_states(self.context)
 
-        get_nodeinfo_mock.assert_called_once_with(
-                columns=self.columns, filters=self.filters)
-        mapped_mock.assert_called_once_with(self.node.uuid,
-                                            self.node.driver)
-        get_node_mock.assert_called_once_with(self.context, self.node.id)
-        self.assertFalse(acquire_mock.called)
-        self.assertFalse(sync_mock.called)
+        sync_mock.assert_called_once_with(task, mock.ANY,
+                                          current_state=None)
+        self.assertTrue(task.__exit__.called)
 
-    def test_node_in_maintenance(self, get_nodeinfo_mock, get_node_mock,
-                                 mapped_mock, acquire_mock, sync_mock):
-        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response()
-        get_node_mock.return_value = self.node
-        self.node.maintenance = True
+    def test_unexpected_error_during_sync(self, get_nodeinfo_mock,
+                                          mapped_mock, acquire_mock,
+                                          sync_mock):
+        nodes = [self._create_node(id=i, uuid=ironic_utils.generate_uuid())
+                 for i in range(1, 3)]
+        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response(
+                nodes)
+        mapped_mock.return_value = True
+        tasks = [self._create_batch_task(node=n) for n in nodes]
+        self._mock_acquire_batch(acquire_mock, tasks)
+        sync_mock.side_effect = [Exception('boom'), 0]
 
         self.service._sync_power_states(self.context)
 
-        get_nodeinfo_mock.assert_called_once_with(
-                columns=self.columns, filters=self.filters)
-        mapped_mock.assert_called_once_with(self.node.uuid,
-                                            self.node.driver)
-        get_node_mock.assert_called_once_with(self.context, self.node.id)
-        self.assertFalse(acquire_mock.called)
-        self.assertFalse(sync_mock.called)
+        # an error on one node doesn't prevent the others from syncing
+        self.assertEqual(
+                [mock.call(tasks[0], mock.ANY, current_state=None),
+                 mock.call(tasks[1], mock.ANY, current_state=None)],
+                sync_mock.call_args_list)
+        for task in tasks:
+            self.assertTrue(task.__exit__.called)
 
-    def test_node_has_reservation(self, get_nodeinfo_mock, get_node_mock,
-                                  mapped_mock, acquire_mock, sync_mock):
+    def test_single_node(self, get_nodeinfo_mock, mapped_mock,
+                         acquire_mock, sync_mock):
         get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response()
-        get_node_mock.return_value = self.node
-        self.node.reservation = 'fake'
+        mapped_mock.return_value = True
+        task = self._create_batch_task(node=self.node)
+        self._mock_acquire_batch(acquire_mock, [task])
+        sync_mock.return_value = 0
 
         self.service._sync_power_states(self.context)
 
@@ -2129,183 +2187,322 @@ class ManagerSyncPowerStatesTestCase(_CommonMixIn, tests_db_base.DbTestCase):
                 columns=self.columns, filters=self.filters)
         mapped_mock.assert_called_once_with(self.node.uuid,
                                             self.node.driver)
-        get_node_mock.assert_called_once_with(self.context, self.node.id)
-        self.assertFalse(acquire_mock.called)
-        self.assertFalse(sync_mock.called)
-
-    def test_node_locked_on_acquire(self, get_nodeinfo_mock, get_node_mock,
-                                    mapped_mock, acquire_mock, sync_mock):
+        acquire_mock.assert_called_once_with(self.context, [self.node.id],
+                                             filters=self.lock_filters)
+        sync_mock.assert_called_once_with(task, 0, current_state=None)
+        task.__enter__.assert_called_once_with()
+        self.assertTrue(task.__exit__.called)
+        self.assertNotIn(self.node.uuid, self.service.power_state_sync_count)
+
+    def test_single_node_sync_failure_counted(self, get_nodeinfo_mock,
+                                              mapped_mock, acquire_mock,
+                                              sync_mock):
         get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response()
-        get_node_mock.return_value = self.node
         mapped_mock.return_value = True
-        acquire_mock.side_effect = exception.NodeLocked(node=self.node.uuid,
-                                                        host='fake')
+        self._mock_acquire_batch(
+                acquire_mock, [self._create_batch_task(node=self.node)])
+        sync_mock.return_value = 2
+
+        self.service._sync_power_states(self.context)
+
+        self.assertEqual(2,
+                self.service.power_state_sync_count[self.node.uuid])
+
+    def test__sync_power_state_multiple_nodes(self, get_nodeinfo_mock,
+                                              mapped_mock, acquire_mock,
+                                              sync_mock):
+        # Create 4 nodes:
+        # 1st node: Should acquire and try to sync
+        # 2nd node: Not mapped to this conductor
+        # 3rd node: Skipped by acquire_batch(), eg. locked meanwhile
+        # 4th node: Should acquire and try to sync
+        nodes = []
+        mapped_map = {}
+        for i in range(1, 5):
+            n = self._create_node(id=i, uuid=ironic_utils.generate_uuid())
+            nodes.append(n)
+            mapped_map[n.uuid] = False if i == 2 else True
+
+        tasks = [self._create_batch_task(node=nodes[0]),
+                 self._create_batch_task(node=nodes[3])]
+
+        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response(
+                nodes)
+        mapped_mock.side_effect = lambda x, y: mapped_map[x]
+        self._mock_acquire_batch(acquire_mock, tasks)
+        sync_mock.return_value = 0
 
         self.service._sync_power_states(self.context)
 
         get_nodeinfo_mock.assert_called_once_with(
                 columns=self.columns, filters=self.filters)
-        mapped_mock.assert_called_once_with(self.node.uuid,
-                                            self.node.driver)
-        get_node_mock.assert_called_once_with(self.context, self.node.id)
-        acquire_mock.assert_called_once_with(self.context, self.node.id)
-        self.assertFalse(sync_mock.called)
+        mapped_calls = [mock.call(x.uuid, x.driver) for x in nodes]
+        self.assertEqual(mapped_calls, mapped_mock.call_args_list)
+        acquire_calls = [mock.call(self.context, [i],
+                                   filters=self.lock_filters)
+                         for i in (1, 3, 4)]
+        self.assertEqual(acquire_calls, acquire_mock.call_args_list)
+        sync_calls = [mock.call(tasks[0], mock.ANY, current_state=None),
+                      mock.call(tasks[1], mock.ANY, current_state=None)]
+        self.assertEqual(sync_calls, sync_mock.call_args_list)
 
-    def test_node_in_deploywait_on_acquire(self, get_nodeinfo_mock,
-                                           get_node_mock, mapped_mock,
-                                           acquire_mock, sync_mock):
-        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response()
-        get_node_mock.return_value = self.node
+    def _test_sync_concurrency(self, sync_mock, addresses):
+        running = {'now': 0, 'max': 0}
+
+        def _sync(task, count, current_state=None):
+            running['now'] += 1
+            running['max'] = max(running['max'], running['now'])
+            eventlet.sleep(0.01)
+            running['now'] -= 1
+            return 0
+
+        sync_mock.side_effect = _sync
+        nodes = [self._create_node(id=i, uuid=ironic_utils.generate_uuid(),
+                                   driver_info={'ipmi_address': addr})
+                 for i, addr in enumerate(addresses)]
+        return nodes, running
+
+    def test_syncs_in_parallel(self, get_nodeinfo_mock, mapped_mock,
+                               acquire_mock, sync_mock):
+        self.config(sync_power_state_workers=3, group='conductor')
+        self.service._power_sync_pool = eventlet.greenpool.GreenPool(3)
+        nodes, running = self._test_sync_concurrency(
+                sync_mock, ['1.2.3.%d' % i for i in range(6)])
+        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response(
+                nodes)
         mapped_mock.return_value = True
-        task = self._create_task(
-                node_attrs=dict(provision_state=states.DEPLOYWAIT,
-                                target_provision_state=states.ACTIVE,
-                                id=self.node.id))
-        acquire_mock.side_effect = self._get_acquire_side_effect(task)
+        self._mock_acquire_batch(
+                acquire_mock, [self._create_batch_task(node=n) for n in nodes])
 
         self.service._sync_power_states(self.context)
 
-        get_nodeinfo_mock.assert_called_once_with(
-                columns=self.columns, filters=self.filters)
-        mapped_mock.assert_called_once_with(self.node.uuid,
-                                            self.node.driver)
-        get_node_mock.assert_called_once_with(self.context, self.node.id)
-        acquire_mock.assert_called_once_with(self.context, self.node.id)
-        self.assertFalse(sync_mock.called)
+        self.assertEqual(6, sync_mock.call_count)
+        # bounded by the pool size
+        self.assertEqual(3, running['max'])
 
-    def test_node_in_maintenance_on_acquire(self, get_nodeinfo_mock,
-                                            get_node_mock, mapped_mock,
-                                            acquire_mock, sync_mock):
-        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response()
-        get_node_mock.return_value = self.node
+    def test_syncs_bounded_per_bmc(self, get_nodeinfo_mock, mapped_mock,
+                                   acquire_mock, sync_mock):
+        self.config(sync_power_state_workers_per_bmc=2, group='conductor')
+        nodes, running = self._test_sync_concurrency(
+                sync_mock, ['1.2.3.4'] * 5)
+        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response(
+                nodes)
         mapped_mock.return_value = True
-        task = self._create_task(
-                node_attrs=dict(maintenance=True, id=self.node.id))
-        acquire_mock.side_effect = self._get_acquire_side_effect(task)
+        self._mock_acquire_batch(
+                acquire_mock, [self._create_batch_task(node=n) for n in nodes])
 
         self.service._sync_power_states(self.context)
 
-        get_nodeinfo_mock.assert_called_once_with(
-                columns=self.columns, filters=self.filters)
-        mapped_mock.assert_called_once_with(self.node.uuid,
-                                            self.node.driver)
-        get_node_mock.assert_called_once_with(self.context, self.node.id)
-        acquire_mock.assert_called_once_with(self.context, self.node.id)
-        self.assertFalse(sync_mock.called)
+        self.assertEqual(5, sync_mock.call_count)
+        self.assertEqual(2, running['max'])
 
-    def test_node_disappears_on_acquire(self, get_nodeinfo_mock,
-                                        get_node_mock, mapped_mock,
-                                        acquire_mock, sync_mock):
-        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response()
-        get_node_mock.return_value = self.node
+    def test_acquire_error_releases_acquired_nodes(self, get_nodeinfo_mock,
+                                                   mapped_mock, acquire_mock,
+                                                   sync_mock):
+        nodes = [self._create_node(id=i, uuid=ironic_utils.generate_uuid(),
+                                   driver_info={'ipmi_address': 'bmc'})
+                 for i in range(3)]
+        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response(
+                nodes)
         mapped_mock.return_value = True
-        acquire_mock.side_effect = exception.NodeNotFound(node=self.node.uuid,
-                                                          host='fake')
+        tasks = [self._create_batch_task(node=n) for n in nodes[:2]]
+
+        def _acquire_batch(context, node_ids, filters):
+            for task in tasks:
+                yield task
+            raise exception.DriverNotFound(driver_name='fake')
+
+        acquire_mock.side_effect = _acquire_batch
 
         self.service._sync_power_states(self.context)
 
-        get_nodeinfo_mock.assert_called_once_with(
-                columns=self.columns, filters=self.filters)
-        mapped_mock.assert_called_once_with(self.node.uuid,
-                                            self.node.driver)
-        get_node_mock.assert_called_once_with(self.context, self.node.id)
-        acquire_mock.assert_called_once_with(self.context, self.node.id)
         self.assertFalse(sync_mock.called)
+        for task in tasks:
+            task.release_resources.assert_called_once_with()
+
+    def test_nodes_released_one_at_a_time(self, get_nodeinfo_mock,
+                                          mapped_mock, acquire_mock,
+                                          sync_mock):
+        nodes = [self._create_node(id=i, uuid=ironic_utils.generate_uuid(),
+                                   driver_info={'ipmi_address': 'bmc'})
+                 for i in range(3)]
+        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response(
+                nodes)
+        mapped_mock.return_value = True
+        tasks = [self._create_batch_task(node=n) for n in nodes]
+        self._mock_acquire_batch(acquire_mock, tasks)
+        released = []
+        for task in tasks:
+            task.__exit__.side_effect = (
+                lambda *args, **kwargs: released.append(True) and False)
 
-    def test_single_node(self, get_nodeinfo_mock, get_node_mock,
-                         mapped_mock, acquire_mock, sync_mock):
-        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response()
-        get_node_mock.return_value = self.node
+        released_before_sync = []
+
+        def _sync(task, count, current_state=None):
+            released_before_sync.append(len(released))
+            return 0
+
+        sync_mock.side_effect = _sync
+
+        self.service._sync_power_states(self.context)
+
+        # every node synced before another one was already released
+        self.assertEqual([0, 1, 2], released_before_sync)
+        self.assertEqual(3, len(released))
+        self.assertEqual(1, acquire_mock.call_count)
+
+    def test_slow_bmc_does_not_stall_others(self, get_nodeinfo_mock,
+                                            mapped_mock, acquire_mock,
+                                            sync_mock):
+        self.service._power_sync_pool = eventlet.greenpool.GreenPool(3)
+        nodes = [self._create_node(id=i, uuid=ironic_utils.generate_uuid(),
+                                   driver_info={'ipmi_address': 'slow'})
+                 for i in range(10)]
+        other = self._create_node(id=10, uuid=ironic_utils.generate_uuid(),
+                                  driver_info={'ipmi_address': 'other'})
+        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response(
+                nodes + [other])
         mapped_mock.return_value = True
-        task = self._create_task(node_attrs=dict(id=self.node.id))
-        acquire_mock.side_effect = self._get_acquire_side_effect(task)
+        self._mock_acquire_batch(
+                acquire_mock,
+                [self._create_batch_task(node=n) for n in nodes + [other]])
+        slow_bmc = eventlet.event.Event()
+
+        def _sync(task, count, current_state=None):
+            if task.node is not other:
+                slow_bmc.wait()
+            return 0
+
+        sync_mock.side_effect = _sync
+        thread = eventlet.spawn(self.service._sync_power_states,
+                                self.context)
+        for i in range(100):
+            if sync_mock.call_count == 2:
+                break
+            eventlet.sleep(0)
+
+        # the other node was synced while the slow BMC is still busy with
+        # its first node, which only ever held one worker
+        synced = [c[0][0].node for c in sync_mock.call_args_list]
+        self.assertEqual([nodes[0], other], synced)
+        self.assertEqual(
+                [mock.call(self.context, [n.id for n in nodes],
+                           filters=self.lock_filters),
+                 mock.call(self.context, [other.id],
+                           filters=self.lock_filters)],
+                acquire_mock.call_args_list)
+
+        slow_bmc.send()
+        thread.wait()
+        self.assertEqual(11, sync_mock.call_count)
+
+    @mock.patch.object(manager, 'LOG')
+    def test_sync_stats_logged(self, log_mock, get_nodeinfo_mock,
+                               mapped_mock, acquire_mock, sync_mock):
+        nodes = [self._create_node(id=i, uuid=ironic_utils.generate_uuid())
+                 for i in range(1, 4)]
+        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response(
+                nodes)
+        mapped_mock.return_value = True
+        self._mock_acquire_batch(
+                acquire_mock, [self._create_batch_task(node=n) for n in nodes])
+        sync_mock.side_effect = [0, 1, 0]
 
         self.service._sync_power_states(self.context)
 
-        get_nodeinfo_mock.assert_called_once_with(
-                columns=self.columns, filters=self.filters)
-        mapped_mock.assert_called_once_with(self.node.uuid,
-                                            self.node.driver)
-        get_node_mock.assert_called_once_with(self.context, self.node.id)
-        acquire_mock.assert_called_once_with(self.context, self.node.id)
-        sync_mock.assert_called_once_with(task, mock.ANY)
+        stats = log_mock.debug.call_args[0][1]
+        self.assertEqual(3, stats['total'])
+        self.assertEqual(2, stats['succeeded'])
+        self.assertEqual(1, stats['failed'])
+        self.assertFalse(log_mock.warning.called)
+
+    def _create_bulk_tasks(self, addresses):
+        power = mock.Mock()
+        nodes = [self._create_node(id=i, uuid=ironic_utils.generate_uuid(),
+                                   driver='fake_ssh',
+                                   driver_info={'ssh_address': addr})
+                 for i, addr in enumerate(addresses)]
+        tasks = [self._create_batch_task(node=n) for n in nodes]
+        for task in tasks:
+            task.driver.power = power
+        return nodes, tasks, power
+
+    def test_bulk_power_status_grouped_by_bmc(self, get_nodeinfo_mock,
+                                              mapped_mock, acquire_mock,
+                                              sync_mock):
+        nodes, tasks, power = self._create_bulk_tasks(
+                ['host1', 'host2', 'host1'])
+        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response(
+                nodes)
+        mapped_mock.return_value = True
+        self._mock_acquire_batch(acquire_mock, tasks)
+        power.get_power_states.side_effect = lambda tasks: dict(
+                (t.node.uuid, states.POWER_ON) for t in tasks)
+        sync_mock.return_value = 0
 
-    def test__sync_power_state_multiple_nodes(self, get_nodeinfo_mock,
-                                              get_node_mock, mapped_mock,
-                                              acquire_mock, sync_mock):
-        # Create 11 nodes:
-        # 1st node: Should acquire and try to sync
-        # 2nd node: Not mapped to this conductor
-        # 3rd node: In DEPLOYWAIT provision_state
-        # 4th node: In maintenance mode
-        # 5th node: Has a reservation
-        # 6th node: Disappears after getting nodeinfo list.
-        # 7th node: task_manger.acquire() fails due to lock
-        # 8th node: task_manger.acquire() fails due to node disappearing
-        # 9th node: In DEPLOYWAIT provision_state acquire()
-        # 10th node: In maintenance mode on acquire()
-        # 11th node: Should acquire and try to sync
-        nodes = []
-        get_node_map = {}
-        mapped_map = {}
-        for i in range(1, 12):
-            attrs = {'id': i,
-                     'uuid': ironic_utils.generate_uuid()}
-            if i == 3:
-                attrs['provision_state'] = states.DEPLOYWAIT
-                attrs['target_provision_state'] = states.ACTIVE
-            elif i == 4:
-                attrs['maintenance'] = True
-            elif i == 5:
-                attrs['reservation'] = 'fake'
-
-            n = self._create_node(**attrs)
-            nodes.append(n)
-            mapped_map[n.uuid] = False if i == 2 else True
-            get_node_map[n.uuid] = n
-
-        tasks = [self._create_task(node_attrs=dict(id=1)),
-                 exception.NodeLocked(node=7, host='fake'),
-                 exception.NodeNotFound(node=8, host='fake'),
-                 self._create_task(
-                     node_attrs=dict(id=9,
-                                    provision_state=states.DEPLOYWAIT,
-                                    target_provision_state=states.ACTIVE)),
-                 self._create_task(
-                     node_attrs=dict(id=10, maintenance=True)),
-                 self._create_task(node_attrs=dict(id=11))]
-
-        def _get_node_side_effect(ctxt, node_id):
-            if node_id == 6:
-                # Make this node disappear
-                raise exception.NodeNotFound(node=node_id)
-            return nodes[node_id - 1]
+        self.service._sync_power_states(self.context)
 
+        self.assertEqual(2, power.get_power_states.call_count)
+        self.assertIn(mock.call([tasks[0], tasks[2]]),
+                      power.get_power_states.call_args_list)
+        self.assertIn(mock.call([tasks[1]]),
+                      power.get_power_states.call_args_list)
+        self.assertFalse(power.get_power_state.called)
+        self.assertEqual(3, sync_mock.call_count)
+        for task in tasks:
+            sync_mock.assert_any_call(task, 0, current_state=states.POWER_ON)
+            self.assertTrue(task.__exit__.called)
+
+    def test_bulk_power_status_group_size(self, get_nodeinfo_mock,
+                                          mapped_mock, acquire_mock,
+                                          sync_mock):
+        self.config(periodic_batch_size=2, group='conductor')
+        nodes, tasks, power = self._create_bulk_tasks(['host1'] * 3)
         get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response(
                 nodes)
-        mapped_mock.side_effect = lambda x, y: mapped_map[x]
-        get_node_mock.side_effect = _get_node_side_effect
-        acquire_mock.side_effect = self._get_acquire_side_effect(tasks)
+        mapped_mock.return_value = True
+        self._mock_acquire_batch(acquire_mock, tasks)
+        power.get_power_states.return_value = {}
+        sync_mock.return_value = 0
 
-        with mock.patch.object(eventlet, 'sleep') as sleep_mock:
-            self.service._sync_power_states(self.context)
-            # Ensure we've yielded on every iteration
-            self.assertEqual(len(nodes), sleep_mock.call_count)
+        self.service._sync_power_states(self.context)
 
-        get_nodeinfo_mock.assert_called_once_with(
-                columns=self.columns, filters=self.filters)
-        mapped_calls = [mock.call(x.uuid, x.driver) for x in nodes]
-        self.assertEqual(mapped_calls, mapped_mock.call_args_list)
-        get_node_calls = [mock.call(self.context, x.id)
-                for x in nodes[:1] + nodes[2:]]
-        self.assertEqual(get_node_calls,
-                         get_node_mock.call_args_list)
-        acquire_calls = [mock.call(self.context, x.id)
-                for x in nodes[:1] + nodes[6:]]
-        self.assertEqual(acquire_calls, acquire_mock.call_args_list)
-        sync_calls = [mock.call(tasks[0], mock.ANY),
-                      mock.call(tasks[5], mock.ANY)]
-        self.assertEqual(sync_calls, sync_mock.call_args_list)
+        self.assertEqual([mock.call(tasks[:2]), mock.call(tasks[2:])],
+                         power.get_power_states.call_args_list)
+
+    def test_bulk_power_status_failure(self, get_nodeinfo_mock, mapped_mock,
+                                       acquire_mock, sync_mock):
+        nodes, tasks, power = self._create_bulk_tasks(['host1'] * 2)
+        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response(
+                nodes)
+        mapped_mock.return_value = True
+        self._mock_acquire_batch(acquire_mock, tasks)
+        error = exception.SSHConnectFailed(host='host1')
+        power.get_power_states.side_effect = error
+        sync_mock.return_value = 1
+
+        self.service._sync_power_states(self.context)
+
+        self.assertEqual([mock.call(tasks[0], 0, current_state=error),
+                          mock.call(tasks[1], 0, current_state=error)],
+                         sync_mock.call_args_list)
+        for task in tasks:
+            self.assertTrue(task.__exit__.called)
+
+
+class GetBMCAddressTestCase(tests_base.TestCase):
+    def test_known_address(self):
+        for key in manager.BMC_ADDRESS_KEYS:
+            self.assertEqual('fake-address', manager._get_bmc_address(
+                    'fake-uuid', {key: 'fake-address'}))
+
+    def test_unknown_address(self):
+        self.assertEqual('fake-uuid',
+                         manager._get_bmc_address('fake-uuid', {'foo': 'bar'}))
+
+    def test_no_driver_info(self):
+        self.assertEqual('fake-uuid',
+                         manager._get_bmc_address('fake-uuid', None))
 
 
 @mock.patch.object(task_manager, 'acquire')
@@ -2327,9 +2524,14 @@ class ManagerCheckDeployTimeoutsTestCase(_CommonMixIn,
                                       target_provision_state=states.ACTIVE)
         self.task2 = self._create_task(node=self.node2)
 
+        self.hash_partitions = {'fake': [(0, 65535)]}
+        self.service.ring_manager = mock.Mock()
+        self.service.ring_manager.get_hash_partitions.return_value = (
+                self.hash_partitions)
         self.filters = {'reserved': False, 'maintenance': False,
                         'provisioned_before': 300,
-                        'provision_state': states.DEPLOYWAIT}
+                        'provision_state': states.DEPLOYWAIT,
+                        'hash_partitions': self.hash_partitions}
         self.columns = ['uuid', 'driver']
 
     def _assert_get_nodeinfo_args(self, get_nodeinfo_mock):
@@ -2686,7 +2888,10 @@ class ManagerSyncLocalStateTestCase(_CommonMixIn, tests_db_base.DbTestCase):
 
         self.filters = {'reserved': False,
                         'maintenance': False,
-                        'provision_state': states.ACTIVE}
+                        'provision_state': states.ACTIVE,
+                        'hash_partitions':
+                            self.service.ring_manager.get_hash_partitions(
+                                'hostname')}
         self.columns = ['id', 'uuid', 'driver', 'conductor_affinity']
 
     def _assert_get_nodeinfo_args(self, get_nodeinfo_mock):
@@ -35,7 +35,7 @@ from ironic.tests.objects import utils as obj_utils
 
 @mock.patch.object(objects.Node, 'get')
 @mock.patch.object(objects.Node, 'release')
-@mock.patch.object(objects.Node, 'reserve')
+@mock.patch.object(objects.Node, 'reserve_with_ports')
 @mock.patch.object(driver_factory, 'get_driver')
 @mock.patch.object(objects.Port, 'list_by_node_id')
 class TaskManagerTestCase(tests_db_base.DbTestCase):
@@ -46,20 +46,21 @@ class TaskManagerTestCase(tests_db_base.DbTestCase):
         self.config(node_locked_retry_attempts=1, group='conductor')
         self.config(node_locked_retry_interval=0, group='conductor')
         self.node = obj_utils.create_test_node(self.context)
+        self.ports = [mock.sentinel.port]
 
     def test_excl_lock(self, get_ports_mock, get_driver_mock,
                        reserve_mock, release_mock, node_get_mock):
-        reserve_mock.return_value = self.node
+        reserve_mock.return_value = (self.node, self.ports)
         with task_manager.TaskManager(self.context, 'fake-node-id') as task:
             self.assertEqual(self.context, task.context)
             self.assertEqual(self.node, task.node)
-            self.assertEqual(get_ports_mock.return_value, task.ports)
+            self.assertEqual(self.ports, task.ports)
             self.assertEqual(get_driver_mock.return_value, task.driver)
             self.assertFalse(task.shared)
 
         reserve_mock.assert_called_once_with(self.context, self.host,
                                              'fake-node-id')
-        get_ports_mock.assert_called_once_with(self.context, self.node.id)
+        self.assertFalse(get_ports_mock.called)
         get_driver_mock.assert_called_once_with(self.node.driver)
         release_mock.assert_called_once_with(self.context, self.host,
                                              self.node.id)
@@ -68,18 +69,18 @@ class TaskManagerTestCase(tests_db_base.DbTestCase):
     def test_excl_lock_with_driver(self, get_ports_mock, get_driver_mock,
                                    reserve_mock, release_mock,
                                    node_get_mock):
-        reserve_mock.return_value = self.node
+        reserve_mock.return_value = (self.node, self.ports)
         with task_manager.TaskManager(self.context, 'fake-node-id',
                                       driver_name='fake-driver') as task:
             self.assertEqual(self.context, task.context)
             self.assertEqual(self.node, task.node)
-            self.assertEqual(get_ports_mock.return_value, task.ports)
+            self.assertEqual(self.ports, task.ports)
             self.assertEqual(get_driver_mock.return_value, task.driver)
             self.assertFalse(task.shared)
 
         reserve_mock.assert_called_once_with(self.context, self.host,
                                              'fake-node-id')
-        get_ports_mock.assert_called_once_with(self.context, self.node.id)
+        self.assertFalse(get_ports_mock.called)
         get_driver_mock.assert_called_once_with('fake-driver')
         release_mock.assert_called_once_with(self.context, self.host,
                                              self.node.id)
@@ -92,13 +93,11 @@ class TaskManagerTestCase(tests_db_base.DbTestCase):
                                            uuid=utils.generate_uuid(),
                                            driver='fake')
 
-        reserve_mock.return_value = self.node
-        get_ports_mock.return_value = mock.sentinel.ports1
+        reserve_mock.return_value = (self.node, mock.sentinel.ports1)
         get_driver_mock.return_value = mock.sentinel.driver1
 
         with task_manager.TaskManager(self.context, 'node-id1') as task:
-            reserve_mock.return_value = node2
-            get_ports_mock.return_value = mock.sentinel.ports2
+            reserve_mock.return_value = (node2, mock.sentinel.ports2)
             get_driver_mock.return_value = mock.sentinel.driver2
             with task_manager.TaskManager(self.context, 'node-id2') as task2:
                 self.assertEqual(self.context, task.context)
@@ -115,9 +114,7 @@ class TaskManagerTestCase(tests_db_base.DbTestCase):
         self.assertEqual([mock.call(self.context, self.host, 'node-id1'),
                           mock.call(self.context, self.host, 'node-id2')],
                          reserve_mock.call_args_list)
-        self.assertEqual([mock.call(self.context, self.node.id),
-                          mock.call(self.context, node2.id)],
-                         get_ports_mock.call_args_list)
+        self.assertFalse(get_ports_mock.called)
         self.assertEqual([mock.call(self.node.driver),
                           mock.call(node2.driver)],
                          get_driver_mock.call_args_list)
@@ -137,7 +134,7 @@ class TaskManagerTestCase(tests_db_base.DbTestCase):
         # Fail on the first lock attempt, succeed on the second.
         reserve_mock.side_effect = [exception.NodeLocked(node='foo',
                                                          host='foo'),
-                                    self.node]
+                                    (self.node, self.ports)]
 
         with task_manager.TaskManager(self.context, 'fake-node-id') as task:
             self.assertFalse(task.shared)
@@ -167,29 +164,27 @@ class TaskManagerTestCase(tests_db_base.DbTestCase):
         self.assertFalse(release_mock.called)
         self.assertFalse(node_get_mock.called)
 
-    def test_excl_lock_get_ports_exception(self, get_ports_mock,
-                                           get_driver_mock, reserve_mock,
-                                           release_mock, node_get_mock):
-        reserve_mock.return_value = self.node
-        get_ports_mock.side_effect = exception.IronicException('foo')
+    def test_excl_lock_node_not_found(self, get_ports_mock,
+                                      get_driver_mock, reserve_mock,
+                                      release_mock, node_get_mock):
+        reserve_mock.side_effect = exception.NodeNotFound(node='foo')
 
-        self.assertRaises(exception.IronicException,
+        self.assertRaises(exception.NodeNotFound,
                           task_manager.TaskManager,
                           self.context,
                           'fake-node-id')
 
         reserve_mock.assert_called_once_with(self.context, self.host,
                                              'fake-node-id')
-        get_ports_mock.assert_called_once_with(self.context, self.node.id)
+        self.assertFalse(get_ports_mock.called)
         self.assertFalse(get_driver_mock.called)
-        release_mock.assert_called_once_with(self.context, self.host,
-                                             self.node.id)
+        self.assertFalse(release_mock.called)
         self.assertFalse(node_get_mock.called)
 
     def test_excl_lock_get_driver_exception(self, get_ports_mock,
                                             get_driver_mock, reserve_mock,
                                             release_mock, node_get_mock):
-        reserve_mock.return_value = self.node
+        reserve_mock.return_value = (self.node, self.ports)
         get_driver_mock.side_effect = exception.DriverNotFound(
                 driver_name='foo')
 
@@ -200,7 +195,7 @@ class TaskManagerTestCase(tests_db_base.DbTestCase):
 
         reserve_mock.assert_called_once_with(self.context, self.host,
                                              'fake-node-id')
-        get_ports_mock.assert_called_once_with(self.context, self.node.id)
+        self.assertFalse(get_ports_mock.called)
         get_driver_mock.assert_called_once_with(self.node.driver)
         release_mock.assert_called_once_with(self.context, self.host,
                                              self.node.id)
@@ -302,7 +297,7 @@ class TaskManagerTestCase(tests_db_base.DbTestCase):
         thread_mock = mock.Mock(spec_set=['link', 'cancel'])
         spawn_mock = mock.Mock(return_value=thread_mock)
         task_release_mock = mock.Mock()
-        reserve_mock.return_value = self.node
+        reserve_mock.return_value = (self.node, self.ports)
 
         with task_manager.TaskManager(self.context, 'node-id') as task:
             task.spawn_after(spawn_mock, 1, 2, foo='bar', cat='meow')
@@ -324,7 +319,7 @@ class TaskManagerTestCase(tests_db_base.DbTestCase):
                                                  node_get_mock):
         spawn_mock = mock.Mock()
         task_release_mock = mock.Mock()
-        reserve_mock.return_value = self.node
+        reserve_mock.return_value = (self.node, self.ports)
 
         def _test_it():
             with task_manager.TaskManager(self.context, 'node-id') as task:
@@ -341,7 +336,7 @@ class TaskManagerTestCase(tests_db_base.DbTestCase):
                                      node_get_mock):
         spawn_mock = mock.Mock(side_effect=exception.IronicException('foo'))
         task_release_mock = mock.Mock()
-        reserve_mock.return_value = self.node
+        reserve_mock.return_value = (self.node, self.ports)
 
         def _test_it():
             with task_manager.TaskManager(self.context, 'node-id') as task:
@@ -361,7 +356,7 @@ class TaskManagerTestCase(tests_db_base.DbTestCase):
         spawn_mock = mock.Mock(return_value=thread_mock)
         task_release_mock = mock.Mock()
         thr_release_mock = mock.Mock(spec_set=[])
-        reserve_mock.return_value = self.node
+        reserve_mock.return_value = (self.node, self.ports)
 
         def _test_it():
             with task_manager.TaskManager(self.context, 'node-id') as task:
@@ -382,7 +377,7 @@ class TaskManagerTestCase(tests_db_base.DbTestCase):
         spawn_mock = mock.Mock(side_effect=expected_exception)
         task_release_mock = mock.Mock()
         on_error_handler = mock.Mock()
-        reserve_mock.return_value = self.node
+        reserve_mock.return_value = (self.node, self.ports)
 
         def _test_it():
             with task_manager.TaskManager(self.context, 'node-id') as task:
@@ -406,7 +401,7 @@ class TaskManagerTestCase(tests_db_base.DbTestCase):
         # Raise an exception within the on_error handler
         on_error_handler = mock.Mock(side_effect=Exception('unexpected'))
         on_error_handler.__name__ = 'foo_method'
-        reserve_mock.return_value = self.node
+        reserve_mock.return_value = (self.node, self.ports)
 
         def _test_it():
             with task_manager.TaskManager(self.context, 'node-id') as task:
@@ -427,7 +422,7 @@ class TaskManagerTestCase(tests_db_base.DbTestCase):
                   get_driver_mock, reserve_mock, release_mock,
                   node_get_mock):
         m = mock.Mock(spec=fsm.FSM)
-        reserve_mock.return_value = self.node
+        reserve_mock.return_value = (self.node, self.ports)
         copy_mock.return_value = m
         t = task_manager.TaskManager('fake', 'fake')
         copy_mock.assert_called_once_with()
@@ -435,6 +430,114 @@ class TaskManagerTestCase(tests_db_base.DbTestCase):
         m.initialize.assert_called_once_with(self.node.provision_state)
 
 
+@mock.patch.object(objects.Node, 'release')
+@mock.patch.object(objects.Node, 'release_batch')
+@mock.patch.object(objects.Node, 'reserve_batch')
+@mock.patch.object(driver_factory, 'get_driver')
+@mock.patch.object(objects.Port, 'list_by_node_ids')
+class AcquireBatchTestCase(tests_db_base.DbTestCase):
+    def setUp(self):
+        super(AcquireBatchTestCase, self).setUp()
+        self.host = 'test-host'
+        self.config(host=self.host)
+        self.nodes = [obj_utils.create_test_node(self.context, id=i,
+                                                 uuid=utils.generate_uuid())
+                      for i in range(1, 4)]
+        self.node_ids = [node.id for node in self.nodes]
+
+    def test_acquire_batch(self, get_ports_mock, get_driver_mock,
+                           reserve_mock, release_batch_mock, release_mock):
+        port = mock.Mock(node_id=self.nodes[1].id)
+        get_ports_mock.return_value = [port]
+        reserve_mock.return_value = list(self.nodes)
+        filters = {'maintenance': False}
+
+        tasks = []
+        for task in task_manager.acquire_batch(self.context, self.node_ids,
+                                               filters=filters):
+            with task:
+                self.assertFalse(task.shared)
+                self.assertEqual(get_driver_mock.return_value, task.driver)
+                tasks.append((task.node, task.ports))
+
+        reserve_mock.assert_called_once_with(self.context, self.host,
+                                             self.node_ids, filters=filters)
+        get_ports_mock.assert_called_once_with(self.context, self.node_ids)
+        self.assertEqual([(self.nodes[0], []), (self.nodes[1], [port]),
+                          (self.nodes[2], [])], tasks)
+        self.assertEqual([mock.call(self.context, self.host, node.id)
+                          for node in self.nodes],
+                         release_mock.call_args_list)
+        self.assertFalse(release_batch_mock.called)
+
+    def test_acquire_batch_in_batches(self, get_ports_mock, get_driver_mock,
+                                      reserve_mock, release_batch_mock,
+                                      release_mock):
+        get_ports_mock.return_value = []
+        reserve_mock.side_effect = [self.nodes[:2], [self.nodes[2]]]
+
+        for task in task_manager.acquire_batch(self.context, self.node_ids,
+                                               batch_size=2):
+            with task:
+                pass
+
+        self.assertEqual([mock.call(self.context, self.host,
+                                    self.node_ids[:2], filters=None),
+                          mock.call(self.context, self.host,
+                                    self.node_ids[2:], filters=None)],
+                         reserve_mock.call_args_list)
+        self.assertEqual(2, get_ports_mock.call_count)
+        self.assertEqual(3, release_mock.call_count)
+
+    def test_acquire_batch_nothing_reserved(self, get_ports_mock,
+                                            get_driver_mock, reserve_mock,
+                                            release_batch_mock,
+                                            release_mock):
+        reserve_mock.return_value = []
+
+        tasks = list(task_manager.acquire_batch(self.context, self.node_ids))
+
+        self.assertEqual([], tasks)
+        self.assertFalse(get_ports_mock.called)
+        self.assertFalse(release_batch_mock.called)
+
+    def test_acquire_batch_close_releases_pending(self, get_ports_mock,
+                                                  get_driver_mock,
+                                                  reserve_mock,
+                                                  release_batch_mock,
+                                                  release_mock):
+        get_ports_mock.return_value = []
+        reserve_mock.return_value = list(self.nodes)
+
+        tasks = task_manager.acquire_batch(self.context, self.node_ids)
+        with next(tasks):
+            pass
+        tasks.close()
+
+        release_mock.assert_called_once_with(self.context, self.host,
+                                             self.nodes[0].id)
+        release_batch_mock.assert_called_once_with(self.context, self.host,
+                                                   self.node_ids[1:])
+
+    def test_acquire_batch_driver_not_found(self, get_ports_mock,
+                                            get_driver_mock, reserve_mock,
+                                            release_batch_mock,
+                                            release_mock):
+        get_ports_mock.return_value = []
+        reserve_mock.return_value = list(self.nodes)
+        get_driver_mock.side_effect = exception.DriverNotFound(
+                driver_name='foo')
+
+        self.assertRaises(exception.DriverNotFound, list,
+                          task_manager.acquire_batch(self.context,
+                                                     self.node_ids))
+
+        release_mock.assert_called_once_with(self.context, self.host,
+                                             self.nodes[0].id)
+        release_batch_mock.assert_called_once_with(self.context, self.host,
+                                                   self.node_ids[1:])
+
+
 class TaskManagerStateModelTestCases(tests_base.TestCase):
     def setUp(self):
         super(TaskManagerStateModelTestCases, self).setUp()
@@ -51,6 +51,7 @@ from oslo.db.sqlalchemy import utils as db_utils
 import sqlalchemy
 import sqlalchemy.exc
 
+from ironic.common import hash_ring
 from ironic.common.i18n import _LE
 from ironic.common import utils
 from ironic.db.sqlalchemy import migration
@@ -328,6 +329,47 @@ class MigrationCheckersMixin(object):
         self.assertIsInstance(nodes.c.maintenance_reason.type,
                               sqlalchemy.types.String)
 
+    def _pre_upgrade_d74820bcf393(self, engine):
+        nodes = db_utils.get_table(engine, 'nodes')
+        data = {'driver': 'fake', 'uuid': utils.generate_uuid()}
+        nodes.insert().values(data).execute()
+        return data
+
+    def _check_d74820bcf393(self, engine, data):
+        nodes = db_utils.get_table(engine, 'nodes')
+        col_names = [column.name for column in nodes.c]
+        self.assertIn('hash_partition', col_names)
+        self.assertIsInstance(nodes.c.hash_partition.type,
+                              sqlalchemy.types.Integer)
+        node = nodes.select(nodes.c.uuid == data['uuid']).execute().first()
+        self.assertEqual(hash_ring.get_hash_partition(data['uuid']),
+                         node['hash_partition'])
+
+    def _check_9dc00eeae27e(self, engine, data):
+        nodes = db_utils.get_table(engine, 'nodes')
+        indexes = dict((index.name, [c.name for c in index.columns])
+                       for index in nodes.indexes)
+        self.assertEqual(['maintenance', 'reservation', 'driver',
+                          'hash_partition'],
+                         indexes['node_maintenance_reservation_idx'])
+        self.assertEqual(['provision_state', 'provision_updated_at'],
+                         indexes['node_provision_state_idx'])
+
+    def _pre_upgrade_4f399b21ae71(self, engine):
+        nodes = db_utils.get_table(engine, 'nodes')
+        data = {'driver': 'fake', 'uuid': utils.generate_uuid()}
+        nodes.insert().values(data).execute()
+        return data
+
+    def _check_4f399b21ae71(self, engine, data):
+        nodes = db_utils.get_table(engine, 'nodes')
+        col_names = [column.name for column in nodes.c]
+        self.assertIn('version_id', col_names)
+        self.assertIsInstance(nodes.c.version_id.type,
+                              sqlalchemy.types.Integer)
+        node = nodes.select(nodes.c.uuid == data['uuid']).execute().first()
+        self.assertEqual(0, node['version_id'])
+
     def test_upgrade_and_version(self):
         with patch_with_engine(self.engine):
             self.migration_api.upgrade('head')
@@ -0,0 +1,125 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests that the node queries of periodic tasks and the API use indexes.
+
+The queries are built by the DB API and run through EXPLAIN on SQLite and,
+when it is available, on MySQL.
+"""
+
+import re
+
+from oslo.db.sqlalchemy import test_base
+from sqlalchemy import orm
+from sqlalchemy import schema
+
+from ironic.common import states
+from ironic.db.sqlalchemy import api as sa_api
+from ironic.db.sqlalchemy import migration
+from ironic.db.sqlalchemy import models
+from ironic.tests.db import base
+from ironic.tests.db.sqlalchemy import test_migrations
+
+
+class QueryPlanMixin(object):
+    """Checks of the indexes used for the node filters.
+
+    Subclasses set up self.engine with the nodes table and define
+    _get_plan_indexes(statement, params), which returns the names of the
+    indexes used by a statement.
+    """
+
+    def _assert_index_used(self, index, filters, sort_key=None):
+        query = orm.Query(models.Node.id)
+        query = sa_api.Connection()._add_nodes_filters(query, filters)
+        if sort_key is not None:
+            query = query.order_by(getattr(models.Node, sort_key))
+        compiled = query.statement.compile(dialect=self.engine.dialect)
+        params = [compiled.params[name] for name in compiled.positiontup]
+        self.assertIn(index, self._get_plan_indexes(str(compiled), params))
+
+    def test_sync_power_states(self):
+        filters = {'reserved': False, 'maintenance': False,
+                   'provision_state_not_in': [states.DEPLOYWAIT],
+                   'hash_partitions': {'fake': [(0, 1023), (4096, 8191)]}}
+        self._assert_index_used('node_maintenance_reservation_idx', filters)
+
+    def test_check_deploy_timeouts(self):
+        filters = {'reserved': False, 'maintenance': False,
+                   'provision_state': states.DEPLOYWAIT,
+                   'provisioned_before': 300}
+        self._assert_index_used('node_provision_state_idx', filters,
+                                sort_key='provision_updated_at')
+
+    def test_sync_local_state(self):
+        filters = {'reserved': False, 'maintenance': False,
+                   'provision_state': states.ACTIVE}
+        self._assert_index_used('node_provision_state_idx', filters)
+
+    def test_list_nodes_in_maintenance(self):
+        self._assert_index_used('node_maintenance_reservation_idx',
+                                {'maintenance': True})
+
+    def test_list_unassociated_nodes(self):
+        self._assert_index_used('uniq_nodes0instance_uuid',
+                                {'associated': False})
+
+    def test_list_associated_nodes(self):
+        self._assert_index_used('uniq_nodes0instance_uuid',
+                                {'associated': True})
+
+
+class SqliteQueryPlanTestCase(QueryPlanMixin, base.DbTestCase):
+
+    def setUp(self):
+        super(SqliteQueryPlanTestCase, self).setUp()
+        self.engine = sa_api.get_engine()
+
+    def _get_plan_indexes(self, statement, params):
+        rows = self.engine.execute('EXPLAIN QUERY PLAN ' + statement,
+                                   *params)
+        indexes = set()
+        for row in rows:
+            indexes.update(re.findall(r'USING (?:COVERING )?INDEX (\w+)',
+                                      row['detail']))
+        return set(self._get_constraint_name(index) for index in indexes)
+
+    def _get_constraint_name(self, index):
+        # NOTE: SQLite names the indexes of unique constraints itself.
+        if not index.startswith('sqlite_autoindex_'):
+            return index
+        columns = [row['name'] for row in
+                   self.engine.execute('PRAGMA index_info(%s)' % index)]
+        for constraint in models.Node.__table__.constraints:
+            if (isinstance(constraint, schema.UniqueConstraint) and
+                    [c.name for c in constraint.columns] == columns):
+                return constraint.name
+        return index
+
+
+class MySQLQueryPlanTestCase(QueryPlanMixin,
+                             test_base.MySQLOpportunisticTestCase):
+
+    def setUp(self):
+        super(MySQLQueryPlanTestCase, self).setUp()
+        with test_migrations.patch_with_engine(self.engine):
+            migration.upgrade('head')
+
+    def _get_plan_indexes(self, statement, params):
+        # NOTE: MySQL may read a nearly empty table rather than an index,
+        #       so the indexes it considers are checked.
+        rows = self.engine.execute('EXPLAIN ' + statement, *params)
+        indexes = set()
+        for row in rows:
+            if row['possible_keys']:
+                indexes.update(row['possible_keys'].split(','))
+        return indexes
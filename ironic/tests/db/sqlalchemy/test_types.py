@@ -12,6 +12,7 @@
 
 """Tests for custom SQLAlchemy types via Ironic DB."""
 
+import mock
 from oslo.db import exception as db_exc
 
 from ironic.common import utils as ironic_utils
@@ -47,6 +48,31 @@ class SqlAlchemyCustomTypesTestCase(base.DbTestCase):
                           {'extra':
                                ['this is not a dict']})
 
+    def test_json_codec(self):
+        self.config(json_codec='simplejson', group='database')
+        codec = mock.Mock(spec_set=['dumps', 'loads'])
+        codec.dumps.return_value = '{"foo": "codec"}'
+        codec.loads.return_value = {'foo': 'codec'}
+        with mock.patch.dict(models._json_codecs, {'simplejson': codec}):
+            ch_id = ironic_utils.generate_uuid()
+            self.dbapi.create_chassis({'uuid': ch_id, 'extra': {}})
+            codec.dumps.assert_called_once_with({})
+            ch = (sa_api.model_query(models.Chassis)
+                  .filter_by(uuid=ch_id).one())
+            self.assertEqual({'foo': 'codec'}, ch.extra)
+            codec.loads.assert_called_once_with('{"foo": "codec"}')
+
+    def test_json_codec_imported_once(self):
+        self.config(json_codec='json', group='database')
+        with mock.patch.dict(models._json_codecs, clear=True):
+            with mock.patch.object(models.importutils, 'import_module',
+                                   autospec=True) as import_mock:
+                self.assertEqual(import_mock.return_value,
+                                 models._get_json_codec())
+                self.assertEqual(import_mock.return_value,
+                                 models._get_json_codec())
+                import_mock.assert_called_once_with('json')
+
     def test_JSONEncodedLict_default_value(self):
         # Create conductor w/o extra specified.
         cdr1_id = 321321
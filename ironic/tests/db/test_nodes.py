@@ -17,13 +17,17 @@
 
 import datetime
 
+import fixtures
 import mock
+from oslo.db import exception as db_exc
 from oslo.utils import timeutils
 import six
 
 from ironic.common import exception
+from ironic.common import hash_ring
 from ironic.common import states
 from ironic.common import utils as ironic_utils
+from ironic.db.sqlalchemy import api as sa_api
 from ironic.tests.db import base
 from ironic.tests.db import utils
 
@@ -157,6 +161,263 @@ class DbNodeTestCase(base.DbTestCase):
         res_uuids = [r.uuid for r in res]
         self.assertEqual(uuids.sort(), res_uuids.sort())
 
+    def test_get_nodeinfo_list_provision_state_not_in(self):
+        node1 = utils.create_test_node(uuid=ironic_utils.generate_uuid(),
+                                       provision_state=states.DEPLOYWAIT)
+        node2 = utils.create_test_node(uuid=ironic_utils.generate_uuid(),
+                                       provision_state=states.ACTIVE)
+        node3 = utils.create_test_node(uuid=ironic_utils.generate_uuid(),
+                                       provision_state=states.NOSTATE)
+
+        res = self.dbapi.get_nodeinfo_list(
+                filters={'provision_state_not_in': [states.DEPLOYWAIT]})
+        self.assertEqual(sorted([node2.id, node3.id]),
+                         sorted([r[0] for r in res]))
+
+        res = self.dbapi.get_nodeinfo_list(
+                filters={'provision_state_not_in': [states.DEPLOYWAIT,
+                                                    states.NOSTATE]})
+        self.assertEqual([node2.id], [r[0] for r in res])
+
+        res = self.dbapi.get_nodeinfo_list(
+                filters={'provision_state_not_in': [states.ACTIVE]})
+        self.assertEqual(sorted([node1.id, node3.id]),
+                         sorted([r[0] for r in res]))
+
+    def test_create_node_sets_hash_partition(self):
+        node = utils.create_test_node()
+        self.assertEqual(hash_ring.get_hash_partition(node.uuid),
+                         node.hash_partition)
+
+    def _get_new_node(self, **kw):
+        kw.setdefault('uuid', ironic_utils.generate_uuid())
+        node = utils.get_test_node(**kw)
+        del node['id']
+        return node
+
+    def _get_new_port(self, **kw):
+        kw.setdefault('uuid', ironic_utils.generate_uuid())
+        port = utils.get_test_port(**kw)
+        del port['id']
+        del port['node_id']
+        return port
+
+    def test_create_nodes(self):
+        port1 = self._get_new_port(address='52:54:00:cf:2d:31')
+        port2 = self._get_new_port(address='52:54:00:cf:2d:32')
+        node1 = self._get_new_node()
+        node2 = self._get_new_node()
+        res = self.dbapi.create_nodes([(node1, [port1, port2]), (node2, [])])
+
+        self.assertEqual(2, len(res))
+        node_ref, port_refs = res[0]
+        self.assertEqual(node1['uuid'], node_ref.uuid)
+        self.assertEqual(hash_ring.get_hash_partition(node_ref.uuid),
+                         node_ref.hash_partition)
+        self.assertEqual([port1['uuid'], port2['uuid']],
+                         [p.uuid for p in port_refs])
+        self.assertEqual(sorted([port1['uuid'], port2['uuid']]),
+                         sorted(p.uuid for p in
+                                self.dbapi.get_ports_by_node_id(node_ref.id)))
+        self.assertEqual((node2['uuid'], []), (res[1][0].uuid, res[1][1]))
+        self.assertFalse(res[1][0].maintenance)
+        self.assertIsNotNone(res[1][0].created_at)
+
+    def test_create_nodes_generates_uuids(self):
+        node = self._get_new_node()
+        del node['uuid']
+        port = self._get_new_port()
+        del port['uuid']
+        node_ref, port_refs = self.dbapi.create_nodes([(node, [port])])[0]
+        self.assertTrue(ironic_utils.is_uuid_like(node_ref.uuid))
+        self.assertTrue(ironic_utils.is_uuid_like(port_refs[0].uuid))
+
+    def test_create_nodes_conflicts_with_db(self):
+        existing = utils.create_test_node(
+            uuid=ironic_utils.generate_uuid(),
+            instance_uuid=ironic_utils.generate_uuid())
+        utils.create_test_port(node_id=existing.id,
+                               address='52:54:00:cf:2d:31')
+        nodes = [(self._get_new_node(), []),
+                 (self._get_new_node(uuid=existing.uuid), []),
+                 (self._get_new_node(instance_uuid=existing.instance_uuid),
+                  []),
+                 (self._get_new_node(),
+                  [self._get_new_port(address='52:54:00:cf:2d:31')])]
+        res = self.dbapi.create_nodes(nodes)
+
+        self.assertEqual(nodes[0][0]['uuid'], res[0][0].uuid)
+        self.assertIsInstance(res[1], exception.NodeAlreadyExists)
+        self.assertIsInstance(res[2], exception.InstanceAssociated)
+        self.assertIsInstance(res[3], exception.MACAlreadyExists)
+        self.assertEqual(2, len(self.dbapi.get_node_list()))
+
+    def test_create_nodes_conflicts_within_batch(self):
+        node = self._get_new_node(instance_uuid=ironic_utils.generate_uuid())
+        port = self._get_new_port(address='52:54:00:cf:2d:31')
+        nodes = [(node, [port]),
+                 (self._get_new_node(uuid=node['uuid']), []),
+                 (self._get_new_node(instance_uuid=node['instance_uuid']),
+                  []),
+                 (self._get_new_node(),
+                  [self._get_new_port(address=port['address'])]),
+                 (self._get_new_node(),
+                  [self._get_new_port(address='52:54:00:cf:2d:32'),
+                   self._get_new_port(address='52:54:00:cf:2d:32')])]
+        res = self.dbapi.create_nodes(nodes)
+
+        self.assertEqual(node['uuid'], res[0][0].uuid)
+        self.assertIsInstance(res[1], exception.NodeAlreadyExists)
+        self.assertIsInstance(res[2], exception.InstanceAssociated)
+        self.assertIsInstance(res[3], exception.MACAlreadyExists)
+        self.assertIsInstance(res[4], exception.MACAlreadyExists)
+        self.assertEqual(1, len(self.dbapi.get_node_list()))
+        self.assertEqual(1, len(self.dbapi.get_port_list()))
+
+    def test_create_nodes_failed_ports_do_not_conflict(self):
+        port = self._get_new_port(address='52:54:00:cf:2d:31')
+        nodes = [(self._get_new_node(), [port, dict(port)]),
+                 (self._get_new_node(), [dict(port)])]
+        res = self.dbapi.create_nodes(nodes)
+
+        self.assertIsInstance(res[0], exception.PortAlreadyExists)
+        self.assertEqual([port['uuid']], [p.uuid for p in res[1][1]])
+
+    def test_create_nodes_large_batch(self):
+        self.useFixture(fixtures.MonkeyPatch(
+            'ironic.db.sqlalchemy.api._MAX_IN_VALUES', 2))
+        nodes = [(self._get_new_node(), []) for i in range(5)]
+        res = self.dbapi.create_nodes(nodes)
+        self.assertEqual([n['uuid'] for n, p in nodes],
+                         [r[0].uuid for r in res])
+
+    @mock.patch.object(sa_api, '_create_nodes', autospec=True)
+    def test_create_nodes_retries_on_conflict(self, mock_create):
+        mock_create.side_effect = iter([db_exc.DBDuplicateEntry(),
+                                         ['result']])
+        self.assertEqual(['result'], self.dbapi.create_nodes([]))
+        self.assertEqual(2, mock_create.call_count)
+
+    def test_get_nodeinfo_list_hash_partitions(self):
+        node1 = utils.create_test_node(uuid=ironic_utils.generate_uuid(),
+                                       driver='driver-one')
+        node2 = utils.create_test_node(uuid=ironic_utils.generate_uuid(),
+                                       driver='driver-one')
+        node3 = utils.create_test_node(uuid=ironic_utils.generate_uuid(),
+                                       driver='driver-two')
+        part1 = node1.hash_partition
+
+        res = self.dbapi.get_nodeinfo_list(
+                filters={'hash_partitions': {'driver-one': [(part1, part1)],
+                                             'driver-two': [(0, 65535)]}})
+        expected = [node1.id, node3.id]
+        if node2.hash_partition == part1:
+            expected.append(node2.id)
+        self.assertEqual(sorted(expected), sorted([r[0] for r in res]))
+
+        res = self.dbapi.get_nodeinfo_list(
+                filters={'hash_partitions': {'driver-one': []}})
+        self.assertEqual([], res)
+
+        res = self.dbapi.get_nodeinfo_list(filters={'hash_partitions': {}})
+        self.assertEqual([], res)
+
+    def test_get_nodeinfo_list_hash_partitions_not_computed(self):
+        node = utils.create_test_node(driver='driver-one')
+        self.dbapi.update_node(node.id, {'hash_partition': None})
+        res = self.dbapi.get_nodeinfo_list(
+                filters={'hash_partitions': {'driver-one': []}})
+        self.assertEqual([node.id], [r[0] for r in res])
+
+    def test_get_node_list_marker_uuid(self):
+        uuids = []
+        for i in range(5):
+            node = utils.create_test_node(uuid=ironic_utils.generate_uuid())
+            uuids.append(node.uuid)
+        res = self.dbapi.get_node_list(limit=2, marker=uuids[1])
+        self.assertEqual(uuids[2:4], [r.uuid for r in res])
+
+    def test_get_node_list_marker_uuid_sort_key(self):
+        nodes = []
+        for i, driver in enumerate(['b', 'a', 'b', 'a']):
+            nodes.append(utils.create_test_node(
+                    uuid=ironic_utils.generate_uuid(), driver=driver))
+        expected = sorted(nodes, key=lambda n: (n.driver, n.id),
+                          reverse=True)
+        res = self.dbapi.get_node_list(marker=expected[1].uuid,
+                                       sort_key='driver', sort_dir='desc')
+        self.assertEqual([n.uuid for n in expected[2:]],
+                         [r.uuid for r in res])
+
+    def test_get_node_list_marker_not_found(self):
+        utils.create_test_node()
+        self.assertRaises(exception.MarkerNotFound,
+                          self.dbapi.get_node_list,
+                          marker=ironic_utils.generate_uuid())
+
+    def test_get_node_list_use_slave(self):
+        node = utils.create_test_node()
+        with mock.patch.object(sa_api, 'get_session',
+                               wraps=sa_api.get_session) as get_session_mock:
+            res = self.dbapi.get_node_list(use_slave=True)
+            get_session_mock.assert_called_once_with(use_slave=True)
+        self.assertEqual([node.uuid], [r.uuid for r in res])
+
+    def test_get_node_list_use_slave_marker_no_slave(self):
+        uuids = []
+        for i in range(5):
+            node = utils.create_test_node(uuid=ironic_utils.generate_uuid())
+            uuids.append(node.uuid)
+        with mock.patch.object(sa_api, 'get_session',
+                               wraps=sa_api.get_session) as get_session_mock:
+            res = self.dbapi.get_node_list(limit=2, marker=uuids[1],
+                                           use_slave=True)
+            # without a slave, the marker is selected by the page query
+            get_session_mock.assert_called_once_with(use_slave=True)
+        self.assertEqual(uuids[2:4], [r.uuid for r in res])
+
+    def test_get_node_list_use_slave_marker(self):
+        self.config(slave_connection='sqlite://', group='database')
+        uuids = []
+        for i in range(5):
+            node = utils.create_test_node(uuid=ironic_utils.generate_uuid())
+            uuids.append(node.uuid)
+        with mock.patch.object(sa_api, 'get_session',
+                               wraps=sa_api.get_session) as get_session_mock:
+            res = self.dbapi.get_node_list(limit=2, marker=uuids[1],
+                                           use_slave=True)
+            # the marker is looked up on the master
+            self.assertEqual([mock.call(use_slave=True),
+                              mock.call(use_slave=False)],
+                             get_session_mock.call_args_list)
+        self.assertEqual(uuids[2:4], [r.uuid for r in res])
+
+    def test_get_node_list_use_slave_marker_not_found(self):
+        self.config(slave_connection='sqlite://', group='database')
+        utils.create_test_node()
+        self.assertRaises(exception.MarkerNotFound,
+                          self.dbapi.get_node_list,
+                          marker=ironic_utils.generate_uuid(),
+                          use_slave=True)
+
+    def test_get_node_by_uuid_use_slave(self):
+        node = utils.create_test_node()
+        with mock.patch.object(sa_api, 'get_session',
+                               wraps=sa_api.get_session) as get_session_mock:
+            res = self.dbapi.get_node_by_uuid(node.uuid, use_slave=True)
+            get_session_mock.assert_called_once_with(use_slave=True)
+        self.assertEqual(node.id, res.id)
+
+    def test_get_node_list_last_page(self):
+        node = utils.create_test_node()
+        self.assertEqual([], self.dbapi.get_node_list(marker=node.uuid))
+
+    def test_get_node_list_columns(self):
+        utils.create_test_node(driver_info={'foo': 'bar'})
+        res = self.dbapi.get_node_list(columns=['uuid', 'power_state'])
+        self.assertNotIn('driver_info', res[0].__dict__)
+        self.assertIn('power_state', res[0].__dict__)
+
     def test_get_node_list_with_filters(self):
         ch1 = utils.get_test_chassis(id=1, uuid=ironic_utils.generate_uuid())
         ch2 = utils.get_test_chassis(id=2, uuid=ironic_utils.generate_uuid())
@@ -331,6 +592,103 @@ class DbNodeTestCase(base.DbTestCase):
         res = self.dbapi.update_node(node.id, {'extra': {'foo': 'bar'}})
         self.assertIsNone(res['provision_updated_at'])
 
+    @mock.patch.object(timeutils, 'utcnow')
+    def test_update_node_columns(self, mock_utcnow):
+        mocked_time = datetime.datetime(2000, 1, 1, 0, 0)
+        mock_utcnow.return_value = mocked_time
+        node = utils.create_test_node()
+
+        with mock.patch.object(sa_api.Connection, '_do_update_node',
+                               autospec=True) as update_mock:
+            version_id = self.dbapi.update_node_columns(
+                node.id, {'power_state': 'fake'}, node.version_id)
+            self.assertFalse(update_mock.called)
+
+        self.assertEqual(node.version_id + 1, version_id)
+        res = self.dbapi.get_node_by_id(node.id)
+        self.assertEqual('fake', res.power_state)
+        self.assertEqual(version_id, res.version_id)
+        self.assertEqual(node.extra, res.extra)
+
+        # updates compare against the version they were given
+        self.dbapi.update_node_columns(node.uuid, {'provision_state': 'foo'},
+                                       version_id)
+        res = self.dbapi.get_node_by_id(node.id)
+        self.assertEqual('foo', res.provision_state)
+        self.assertEqual(version_id + 1, res.version_id)
+        self.assertEqual(mocked_time,
+                         timeutils.normalize_time(res.provision_updated_at))
+
+    def test_update_node_columns_conflict(self):
+        node = utils.create_test_node()
+        self.dbapi.update_node_columns(node.id, {'power_state': 'first'},
+                                       node.version_id)
+
+        # the second update was based on the node as it was before the
+        # first one, and must not overwrite it
+        self.assertRaises(exception.NodeUpdateConflict,
+                          self.dbapi.update_node_columns,
+                          node.id, {'power_state': 'second'},
+                          node.version_id)
+        res = self.dbapi.get_node_by_id(node.id)
+        self.assertEqual('first', res.power_state)
+
+    def test_update_node_columns_after_update_node(self):
+        node = utils.create_test_node()
+        res = self.dbapi.update_node(node.id, {'extra': {'foo': 'bar'}})
+        self.assertEqual(node.version_id + 1, res.version_id)
+
+        self.assertRaises(exception.NodeUpdateConflict,
+                          self.dbapi.update_node_columns,
+                          node.id, {'power_state': 'fake'},
+                          node.version_id)
+        version_id = self.dbapi.update_node_columns(
+            node.id, {'power_state': 'fake'}, res.version_id)
+        self.assertEqual(res.version_id + 1, version_id)
+
+    def test_update_node_columns_not_found(self):
+        self.assertRaises(exception.NodeNotFound,
+                          self.dbapi.update_node_columns,
+                          ironic_utils.generate_uuid(),
+                          {'power_state': 'fake'}, 0)
+
+    def test_update_node_columns_uuid(self):
+        node = utils.create_test_node()
+        self.assertRaises(exception.InvalidParameterValue,
+                          self.dbapi.update_node_columns, node.id,
+                          {'uuid': ''}, node.version_id)
+
+    def test_update_node_columns_associate_instance(self):
+        node = utils.create_test_node()
+        instance_uuid = ironic_utils.generate_uuid()
+        version_id = self.dbapi.update_node_columns(
+            node.id, {'instance_uuid': instance_uuid}, node.version_id)
+        res = self.dbapi.get_node_by_id(node.id)
+        self.assertEqual(instance_uuid, res.instance_uuid)
+        self.assertEqual(node.version_id + 1, version_id)
+        self.assertEqual(version_id, res.version_id)
+
+    def test_update_node_columns_associate_instance_conflict(self):
+        node = utils.create_test_node()
+        self.dbapi.update_node(node.id, {'power_state': 'fake'})
+        self.assertRaises(exception.NodeUpdateConflict,
+                          self.dbapi.update_node_columns,
+                          node.id,
+                          {'instance_uuid': ironic_utils.generate_uuid()},
+                          node.version_id)
+        res = self.dbapi.get_node_by_id(node.id)
+        self.assertIsNone(res.instance_uuid)
+
+    def test_update_node_columns_already_associated(self):
+        node = utils.create_test_node()
+        res = self.dbapi.update_node(
+            node.id, {'instance_uuid': ironic_utils.generate_uuid()})
+        self.assertRaises(exception.NodeAssociated,
+                          self.dbapi.update_node_columns,
+                          node.id,
+                          {'instance_uuid': ironic_utils.generate_uuid()},
+                          res.version_id)
+
     def test_reserve_node(self):
         node = utils.create_test_node()
         uuid = node.uuid
@@ -418,6 +776,110 @@ class DbNodeTestCase(base.DbTestCase):
         self.assertRaises(exception.NodeNotFound,
                           self.dbapi.release_node, 'fake', node.uuid)
 
+    def test_reserve_node_with_ports(self):
+        node = utils.create_test_node()
+        ports = [utils.create_test_port(id=i, node_id=node.id,
+                                        uuid=ironic_utils.generate_uuid(),
+                                        address='aa:bb:cc:dd:ee:%02x' % i)
+                 for i in range(1, 3)]
+        other = utils.create_test_node(id=2,
+                                       uuid=ironic_utils.generate_uuid())
+        utils.create_test_port(id=3, node_id=other.id,
+                               uuid=ironic_utils.generate_uuid(),
+                               address='aa:bb:cc:dd:ee:ff')
+
+        res_node, res_ports = self.dbapi.reserve_node_with_ports(
+            'fake-reservation', node.uuid)
+
+        self.assertEqual(node.id, res_node.id)
+        self.assertEqual('fake-reservation', res_node.reservation)
+        self.assertEqual(sorted(p.id for p in ports),
+                         sorted(p.id for p in res_ports))
+        res = self.dbapi.get_node_by_uuid(node.uuid)
+        self.assertEqual('fake-reservation', res.reservation)
+
+    def test_reserve_node_with_ports_no_ports(self):
+        node = utils.create_test_node()
+
+        res_node, res_ports = self.dbapi.reserve_node_with_ports(
+            'fake-reservation', node.id)
+
+        self.assertEqual(node.uuid, res_node.uuid)
+        self.assertEqual([], res_ports)
+
+    def test_reserve_node_with_ports_reserved_node(self):
+        node = utils.create_test_node()
+        self.dbapi.reserve_node('fake-reservation', node.id)
+
+        exc = self.assertRaises(exception.NodeLocked,
+                                self.dbapi.reserve_node_with_ports,
+                                'another-reservation', node.uuid)
+        self.assertIn('fake-reservation', str(exc))
+        res = self.dbapi.get_node_by_uuid(node.uuid)
+        self.assertEqual('fake-reservation', res.reservation)
+
+    def test_reserve_node_with_ports_non_existent_node(self):
+        node = utils.create_test_node()
+        self.dbapi.destroy_node(node.id)
+
+        self.assertRaises(exception.NodeNotFound,
+                          self.dbapi.reserve_node_with_ports, 'fake', node.id)
+        self.assertRaises(exception.NodeNotFound,
+                          self.dbapi.reserve_node_with_ports, 'fake',
+                          node.uuid)
+
+    def test_reserve_nodes(self):
+        nodes = [utils.create_test_node(id=i,
+                                        uuid=ironic_utils.generate_uuid())
+                 for i in range(1, 4)]
+        self.dbapi.reserve_node('another', nodes[1].id)
+
+        res = self.dbapi.reserve_nodes('fake', [n.id for n in nodes])
+
+        self.assertEqual([nodes[0].id, nodes[2].id],
+                         sorted(n.id for n in res))
+        for node in res:
+            self.assertEqual('fake', node.reservation)
+        self.assertEqual('fake',
+                         self.dbapi.get_node_by_id(nodes[0].id).reservation)
+        self.assertEqual('another',
+                         self.dbapi.get_node_by_id(nodes[1].id).reservation)
+
+    def test_reserve_nodes_with_filters(self):
+        node1 = utils.create_test_node(id=1,
+                                       uuid=ironic_utils.generate_uuid())
+        node2 = utils.create_test_node(id=2,
+                                       uuid=ironic_utils.generate_uuid(),
+                                       maintenance=True)
+        node3 = utils.create_test_node(id=3,
+                                       uuid=ironic_utils.generate_uuid(),
+                                       provision_state=states.DEPLOYWAIT)
+        filters = {'maintenance': False,
+                   'provision_state_not_in': [states.DEPLOYWAIT]}
+
+        res = self.dbapi.reserve_nodes('fake', [1, 2, 3], filters=filters)
+
+        self.assertEqual([node1.id], [n.id for n in res])
+        self.assertIsNone(self.dbapi.get_node_by_id(node2.id).reservation)
+        self.assertIsNone(self.dbapi.get_node_by_id(node3.id).reservation)
+
+    def test_reserve_nodes_empty(self):
+        self.assertEqual([], self.dbapi.reserve_nodes('fake', []))
+
+    def test_release_nodes(self):
+        nodes = [utils.create_test_node(id=i,
+                                        uuid=ironic_utils.generate_uuid())
+                 for i in range(1, 4)]
+        self.dbapi.reserve_nodes('fake', [1, 2])
+        self.dbapi.reserve_node('another', 3)
+
+        self.assertEqual(2, self.dbapi.release_nodes('fake', [1, 2, 3]))
+
+        for node in nodes[:2]:
+            self.assertIsNone(self.dbapi.get_node_by_id(node.id).reservation)
+        self.assertEqual('another',
+                         self.dbapi.get_node_by_id(nodes[2].id).reservation)
+
     def test_release_non_locked_node(self):
         node = utils.create_test_node()
 
@@ -15,6 +15,7 @@
 
 """Tests for manipulating Ports via the DB API"""
 
+import fixtures
 import six
 
 from ironic.common import exception
@@ -61,6 +62,34 @@ class DbPortTestCase(base.DbTestCase):
     def test_get_ports_by_node_id_that_does_not_exist(self):
         self.assertEqual([], self.dbapi.get_ports_by_node_id(99))
 
+    def test_get_ports_by_node_ids(self):
+        node2 = db_utils.create_test_node(id=2,
+                                          uuid=ironic_utils.generate_uuid())
+        port2 = db_utils.create_test_port(id=2, node_id=node2.id,
+                                          uuid=ironic_utils.generate_uuid(),
+                                          address='52:54:00:cf:2d:40')
+        res = self.dbapi.get_ports_by_node_ids([self.node.id, node2.id, 99])
+        self.assertEqual(sorted([self.port.id, port2.id]),
+                         sorted(p.id for p in res))
+
+    def test_get_ports_by_node_ids_large_batch(self):
+        self.useFixture(fixtures.MonkeyPatch(
+            'ironic.db.sqlalchemy.api._MAX_IN_VALUES', 2))
+        ports = [self.port]
+        for i in range(2, 6):
+            node = db_utils.create_test_node(
+                id=i, uuid=ironic_utils.generate_uuid())
+            ports.append(db_utils.create_test_port(
+                id=i, node_id=node.id, uuid=ironic_utils.generate_uuid(),
+                address='52:54:00:cf:2d:4%s' % i))
+        res = self.dbapi.get_ports_by_node_ids(
+            [p.node_id for p in ports] + [99])
+        self.assertEqual(sorted(p.id for p in ports),
+                         sorted(p.id for p in res))
+
+    def test_get_ports_by_node_ids_empty(self):
+        self.assertEqual([], self.dbapi.get_ports_by_node_ids([]))
+
     def test_destroy_port(self):
         self.dbapi.destroy_port(self.port.id)
         self.assertRaises(exception.PortNotFound,
@@ -175,6 +175,7 @@ def get_test_node(**kw):
         'maintenance_reason': kw.get('maintenance_reason'),
         'console_enabled': kw.get('console_enabled', False),
         'extra': kw.get('extra', {}),
+        'version_id': kw.get('version_id', 0),
         'updated_at': kw.get('updated_at'),
         'created_at': kw.get('created_at'),
     }
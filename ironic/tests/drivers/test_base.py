@@ -65,3 +65,41 @@ class PassthruDecoratorTestCase(base.TestCase):
             self.fvi.normalexception, mock.ANY)
         driver_base.LOG.exception.assert_called_with(
             mock.ANY, 'normalexception')
+
+
+class FakePowerInterface(driver_base.PowerInterface):
+    def get_properties(self):
+        pass
+
+    def validate(self, task):
+        pass
+
+    def get_power_state(self, task):
+        pass
+
+    def set_power_state(self, task, power_state):
+        pass
+
+    def reboot(self, task):
+        pass
+
+
+class GetPowerStatesTestCase(base.TestCase):
+
+    def setUp(self):
+        super(GetPowerStatesTestCase, self).setUp()
+        self.power = FakePowerInterface()
+        self.tasks = [mock.Mock(node=mock.Mock(uuid=uuid))
+                      for uuid in ('uuid1', 'uuid2', 'uuid3')]
+
+    @mock.patch.object(FakePowerInterface, 'get_power_state')
+    def test_get_power_states(self, get_power_mock):
+        error = exception.IronicException('boom')
+        get_power_mock.side_effect = ['power on', error, 'power off']
+
+        power_states = self.power.get_power_states(self.tasks)
+
+        self.assertEqual({'uuid1': 'power on', 'uuid2': error,
+                          'uuid3': 'power off'}, power_states)
+        self.assertEqual([mock.call(task) for task in self.tasks],
+                         get_power_mock.call_args_list)
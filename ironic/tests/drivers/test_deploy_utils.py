@@ -894,19 +894,24 @@ class RealFilePartitioningTestCase(tests_base.TestCase):
                          "unexpected partitioning %s" % part_table)
         self.assertIn(sizes[2], (9, 10))
 
+    @mock.patch.object(images, 'image_show')
     @mock.patch.object(image_cache, 'clean_up_caches')
-    def test_fetch_images(self, mock_clean_up_caches):
-
+    def test_fetch_images(self, mock_clean_up_caches, mock_show):
+        mock_show.return_value = {'size': 42, 'checksum': 'abc'}
         mock_cache = mock.MagicMock(master_dir='master_dir')
         utils.fetch_images(None, mock_cache, [('uuid', 'path')])
-        mock_clean_up_caches.assert_called_once_with(None, 'master_dir',
-                                                     [('uuid', 'path')])
+        mock_show.assert_called_once_with(None, 'uuid')
+        mock_clean_up_caches.assert_called_once_with(
+            None, 'master_dir', [('uuid', 'path')],
+            {'uuid': mock_show.return_value})
         mock_cache.fetch_image.assert_called_once_with('uuid', 'path',
                                                        ctx=None,
-                                                       force_raw=True)
+                                                       force_raw=True,
+                                                       checksum='abc')
 
+    @mock.patch.object(images, 'image_show')
     @mock.patch.object(image_cache, 'clean_up_caches')
-    def test_fetch_images_fail(self, mock_clean_up_caches):
+    def test_fetch_images_fail(self, mock_clean_up_caches, mock_show):
 
         exc = exception.InsufficientDiskSpace(path='a',
                                               required=2,
@@ -919,8 +924,9 @@ class RealFilePartitioningTestCase(tests_base.TestCase):
                           None,
                           mock_cache,
                           [('uuid', 'path')])
-        mock_clean_up_caches.assert_called_once_with(None, 'master_dir',
-                                                     [('uuid', 'path')])
+        mock_clean_up_caches.assert_called_once_with(
+            None, 'master_dir', [('uuid', 'path')],
+            {'uuid': mock_show.return_value})
 
 
 @mock.patch.object(shutil, 'copyfileobj')
@@ -20,6 +20,8 @@ import os
 import tempfile
 import time
 
+import eventlet
+from eventlet import greenpool
 import mock
 
 from ironic.common import exception
@@ -45,6 +47,9 @@ class TestImageCacheFetch(base.TestCase):
         self.dest_path = os.path.join(self.dest_dir, 'dest')
         self.uuid = 'uuid'
         self.master_path = os.path.join(self.master_dir, self.uuid)
+        indexes = mock.patch.dict(image_cache._master_indexes, clear=True)
+        indexes.start()
+        self.addCleanup(indexes.stop)
 
     @mock.patch.object(image_cache.ImageCache, 'clean_up')
     @mock.patch.object(image_cache.ImageCache, '_download_image')
@@ -54,7 +59,7 @@ class TestImageCacheFetch(base.TestCase):
         self.cache.fetch_image('uuid', self.dest_path)
         self.assertFalse(mock_download.called)
         mock_fetch.assert_called_once_with(
-            None, 'uuid', self.dest_path, None, True)
+            None, 'uuid', self.dest_path, None, True, None)
         self.assertFalse(mock_clean_up.called)
 
     @mock.patch.object(os, 'unlink')
@@ -97,7 +102,7 @@ class TestImageCacheFetch(base.TestCase):
         self.assertFalse(mock_fetch.called)
         mock_download.assert_called_once_with(
             self.uuid, self.master_path, self.dest_path,
-            ctx=None, force_raw=True)
+            ctx=None, force_raw=True, checksum=None)
         self.assertTrue(mock_clean_up.called)
 
     @mock.patch.object(image_cache.ImageCache, 'clean_up')
@@ -113,6 +118,45 @@ class TestImageCacheFetch(base.TestCase):
                          os.stat(self.master_path).st_ino)
         self.assertFalse(mock_clean_up.called)
 
+    @mock.patch.object(image_cache.ImageCache, 'clean_up')
+    @mock.patch.object(image_cache.ImageCache, '_download_image')
+    def test_fetch_image_master_checksum_matches(self, mock_download,
+                                                 mock_clean_up, mock_fetch):
+        touch(self.master_path)
+        with open(self.master_path + '.checksum', 'w') as fp:
+            fp.write('abc')
+        self.cache.fetch_image(self.uuid, self.dest_path, checksum='abc')
+        self.assertFalse(mock_download.called)
+        self.assertEqual(os.stat(self.dest_path).st_ino,
+                         os.stat(self.master_path).st_ino)
+
+    @mock.patch.object(image_cache.ImageCache, 'clean_up')
+    @mock.patch.object(image_cache.ImageCache, '_download_image')
+    def test_fetch_image_master_checksum_differs(self, mock_download,
+                                                mock_clean_up, mock_fetch):
+        touch(self.master_path)
+        with open(self.master_path + '.checksum', 'w') as fp:
+            fp.write('abc')
+        os.link(self.master_path, self.dest_path)
+        self.cache.fetch_image(self.uuid, self.dest_path, checksum='def')
+        mock_download.assert_called_once_with(
+            self.uuid, self.master_path, self.dest_path,
+            ctx=None, force_raw=True, checksum='def')
+        self.assertFalse(os.path.exists(self.master_path))
+        self.assertFalse(os.path.exists(self.master_path + '.checksum'))
+        self.assertFalse(os.path.exists(self.dest_path))
+
+    @mock.patch.object(image_cache.ImageCache, 'clean_up')
+    @mock.patch.object(image_cache.ImageCache, '_download_image')
+    def test_fetch_image_master_not_checked(self, mock_download,
+                                            mock_clean_up, mock_fetch):
+        touch(self.master_path)
+        self.cache.fetch_image(self.uuid, self.dest_path, checksum='abc')
+        mock_download.assert_called_once_with(
+            self.uuid, self.master_path, self.dest_path,
+            ctx=None, force_raw=True, checksum='abc')
+        self.assertFalse(os.path.exists(self.master_path))
+
     @mock.patch.object(image_cache.ImageCache, 'clean_up')
     @mock.patch.object(image_cache.ImageCache, '_download_image')
     def test_fetch_image(self, mock_download, mock_clean_up,
@@ -121,7 +165,7 @@ class TestImageCacheFetch(base.TestCase):
         self.assertFalse(mock_fetch.called)
         mock_download.assert_called_once_with(
             self.uuid, self.master_path, self.dest_path,
-            ctx=None, force_raw=True)
+            ctx=None, force_raw=True, checksum=None)
         self.assertTrue(mock_clean_up.called)
 
     def test__download_image(self, mock_fetch):
@@ -140,6 +184,46 @@ class TestImageCacheFetch(base.TestCase):
                          os.stat(self.master_path).st_ino)
         with open(self.dest_path) as fp:
             self.assertEqual("TEST", fp.read())
+        index = image_cache._get_master_index(self.master_dir)
+        self.assertEqual(4, index.total_size)
+        self.assertEqual(1, len(index))
+        self.assertIsNone(image_cache._read_checksum(self.master_path))
+
+    def test__download_image_verified(self, mock_fetch):
+        def _fake_fetch(ctx, uuid, tmp_path, *args):
+            touch(tmp_path)
+            return True
+
+        mock_fetch.side_effect = _fake_fetch
+        self.cache._download_image(self.uuid, self.master_path, self.dest_path,
+                                   checksum='abc')
+        mock_fetch.assert_called_once_with(None, self.uuid, mock.ANY, None,
+                                           True, 'abc')
+        self.assertEqual('abc', image_cache._read_checksum(self.master_path))
+        self.assertEqual(1, len(image_cache._get_master_index(
+            self.master_dir)))
+
+    @mock.patch.object(utils, 'rmtree_without_raise')
+    def test__download_image_checksum_mismatch(self, mock_rmtree,
+                                               mock_fetch):
+        mock_fetch.side_effect = exception.ImageUnacceptable(
+            image_id=self.uuid, reason='checksum')
+        self.assertRaises(exception.ImageUnacceptable,
+                          self.cache._download_image,
+                          self.uuid, self.master_path, self.dest_path)
+        self.assertFalse(os.path.exists(self.master_path))
+        self.assertFalse(os.path.exists(self.dest_path))
+        self.assertEqual(0, len(image_cache._get_master_index(
+            self.master_dir)))
+        self.assertTrue(mock_rmtree.called)
+
+    def test_master_index_skips_checksum_files(self, mock_fetch):
+        touch(self.master_path)
+        with open(self.master_path + '.checksum', 'w') as fp:
+            fp.write('abc')
+        index = image_cache._get_master_index(self.master_dir)
+        self.assertEqual(1, len(index))
+        self.assertEqual(0, index.total_size)
 
 
 class TestImageCacheCleanUp(base.TestCase):
@@ -150,10 +234,11 @@ class TestImageCacheCleanUp(base.TestCase):
         self.cache = image_cache.ImageCache(self.master_dir,
                                             cache_size=10,
                                             cache_ttl=600)
+        indexes = mock.patch.dict(image_cache._master_indexes, clear=True)
+        indexes.start()
+        self.addCleanup(indexes.stop)
 
-    @mock.patch.object(image_cache.ImageCache, '_clean_up_ensure_cache_size')
-    def test_clean_up_old_deleted(self, mock_clean_size):
-        mock_clean_size.return_value = None
+    def test_clean_up_old_deleted(self):
         files = [os.path.join(self.master_dir, str(i))
                  for i in range(2)]
         for filename in files:
@@ -164,17 +249,12 @@ class TestImageCacheCleanUp(base.TestCase):
         with mock.patch.object(time, 'time', lambda: new_current_time):
             self.cache.clean_up()
 
-        mock_clean_size.assert_called_once_with(mock.ANY, None)
-        survived = mock_clean_size.call_args[0][0]
-        self.assertEqual(1, len(survived))
-        self.assertEqual(files[0], survived[0][0])
-        # NOTE(dtantsur): do not compare milliseconds
-        self.assertEqual(int(new_current_time - 100), int(survived[0][1]))
-        self.assertEqual(int(new_current_time - 100),
-                         int(survived[0][2].st_mtime))
-
-    @mock.patch.object(image_cache.ImageCache, '_clean_up_ensure_cache_size')
-    def test_clean_up_old_with_amount(self, mock_clean_size):
+        self.assertTrue(os.path.exists(files[0]))
+        self.assertFalse(os.path.exists(files[1]))
+        index = image_cache._get_master_index(self.master_dir)
+        self.assertEqual(1, len(index))
+
+    def test_clean_up_old_with_amount(self):
         files = [os.path.join(self.master_dir, str(i))
                  for i in range(2)]
         for filename in files:
@@ -183,14 +263,11 @@ class TestImageCacheCleanUp(base.TestCase):
         with mock.patch.object(time, 'time', lambda: new_current_time):
             self.cache.clean_up(amount=1)
 
-        self.assertFalse(mock_clean_size.called)
         # Exactly one file is expected to be deleted
         self.assertTrue(any(os.path.exists(f) for f in files))
         self.assertFalse(all(os.path.exists(f) for f in files))
 
-    @mock.patch.object(image_cache.ImageCache, '_clean_up_ensure_cache_size')
-    def test_clean_up_files_with_links_untouched(self, mock_clean_size):
-        mock_clean_size.return_value = None
+    def test_clean_up_files_with_links_untouched(self):
         files = [os.path.join(self.master_dir, str(i))
                  for i in range(2)]
         for filename in files:
@@ -203,11 +280,8 @@ class TestImageCacheCleanUp(base.TestCase):
 
         for filename in files:
             self.assertTrue(os.path.exists(filename))
-        mock_clean_size.assert_called_once_with([], None)
 
-    @mock.patch.object(image_cache.ImageCache, '_clean_up_too_old')
-    def test_clean_up_ensure_cache_size(self, mock_clean_ttl):
-        mock_clean_ttl.side_effect = lambda *xx: xx
+    def test_clean_up_ensure_cache_size(self):
         # NOTE(dtantsur): Cache size in test is 10 bytes, we create 6 files
         # with 3 bytes each and expect 3 to be deleted
         files = [os.path.join(self.master_dir, str(i))
@@ -229,11 +303,7 @@ class TestImageCacheCleanUp(base.TestCase):
         for filename in files[3:]:
             self.assertFalse(os.path.exists(filename))
 
-        mock_clean_ttl.assert_called_once_with(mock.ANY, None)
-
-    @mock.patch.object(image_cache.ImageCache, '_clean_up_too_old')
-    def test_clean_up_ensure_cache_size_with_amount(self, mock_clean_ttl):
-        mock_clean_ttl.side_effect = lambda *xx: xx
+    def test_clean_up_ensure_cache_size_with_amount(self):
         # NOTE(dtantsur): Cache size in test is 10 bytes, we create 6 files
         # with 3 bytes each and set amount to be 15, 5 files are to be deleted
         files = [os.path.join(self.master_dir, str(i))
@@ -250,15 +320,11 @@ class TestImageCacheCleanUp(base.TestCase):
             self.cache.clean_up(amount=15)
 
         self.assertTrue(os.path.exists(files[0]))
-        for filename in files[5:]:
+        for filename in files[1:]:
             self.assertFalse(os.path.exists(filename))
 
-        mock_clean_ttl.assert_called_once_with(mock.ANY, 15)
-
     @mock.patch.object(image_cache.LOG, 'info')
-    @mock.patch.object(image_cache.ImageCache, '_clean_up_too_old')
-    def test_clean_up_cache_still_large(self, mock_clean_ttl, mock_log):
-        mock_clean_ttl.side_effect = lambda *xx: xx
+    def test_clean_up_cache_still_large(self, mock_log):
         # NOTE(dtantsur): Cache size in test is 10 bytes, we create 2 files
         # than cannot be deleted and expected this to be logged
         files = [os.path.join(self.master_dir, str(i))
@@ -273,7 +339,52 @@ class TestImageCacheCleanUp(base.TestCase):
         for filename in files:
             self.assertTrue(os.path.exists(filename))
         self.assertTrue(mock_log.called)
-        mock_clean_ttl.assert_called_once_with(mock.ANY, None)
+
+    def test_clean_up_lists_directory_once(self):
+        touch(os.path.join(self.master_dir, 'uuid'))
+        with mock.patch.object(os, 'listdir',
+                               side_effect=os.listdir) as mock_listdir:
+            self.cache.clean_up()
+            image_cache.ImageCache(self.master_dir, 10, 600).clean_up()
+            self.cache.clean_up(amount=1)
+        mock_listdir.assert_called_once_with(self.master_dir)
+
+    def test_clean_up_uses_recorded_use(self):
+        files = [os.path.join(self.master_dir, str(i))
+                 for i in range(4)]
+        for filename in files:
+            with open(filename, 'w') as fp:
+                fp.write('123')
+        index = image_cache._get_master_index(self.master_dir)
+        self.assertEqual(12, index.total_size)
+        # NOTE: the oldest file is used again, so the next one goes first
+        new_current_time = time.time() + 100
+        with mock.patch.object(time, 'time', lambda: new_current_time):
+            index.record_use('0')
+            self.cache.clean_up()
+
+        self.assertTrue(os.path.exists(files[0]))
+        self.assertEqual(1, len([f for f in files[1:]
+                                 if not os.path.exists(f)]))
+        self.assertEqual(9, index.total_size)
+
+    def test_clean_up_file_removed_outside(self):
+        filename = os.path.join(self.master_dir, 'uuid')
+        with open(filename, 'w') as fp:
+            fp.write('X' * 20)
+        index = image_cache._get_master_index(self.master_dir)
+        os.unlink(filename)
+        self.cache.clean_up()
+        self.assertEqual(0, len(index))
+        self.assertEqual(0, index.total_size)
+
+    def test_clean_up_nothing_to_do(self):
+        filename = os.path.join(self.master_dir, 'uuid')
+        touch(filename)
+        with mock.patch.object(os, 'unlink') as mock_unlink:
+            self.cache.clean_up()
+        self.assertFalse(mock_unlink.called)
+        self.assertTrue(os.path.exists(filename))
 
     @mock.patch.object(utils, 'rmtree_without_raise')
     @mock.patch.object(image_cache, '_fetch')
@@ -302,12 +413,7 @@ class TestImageCacheCleanUp(base.TestCase):
         self.assertTrue(mock_rmtree.called)
 
     @mock.patch.object(image_cache.LOG, 'warn')
-    @mock.patch.object(image_cache.ImageCache, '_clean_up_too_old')
-    @mock.patch.object(image_cache.ImageCache, '_clean_up_ensure_cache_size')
-    def test_clean_up_amount_not_satisfied(self, mock_clean_size,
-                                           mock_clean_ttl, mock_log):
-        mock_clean_ttl.side_effect = lambda *xx: xx
-        mock_clean_size.side_effect = lambda listing, amount: amount
+    def test_clean_up_amount_not_satisfied(self, mock_log):
         self.cache.clean_up(amount=15)
         self.assertTrue(mock_log.called)
 
@@ -340,6 +446,233 @@ class TestImageCacheCleanUp(base.TestCase):
         self.assertEqual(item_possibilities[0], third_item_actual)
 
 
+class TestMasterImageIndex(base.TestCase):
+
+    def setUp(self):
+        super(TestMasterImageIndex, self).setUp()
+        self.master_dir = tempfile.mkdtemp()
+        self.index = image_cache._MasterImageIndex(self.master_dir)
+
+    def test_no_eviction_while_referenced(self):
+        with self.index.reference('uuid'):
+            self.assertFalse(self.index.begin_eviction('uuid'))
+            self.assertTrue(self.index.begin_eviction('other'))
+        self.assertTrue(self.index.begin_eviction('uuid'))
+
+    def test_reference_waits_for_eviction(self):
+        events = []
+
+        def _link():
+            with self.index.reference('uuid'):
+                events.append('linked')
+
+        self.assertTrue(self.index.begin_eviction('uuid'))
+        thread = eventlet.spawn(_link)
+        eventlet.sleep(0)
+        events.append('evicted')
+        self.index.end_eviction('uuid', True)
+        thread.wait()
+        self.assertEqual(['evicted', 'linked'], events)
+
+    def test_end_eviction_removes(self):
+        self.index.record_use('uuid', size=10)
+        self.index.record_use('other', size=5)
+        self.assertTrue(self.index.begin_eviction('uuid'))
+        self.index.end_eviction('uuid', True)
+        self.assertEqual(1, len(self.index))
+        self.assertEqual(5, self.index.total_size)
+        self.assertEqual('other', self.index.pop_oldest()[0])
+        self.assertIsNone(self.index.pop_oldest())
+
+
+class TestImageCacheConcurrency(base.TestCase):
+
+    def setUp(self):
+        super(TestImageCacheConcurrency, self).setUp()
+        self.config(parallel_image_downloads=True)
+        self.master_dir = tempfile.mkdtemp()
+        self.dest_dir = tempfile.mkdtemp()
+        self.cache = image_cache.ImageCache(self.master_dir,
+                                            cache_size=0,
+                                            cache_ttl=0)
+        indexes = mock.patch.dict(image_cache._master_indexes, clear=True)
+        indexes.start()
+        self.addCleanup(indexes.stop)
+
+    @mock.patch.object(image_cache, '_fetch')
+    def test_parallel_fetch_and_evict(self, mock_fetch):
+        def _fake_fetch(ctx, href, path, *args):
+            eventlet.sleep(0)
+            with open(path, 'w') as fp:
+                fp.write(href)
+
+        mock_fetch.side_effect = _fake_fetch
+        images = ['image-%d' % i for i in range(5)]
+
+        linking = {}
+        real_link = os.link
+        real_unlink = os.unlink
+
+        def _fetch_image(i):
+            dest_path = os.path.join(self.dest_dir, str(i))
+            self.cache.fetch_image(images[i % len(images)], dest_path)
+            with open(dest_path) as fp:
+                self.assertEqual(images[i % len(images)], fp.read())
+            # NOTE: the node is torn down, the master image can go
+            real_unlink(dest_path)
+
+        fetchers = []
+
+        def _evict():
+            while not all(thread.dead for thread in fetchers):
+                self.cache.clean_up(amount=1024)
+                eventlet.sleep(0)
+
+        def _link(src, dst):
+            linking[src] = linking.get(src, 0) + 1
+            try:
+                eventlet.sleep(0)
+                return real_link(src, dst)
+            finally:
+                linking[src] -= 1
+
+        def _unlink(path):
+            self.assertFalse(linking.get(path),
+                             '%s deleted while being linked' % path)
+            eventlet.sleep(0)
+            return real_unlink(path)
+
+        pool = greenpool.GreenPool(200)
+        with mock.patch.object(os, 'link', _link):
+            with mock.patch.object(os, 'unlink', _unlink):
+                for i in range(100):
+                    fetchers.append(pool.spawn(_fetch_image, i))
+                evictors = [pool.spawn(_evict) for i in range(100)]
+                # NOTE: wait() re-raises errors of the green threads
+                for thread in fetchers + evictors:
+                    thread.wait()
+
+        self.assertEqual([], os.listdir(self.dest_dir))
+        index = image_cache._get_master_index(self.master_dir)
+        master_files = [f for f in os.listdir(self.master_dir)
+                        if os.path.isfile(os.path.join(self.master_dir, f))]
+        self.assertEqual(len(master_files), len(index))
+        self.assertEqual(sum(os.path.getsize(os.path.join(self.master_dir, f))
+                             for f in master_files),
+                         index.total_size)
+
+
+@mock.patch.object(image_cache, '_fetch')
+class TestSharedImages(base.TestCase):
+
+    def setUp(self):
+        super(TestSharedImages, self).setUp()
+        indexes = mock.patch.dict(image_cache._master_indexes, clear=True)
+        indexes.start()
+        self.addCleanup(indexes.stop)
+        shared = mock.patch.object(image_cache, '_shared_images',
+                                   image_cache._SharedImages())
+        shared.start()
+        self.addCleanup(shared.stop)
+        self.caches = [image_cache.ImageCache(tempfile.mkdtemp(),
+                                              cache_size=0, cache_ttl=0)
+                       for i in range(2)]
+        self.dest_dir = tempfile.mkdtemp()
+
+    def _fake_fetch(self, ctx, href, path, *args):
+        eventlet.sleep(0)
+        with open(path, 'w') as fp:
+            fp.write(href)
+
+    def _fetch(self, cache, name, force_raw=True, checksum=None):
+        dest_path = os.path.join(self.dest_dir, name)
+        with mock.patch.object(cache, 'clean_up'):
+            cache.fetch_image('uuid', dest_path, force_raw=force_raw,
+                              checksum=checksum)
+        with open(dest_path) as fp:
+            self.assertEqual('uuid', fp.read())
+        return dest_path
+
+    def _master_path(self, cache):
+        return os.path.join(cache.master_dir, 'uuid')
+
+    def test_linked_from_other_cache(self, mock_fetch):
+        def _fake_verified_fetch(*args):
+            self._fake_fetch(*args)
+            return True
+
+        mock_fetch.side_effect = _fake_verified_fetch
+        self._fetch(self.caches[0], 'dest0', checksum='abc')
+        self._fetch(self.caches[1], 'dest1', checksum='abc')
+        self.assertEqual(1, mock_fetch.call_count)
+        self.assertEqual('abc', image_cache._read_checksum(
+            self._master_path(self.caches[1])))
+        self.assertEqual(os.stat(self._master_path(self.caches[0])).st_ino,
+                         os.stat(self._master_path(self.caches[1])).st_ino)
+        index = image_cache._get_master_index(self.caches[1].master_dir)
+        self.assertEqual(4, index.total_size)
+
+    def test_other_cache_checksum_differs(self, mock_fetch):
+        def _fake_verified_fetch(*args):
+            self._fake_fetch(*args)
+            return True
+
+        mock_fetch.side_effect = _fake_verified_fetch
+        self._fetch(self.caches[0], 'dest0', checksum='abc')
+        self._fetch(self.caches[1], 'dest1', checksum='def')
+        self.assertEqual(2, mock_fetch.call_count)
+        self.assertEqual('abc', image_cache._read_checksum(
+            self._master_path(self.caches[0])))
+        self.assertEqual('def', image_cache._read_checksum(
+            self._master_path(self.caches[1])))
+
+    def test_raw_not_shared_with_original(self, mock_fetch):
+        mock_fetch.side_effect = self._fake_fetch
+        self._fetch(self.caches[0], 'dest0', force_raw=True)
+        self._fetch(self.caches[1], 'dest1', force_raw=False)
+        self.assertEqual(2, mock_fetch.call_count)
+
+    def test_copy_gone(self, mock_fetch):
+        mock_fetch.side_effect = self._fake_fetch
+        os.unlink(self._fetch(self.caches[0], 'dest0'))
+        os.unlink(self._master_path(self.caches[0]))
+        self._fetch(self.caches[1], 'dest1')
+        self.assertEqual(2, mock_fetch.call_count)
+
+    def test_parallel_fetch_single_download(self, mock_fetch):
+        self.config(parallel_image_downloads=True)
+        mock_fetch.side_effect = self._fake_fetch
+        pool = greenpool.GreenPool()
+        threads = [pool.spawn(self._fetch, self.caches[i % 2], str(i))
+                   for i in range(10)]
+        for thread in threads:
+            thread.wait()
+        self.assertEqual(1, mock_fetch.call_count)
+
+    def test_clean_up_copies(self, mock_fetch):
+        mock_fetch.side_effect = self._fake_fetch
+        os.unlink(self._fetch(self.caches[0], 'dest0'))
+        os.unlink(self._fetch(self.caches[1], 'dest1'))
+        index = image_cache._get_master_index(self.caches[0].master_dir)
+        # NOTE: the other copy stays, so no space is reclaimed
+        self.assertEqual(0, self.caches[0]._delete_master_image(
+            index, 'uuid', 4))
+        self.assertFalse(os.path.exists(self._master_path(self.caches[0])))
+        index = image_cache._get_master_index(self.caches[1].master_dir)
+        self.assertEqual(4, self.caches[1]._delete_master_image(
+            index, 'uuid', 4))
+        self.assertFalse(os.path.exists(self._master_path(self.caches[1])))
+
+    def test_clean_up_copy_in_use(self, mock_fetch):
+        mock_fetch.side_effect = self._fake_fetch
+        self._fetch(self.caches[0], 'dest0')
+        os.unlink(self._fetch(self.caches[1], 'dest1'))
+        # NOTE: links from nodes are not told apart between the caches
+        for cache in self.caches:
+            cache.clean_up()
+            self.assertTrue(os.path.exists(self._master_path(cache)))
+
+
 @mock.patch.object(image_cache, '_cache_cleanup_list')
 @mock.patch.object(os, 'statvfs')
 @mock.patch.object(image_service, 'Service')
@@ -372,6 +705,17 @@ class CleanupImageCacheTestCase(base.TestCase):
 
         mock_statvfs.assert_called_once_with('master_dir')
 
+    def test_no_clean_up_image_metas(self, mock_image_service, mock_statvfs,
+                                     cache_cleanup_list_mock):
+        mock_statvfs.return_value = mock.Mock(f_frsize=1, f_bavail=1024)
+        cache_cleanup_list_mock.__iter__.return_value = self.cache_cleanup_list
+
+        image_cache.clean_up_caches(None, 'master_dir', [('uuid', 'path')],
+                                    {'uuid': {'size': 42}})
+
+        self.assertFalse(mock_image_service.called)
+        self.assertFalse(self.mock_first_cache.return_value.clean_up.called)
+
     @mock.patch.object(os, 'stat')
     def test_one_clean_up(self, mock_stat, mock_image_service, mock_statvfs,
                           cache_cleanup_list_mock):
@@ -513,7 +857,67 @@ class TestFetchCleanup(base.TestCase):
         image_cache._fetch('fake', 'fake-uuid', '/foo/bar', force_raw=True)
         mock_fetch.assert_called_once_with('fake', 'fake-uuid',
                                            '/foo/bar.part', None,
-                                           force_raw=False)
+                                           force_raw=False,
+                                           format_callback=mock.ANY,
+                                           checksum=None)
         mock_clean.assert_called_once_with('/foo', 100)
         mock_raw.assert_called_once_with('fake-uuid', '/foo/bar',
                                          '/foo/bar.part')
+
+    @mock.patch.object(images, 'converted_size')
+    @mock.patch.object(images, 'fetch')
+    @mock.patch.object(images, 'image_to_raw')
+    @mock.patch.object(image_cache, '_clean_up_caches')
+    def test__fetch_raw_detected(self, mock_clean, mock_raw, mock_fetch,
+                                 mock_size):
+        mock_fetch.side_effect = (
+            lambda *args, **kwargs: kwargs['format_callback']('raw', None))
+        image_cache._fetch('fake', 'fake-uuid', '/foo/bar', force_raw=True)
+        self.assertFalse(mock_size.called)
+        self.assertFalse(mock_clean.called)
+        mock_raw.assert_called_once_with('fake-uuid', '/foo/bar',
+                                         '/foo/bar.part')
+
+    @mock.patch.object(images, 'converted_size')
+    @mock.patch.object(images, 'fetch')
+    @mock.patch.object(images, 'image_to_raw')
+    @mock.patch.object(image_cache, '_clean_up_caches')
+    def test__fetch_qcow2_detected(self, mock_clean, mock_raw, mock_fetch,
+                                   mock_size):
+        mock_fetch.side_effect = (
+            lambda *args, **kwargs: kwargs['format_callback']('qcow2', 200))
+        image_cache._fetch('fake', 'fake-uuid', '/foo/bar', force_raw=True)
+        self.assertFalse(mock_size.called)
+        mock_clean.assert_called_once_with('/foo', 200)
+        mock_raw.assert_called_once_with('fake-uuid', '/foo/bar',
+                                         '/foo/bar.part')
+
+    @mock.patch.object(images, 'converted_size')
+    @mock.patch.object(images, 'fetch')
+    @mock.patch.object(images, 'image_to_raw')
+    @mock.patch.object(image_cache, '_clean_up_caches')
+    def test__fetch_other_format_detected(self, mock_clean, mock_raw,
+                                          mock_fetch, mock_size):
+        mock_size.return_value = 100
+        mock_fetch.side_effect = (
+            lambda *args, **kwargs: kwargs['format_callback']('vmdk', None))
+        image_cache._fetch('fake', 'fake-uuid', '/foo/bar', force_raw=True)
+        mock_size.assert_called_once_with('/foo/bar.part')
+        mock_clean.assert_called_once_with('/foo', 100)
+
+    @mock.patch.object(os, 'rename')
+    @mock.patch.object(images, 'fetch')
+    def test__fetch_no_raw(self, mock_fetch, mock_rename):
+        image_cache._fetch('fake', 'fake-uuid', '/foo/bar', force_raw=False)
+        mock_fetch.assert_called_once_with('fake', 'fake-uuid',
+                                           '/foo/bar.part', None,
+                                           force_raw=False,
+                                           format_callback=None,
+                                           checksum=None)
+        mock_rename.assert_called_once_with('/foo/bar.part', '/foo/bar')
+
+    @mock.patch.object(os, 'rename')
+    @mock.patch.object(images, 'fetch')
+    def test__fetch_returns_verified(self, mock_fetch, mock_rename):
+        mock_fetch.return_value = True
+        self.assertTrue(image_cache._fetch('fake', 'fake-uuid', '/foo/bar'))
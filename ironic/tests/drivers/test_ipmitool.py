@@ -20,10 +20,14 @@
 """Test class for IPMITool driver module."""
 
 import os
+import signal
 import stat
+import sys
 import tempfile
 import time
 
+import eventlet
+from eventlet import greenpool
 import mock
 from oslo.config import cfg
 from oslo_concurrency import processutils
@@ -220,6 +224,10 @@ class IPMIToolPrivateMethodTestCase(db_base.DbTestCase):
                 driver='fake_ipmitool',
                 driver_info=INFO_DICT)
         self.info = ipmi._parse_driver_info(self.node)
+        scheduler_patch = mock.patch.object(ipmi, '_COMMAND_SCHEDULER',
+                                            ipmi._BMCCommandScheduler())
+        scheduler_patch.start()
+        self.addCleanup(scheduler_patch.stop)
 
     def test__make_password_file(self, mock_sleep):
         with ipmi._make_password_file(self.info.get('password')) as pw_file:
@@ -432,7 +440,6 @@ class IPMIToolPrivateMethodTestCase(db_base.DbTestCase):
     @mock.patch.object(utils, 'execute', autospec=True)
     def test__exec_ipmitool_first_call_to_address(self, mock_exec, mock_pwf,
             mock_support, mock_sleep):
-        ipmi.LAST_CMD_TIME = {}
         pw_file_handle = tempfile.NamedTemporaryFile()
         pw_file = pw_file_handle.name
         file_handle = open(pw_file, "w")
@@ -462,7 +469,6 @@ class IPMIToolPrivateMethodTestCase(db_base.DbTestCase):
     @mock.patch.object(utils, 'execute', autospec=True)
     def test__exec_ipmitool_second_call_to_address_sleep(self, mock_exec,
             mock_pwf, mock_support, mock_sleep):
-        ipmi.LAST_CMD_TIME = {}
         pw_file_handle1 = tempfile.NamedTemporaryFile()
         pw_file1 = pw_file_handle1.name
         file_handle1 = open(pw_file1, "w")
@@ -507,7 +513,6 @@ class IPMIToolPrivateMethodTestCase(db_base.DbTestCase):
     @mock.patch.object(utils, 'execute', autospec=True)
     def test__exec_ipmitool_second_call_to_address_no_sleep(self, mock_exec,
             mock_pwf, mock_support, mock_sleep):
-        ipmi.LAST_CMD_TIME = {}
         pw_file_handle1 = tempfile.NamedTemporaryFile()
         pw_file1 = pw_file_handle1.name
         file_handle1 = open(pw_file1, "w")
@@ -542,8 +547,8 @@ class IPMIToolPrivateMethodTestCase(db_base.DbTestCase):
         ipmi._exec_ipmitool(self.info, 'A B C')
         mock_exec.assert_called_with(*args[0])
         # act like enough time has passed
-        ipmi.LAST_CMD_TIME[self.info['address']] = (time.time() -
-                CONF.ipmi.min_command_interval)
+        queue = ipmi._COMMAND_SCHEDULER._queues[self.info['address']]
+        queue.last_cmd_time -= CONF.ipmi.min_command_interval
         ipmi._exec_ipmitool(self.info, 'D E F')
         self.assertFalse(mock_sleep.called)
         self.assertEqual(expected, mock_support.call_args_list)
@@ -554,7 +559,6 @@ class IPMIToolPrivateMethodTestCase(db_base.DbTestCase):
     @mock.patch.object(utils, 'execute', autospec=True)
     def test__exec_ipmitool_two_calls_to_diff_address(self, mock_exec,
             mock_pwf, mock_support, mock_sleep):
-        ipmi.LAST_CMD_TIME = {}
         pw_file_handle1 = tempfile.NamedTemporaryFile()
         pw_file1 = pw_file_handle1.name
         file_handle1 = open(pw_file1, "w")
@@ -792,6 +796,52 @@ class IPMIToolPrivateMethodTestCase(db_base.DbTestCase):
         mock_pwf.assert_called_once_with(self.info['password'])
         mock_exec.assert_called_once_with(*args)
 
+    @mock.patch.object(ipmi, '_is_option_supported', return_value=False)
+    @mock.patch.object(ipmi._SHELL_SESSIONS, 'execute', autospec=True)
+    @mock.patch.object(utils, 'execute', autospec=True)
+    def test__exec_ipmitool_with_shell_sessions(self, mock_exec,
+            mock_shell_exec, mock_support, mock_sleep):
+        self.config(use_shell_sessions=True, group='ipmi')
+        args = [
+            'ipmitool',
+            '-I', 'lanplus',
+            '-H', self.info['address'],
+            '-L', self.info['priv_level'],
+            '-U', self.info['username'],
+            ]
+        mock_shell_exec.return_value = ('out', 'err')
+
+        self.assertEqual(('out', 'err'),
+                         ipmi._exec_ipmitool(self.info, 'power status'))
+
+        mock_shell_exec.assert_called_once_with(args, self.info['password'],
+                                                'power status')
+        self.assertFalse(mock_exec.called)
+        self.assertFalse(mock_sleep.called)
+        self.assertIn(self.info['address'],
+                      ipmi._COMMAND_SCHEDULER._queues)
+
+    @mock.patch.object(ipmi, '_is_option_supported', return_value=False)
+    @mock.patch.object(ipmi, '_make_password_file', autospec=True)
+    @mock.patch.object(ipmi._SHELL_SESSIONS, 'execute', autospec=True)
+    @mock.patch.object(utils, 'execute', autospec=True)
+    def test__exec_ipmitool_with_shell_sessions_state_change(self,
+            mock_exec, mock_shell_exec, mock_pwf, mock_support, mock_sleep):
+        # commands changing the state of the node are not sent to the
+        # shell, as only the exit status of ipmitool reliably reports
+        # their failure
+        self.config(use_shell_sessions=True, group='ipmi')
+        mock_pwf.return_value = mock.MagicMock()
+        mock_exec.return_value = ('out', 'err')
+
+        for command in ('power on', 'chassis bootdev pxe', 'raw 0x00 0x01',
+                        'sdrx'):
+            self.assertEqual(('out', 'err'),
+                             ipmi._exec_ipmitool(self.info, command))
+
+        self.assertEqual(4, mock_exec.call_count)
+        self.assertFalse(mock_shell_exec.called)
+
     @mock.patch.object(ipmi, '_exec_ipmitool', autospec=True)
     def test__power_status_on(self, mock_exec, mock_sleep):
         mock_exec.return_value = ["Chassis Power is on\n", None]
@@ -849,6 +899,238 @@ class IPMIToolPrivateMethodTestCase(db_base.DbTestCase):
         self.assertEqual(states.ERROR, state)
 
 
+FAKE_IPMITOOL_SHELL = """
+import sys
+
+# The password file must be readable when the shell starts.
+with open(sys.argv[sys.argv.index('-f') + 1]) as f:
+    f.read()
+
+power = 'off'
+hang = False
+while True:
+    sys.stdout.write('ipmitool> ')
+    sys.stdout.flush()
+    command = sys.stdin.readline().strip()
+    if not command or (command == 'exit' and not hang):
+        break
+    elif command == 'power status':
+        sys.stdout.write('Chassis Power is %s\\n' % power)
+    elif command == 'power on':
+        power = 'on'
+        sys.stdout.write('Chassis Power Control: Up/On\\n')
+    elif command == 'chassis bootparam get 5':
+        sys.stdout.write('Boot parameter version: 1\\n')
+        sys.stderr.write('Get Chassis Boot Parameter 5 failed: '
+                         'Invalid data field in request\\n')
+    elif command == 'sdr -v':
+        sys.stderr.write('Get HPM.x Capabilities request failed, '
+                         'compcode = d4\\n')
+        sys.stdout.write('Sensor ID : Temp (0x1)\\n')
+    elif command == 'hang':
+        hang = True
+    elif command == 'crash':
+        sys.exit(1)
+    else:
+        sys.stderr.write('Invalid command: %s\\n' % command)
+        sys.stderr.flush()
+"""
+
+
+class IPMIToolShellSessionTestCase(base.TestCase):
+
+    def setUp(self):
+        super(IPMIToolShellSessionTestCase, self).setUp()
+        script = tempfile.NamedTemporaryFile(suffix='.py', delete=False)
+        script.write(FAKE_IPMITOOL_SHELL)
+        script.close()
+        self.addCleanup(os.unlink, script.name)
+        self.args = [sys.executable, script.name]
+        self.pool = ipmi._IPMIShellSessionPool()
+        self.addCleanup(self.pool.close_all)
+
+    def _wait(self, proc):
+        # the shells are stopped by a greenthread, which a blocking
+        # proc.wait() would never let run
+        for i in range(50):
+            if proc.poll() is not None:
+                break
+            eventlet.sleep(0.1)
+        return proc.returncode
+
+    def test_execute(self):
+        self.assertEqual(('Chassis Power is off\n', ''),
+                         self.pool.execute(self.args, 'pw', 'power status'))
+        self.pool.execute(self.args, 'pw', 'power on')
+        self.assertEqual(('Chassis Power is on\n', ''),
+                         self.pool.execute(self.args, 'pw', 'power status'))
+
+    def test_execute_reuses_session(self):
+        self.pool.execute(self.args, 'pw', 'power status')
+        session = self.pool._get_session((tuple(self.args), 'pw'),
+                                         self.args, 'pw')
+        pid = session._proc.pid
+        self.pool.execute(self.args, 'pw', 'power status')
+        self.assertEqual(pid, session._proc.pid)
+        self.assertEqual(1, len(self.pool._sessions))
+
+    def test_execute_different_credentials(self):
+        self.pool.execute(self.args, 'pw', 'power status')
+        self.pool.execute(self.args, 'other', 'power status')
+        self.assertEqual(2, len(self.pool._sessions))
+
+    def test_execute_command_error(self):
+        exc = self.assertRaises(processutils.ProcessExecutionError,
+                                self.pool.execute, self.args, 'pw', 'junk')
+        self.assertEqual('Invalid command: junk\n', exc.stderr)
+        # the shell survives a failed command
+        self.assertEqual(('Chassis Power is off\n', ''),
+                         self.pool.execute(self.args, 'pw', 'power status'))
+
+    def test_execute_command_error_with_output(self):
+        exc = self.assertRaises(processutils.ProcessExecutionError,
+                                self.pool.execute, self.args, 'pw',
+                                'chassis bootparam get 5')
+        self.assertEqual('Boot parameter version: 1\n', exc.stdout)
+
+    def test_execute_command_warning(self):
+        out, err = self.pool.execute(self.args, 'pw', 'sdr -v')
+        self.assertEqual('Sensor ID : Temp (0x1)\n', out)
+        self.assertIn('HPM.x', err)
+
+    def test_execute_restarts_dead_shell(self):
+        self.pool.execute(self.args, 'pw', 'power on')
+        session = self.pool._get_session((tuple(self.args), 'pw'),
+                                         self.args, 'pw')
+        session._proc.kill()
+        session._proc.wait()
+        # a new shell, talking to the BMC from scratch
+        self.assertEqual(('Chassis Power is off\n', ''),
+                         self.pool.execute(self.args, 'pw', 'power status'))
+        self.assertTrue(session.is_alive())
+
+    @mock.patch.object(ipmi.LOG, 'warning')
+    def test_execute_shell_keeps_crashing(self, mock_log):
+        self.assertRaises(processutils.ProcessExecutionError,
+                          self.pool.execute, self.args, 'pw', 'crash')
+        self.assertEqual(1, mock_log.call_count)
+
+    def test_execute_start_failure(self):
+        self.assertRaises(processutils.ProcessExecutionError,
+                          self.pool.execute, ['/nonexistent/ipmitool'],
+                          'pw', 'power status')
+
+    def test_idle_sessions_evicted(self):
+        self.config(shell_session_idle_timeout=60, group='ipmi')
+        self.pool.execute(self.args, 'pw', 'power status')
+        session = self.pool._sessions[(tuple(self.args), 'pw')]
+        proc = session._proc
+        session.last_used -= 61
+
+        self.pool.execute(self.args, 'other', 'power status')
+
+        self.assertEqual([(tuple(self.args), 'other')],
+                         list(self.pool._sessions))
+        self.assertEqual(0, self._wait(proc))
+
+    def test_close_does_not_wait(self):
+        self.pool.execute(self.args, 'pw', 'hang')
+        session = self.pool._sessions[(tuple(self.args), 'pw')]
+        proc = session._proc
+
+        start = time.time()
+        session.close()
+        self.assertLess(time.time() - start, 0.5)
+        self.assertFalse(session.is_alive())
+
+        # the shell ignores exit, and is killed in the background
+        self.assertIsNone(proc.poll())
+        self.assertEqual(-signal.SIGKILL, self._wait(proc))
+
+
+class IPMIToolCommandSchedulerTestCase(base.TestCase):
+
+    def setUp(self):
+        super(IPMIToolCommandSchedulerTestCase, self).setUp()
+        self.config(min_command_interval=0, group='ipmi')
+        self.scheduler = ipmi._BMCCommandScheduler(max_addresses=2)
+
+    def test_command_same_address_in_order(self):
+        events = []
+
+        def _command(i):
+            with self.scheduler.command('1.2.3.4'):
+                events.append(('start', i))
+                eventlet.sleep(0)
+                events.append(('end', i))
+
+        pool = greenpool.GreenPool()
+        for i in range(3):
+            pool.spawn_n(_command, i)
+        pool.waitall()
+
+        self.assertEqual([('start', 0), ('end', 0), ('start', 1), ('end', 1),
+                          ('start', 2), ('end', 2)], events)
+
+    @mock.patch.object(time, 'sleep')
+    def test_command_waits_for_min_command_interval(self, mock_sleep):
+        self.config(min_command_interval=5, group='ipmi')
+        with self.scheduler.command('1.2.3.4'):
+            pass
+        self.assertFalse(mock_sleep.called)
+        with self.scheduler.command('1.2.3.4'):
+            pass
+        self.assertEqual(1, mock_sleep.call_count)
+        self.assertTrue(0 < mock_sleep.call_args[0][0] <= 5)
+
+    @mock.patch.object(time, 'sleep')
+    def test_command_different_addresses_do_not_wait(self, mock_sleep):
+        self.config(min_command_interval=5, group='ipmi')
+        with self.scheduler.command('1.2.3.4'):
+            with self.scheduler.command('5.6.7.8'):
+                pass
+        self.assertFalse(mock_sleep.called)
+
+    def test_command_releases_on_error(self):
+        def _command():
+            with self.scheduler.command('1.2.3.4'):
+                raise ValueError()
+
+        self.assertRaises(ValueError, _command)
+        queue = self.scheduler._queues['1.2.3.4']
+        self.assertFalse(queue.busy)
+        self.assertEqual(0, queue.users)
+
+    def test_idle_addresses_evicted(self):
+        for address in ('1.1.1.1', '2.2.2.2', '3.3.3.3'):
+            with self.scheduler.command(address):
+                pass
+        self.assertEqual(['2.2.2.2', '3.3.3.3'],
+                         list(self.scheduler._queues))
+
+    def test_recently_used_address_not_evicted(self):
+        for address in ('1.1.1.1', '2.2.2.2', '1.1.1.1', '3.3.3.3'):
+            with self.scheduler.command(address):
+                pass
+        self.assertEqual(['1.1.1.1', '3.3.3.3'],
+                         list(self.scheduler._queues))
+
+    def test_busy_address_not_evicted(self):
+        with self.scheduler.command('1.1.1.1'):
+            for address in ('2.2.2.2', '3.3.3.3'):
+                with self.scheduler.command(address):
+                    pass
+        self.assertEqual(['1.1.1.1', '3.3.3.3'],
+                         list(self.scheduler._queues))
+
+    def test_address_within_min_command_interval_not_evicted(self):
+        self.config(min_command_interval=5, group='ipmi')
+        for address in ('1.1.1.1', '2.2.2.2', '3.3.3.3'):
+            with self.scheduler.command(address):
+                pass
+        self.assertEqual(3, len(self.scheduler._queues))
+
+
 class IPMIToolDriverTestCase(db_base.DbTestCase):
 
     def setUp(self):
@@ -198,6 +198,13 @@ class SSHPrivateMethodsTestCase(db_base.DbTestCase):
                         driver='fake_ssh',
                         driver_info=db_utils.get_test_ssh_info())
         self.sshclient = paramiko.SSHClient()
+        vm_indexes_patch = mock.patch.dict(ssh._VM_INDEXES, clear=True)
+        vm_indexes_patch.start()
+        self.addCleanup(vm_indexes_patch.stop)
+        pool_patch = mock.patch.object(utils, '_SSH_CONNECTION_POOL',
+                                       utils.SSHConnectionPool())
+        pool_patch.start()
+        self.addCleanup(pool_patch.stop)
 
     @mock.patch.object(utils, 'ssh_connect')
     def test__get_connection_client(self, ssh_connect_mock):
@@ -335,7 +342,9 @@ class SSHPrivateMethodsTestCase(db_base.DbTestCase):
         info = ssh._parse_driver_info(self.node)
         info['macs'] = ["11:11:11:11:11:11", "22:22:22:22:22:22"]
         exec_ssh_mock.side_effect = [('NodeName', ''),
-                                          ('52:54:00:cf:2d:31', '')]
+                                     ('52:54:00:cf:2d:31', ''),
+                                     ('NodeName', ''),
+                                     ('52:54:00:cf:2d:31', '')]
 
         ssh_cmd = "%s %s" % (info['cmd_set']['base_cmd'],
                              info['cmd_set']['list_all'])
@@ -344,8 +353,9 @@ class SSHPrivateMethodsTestCase(db_base.DbTestCase):
                                  info['cmd_set']['get_node_macs'])
 
         cmd_to_exec = cmd_to_exec.replace('{_NodeName_}', 'NodeName')
+        # the MAC addresses of every VM are queried again before giving up
         expected = [mock.call(self.sshclient, ssh_cmd),
-                    mock.call(self.sshclient, cmd_to_exec)]
+                    mock.call(self.sshclient, cmd_to_exec)] * 2
 
         found_name = ssh._get_hosts_name_for_node(self.sshclient, info)
 
@@ -374,6 +384,115 @@ class SSHPrivateMethodsTestCase(db_base.DbTestCase):
                           info)
         self.assertEqual(expected, exec_ssh_mock.call_args_list)
 
+    def _get_node_macs_cmd(self, info, name):
+        cmd_to_exec = "%s %s" % (info['cmd_set']['base_cmd'],
+                                 info['cmd_set']['get_node_macs'])
+        return cmd_to_exec.replace('{_NodeName_}', name)
+
+    @mock.patch.object(processutils, 'ssh_execute')
+    def test__get_hosts_name_for_node_cached(self, exec_ssh_mock):
+        info = ssh._parse_driver_info(self.node)
+        info['macs'] = ["52:54:00:cf:2d:31"]
+        exec_ssh_mock.side_effect = [('Node1\nNodeName', ''),
+                                     ('52:54:00:cf:2d:30', ''),
+                                     ('52:54:00:cf:2d:31', ''),
+                                     ('52:54:00:cf:2d:31', '')]
+
+        self.assertEqual('NodeName',
+                         ssh._get_hosts_name_for_node(self.sshclient, info))
+        exec_ssh_mock.reset_mock()
+        self.assertEqual('NodeName',
+                         ssh._get_hosts_name_for_node(self.sshclient, info))
+
+        # only the MACs of the cached VM are checked again
+        exec_ssh_mock.assert_called_once_with(
+            self.sshclient, self._get_node_macs_cmd(info, 'NodeName'))
+
+    @mock.patch.object(processutils, 'ssh_execute')
+    def test__get_hosts_name_for_node_shared_by_nodes(self, exec_ssh_mock):
+        info = ssh._parse_driver_info(self.node)
+        info['macs'] = ["52:54:00:cf:2d:31"]
+        exec_ssh_mock.side_effect = [('Node1\nNodeName', ''),
+                                     ('52:54:00:cf:2d:30', ''),
+                                     ('52:54:00:cf:2d:31', ''),
+                                     ('52:54:00:cf:2d:30', '')]
+        ssh._get_hosts_name_for_node(self.sshclient, info)
+        exec_ssh_mock.reset_mock()
+
+        info['macs'] = ["52:54:00:cf:2d:30"]
+        self.assertEqual('Node1',
+                         ssh._get_hosts_name_for_node(self.sshclient, info))
+        exec_ssh_mock.assert_called_once_with(
+            self.sshclient, self._get_node_macs_cmd(info, 'Node1'))
+
+    @mock.patch.object(processutils, 'ssh_execute')
+    def test__get_hosts_name_for_node_stale_cache(self, exec_ssh_mock):
+        info = ssh._parse_driver_info(self.node)
+        info['macs'] = ["52:54:00:cf:2d:31"]
+        list_cmd = "%s %s" % (info['cmd_set']['base_cmd'],
+                              info['cmd_set']['list_all'])
+        exec_ssh_mock.side_effect = [('Node1\nNodeName', ''),
+                                     ('52:54:00:cf:2d:30', ''),
+                                     ('52:54:00:cf:2d:31', ''),
+                                     processutils.ProcessExecutionError,
+                                     ('Node1\nNewName', ''),
+                                     ('52:54:00:cf:2d:31', '')]
+        ssh._get_hosts_name_for_node(self.sshclient, info)
+        exec_ssh_mock.reset_mock()
+
+        self.assertEqual('NewName',
+                         ssh._get_hosts_name_for_node(self.sshclient, info))
+
+        # Node1 is still known, only the new VM is queried
+        expected = [mock.call(self.sshclient,
+                              self._get_node_macs_cmd(info, 'NodeName')),
+                    mock.call(self.sshclient, list_cmd),
+                    mock.call(self.sshclient,
+                              self._get_node_macs_cmd(info, 'NewName'))]
+        self.assertEqual(expected, exec_ssh_mock.call_args_list)
+        index = ssh._get_vm_index(info)
+        self.assertEqual(['Node1', 'NewName'],
+                         sorted(index.macs_by_name, reverse=True))
+
+    @mock.patch.object(processutils, 'ssh_execute')
+    def test__get_hosts_name_for_node_name_reused(self, exec_ssh_mock):
+        info = ssh._parse_driver_info(self.node)
+        info['macs'] = ["52:54:00:cf:2d:31"]
+        list_cmd = "%s %s" % (info['cmd_set']['base_cmd'],
+                              info['cmd_set']['list_all'])
+        exec_ssh_mock.side_effect = [('Node1', ''),
+                                     ('Node1', ''),
+                                     ('52:54:00:cf:2d:31', '')]
+        ssh._get_vm_index(info).add('Node1', set(['525400cf2d30']))
+
+        # Node1 was redefined with the MAC address of the node
+        self.assertEqual('Node1',
+                         ssh._get_hosts_name_for_node(self.sshclient, info))
+
+        expected = [mock.call(self.sshclient, list_cmd),
+                    mock.call(self.sshclient, list_cmd),
+                    mock.call(self.sshclient,
+                              self._get_node_macs_cmd(info, 'Node1'))]
+        self.assertEqual(expected, exec_ssh_mock.call_args_list)
+        index = ssh._get_vm_index(info)
+        self.assertEqual({'Node1': set(['525400cf2d31'])},
+                         index.macs_by_name)
+
+    @mock.patch.object(processutils, 'ssh_execute')
+    def test__get_power_statuses_name_reused(self, exec_ssh_mock):
+        info = ssh._parse_driver_info(self.node)
+        exec_ssh_mock.side_effect = [('Node1', ''),
+                                     ('"Node1"', ''),
+                                     ('Node1', ''),
+                                     ('52:54:00:cf:2d:31', '')]
+        ssh._get_vm_index(info).add('Node1', set(['525400cf2d30']))
+
+        self.assertEqual(
+            {'node-uuid': states.POWER_ON},
+            ssh._get_power_statuses(self.sshclient, info,
+                                    {'node-uuid': ['52:54:00:cf:2d:31']}))
+        self.assertEqual(4, exec_ssh_mock.call_count)
+
     @mock.patch.object(processutils, 'ssh_execute')
     @mock.patch.object(ssh, '_get_power_status')
     @mock.patch.object(ssh, '_get_hosts_name_for_node')
@@ -581,6 +700,13 @@ class SSHDriverTestCase(db_base.DbTestCase):
         self.port = obj_utils.create_test_port(self.context,
                                                node_id=self.node.id)
         self.sshclient = paramiko.SSHClient()
+        vm_indexes_patch = mock.patch.dict(ssh._VM_INDEXES, clear=True)
+        vm_indexes_patch.start()
+        self.addCleanup(vm_indexes_patch.stop)
+        pool_patch = mock.patch.object(utils, '_SSH_CONNECTION_POOL',
+                                       utils.SSHConnectionPool())
+        pool_patch.start()
+        self.addCleanup(pool_patch.stop)
 
     @mock.patch.object(utils, 'ssh_connect')
     def test__validate_info_ssh_connect_failed(self, ssh_connect_mock):
@@ -940,6 +1066,87 @@ class SSHDriverTestCase(db_base.DbTestCase):
                         "echo '\"%(node)s\"' || true") % {'node': nodename}
         mock_exc.assert_called_once_with(mock.ANY, expected_cmd)
 
+    def _create_second_node(self):
+        node = obj_utils.create_test_node(
+                self.context, id=2, uuid=utils.generate_uuid(),
+                driver='fake_ssh', driver_info=db_utils.get_test_ssh_info())
+        obj_utils.create_test_port(self.context, id=2, node_id=node.id,
+                                   uuid=utils.generate_uuid(),
+                                   address='52:54:00:cf:2d:32')
+        return node
+
+    def _fake_ssh_execute(self, vms, running):
+        def _execute(ssh_obj, cmd):
+            if cmd.endswith('list runningvms'):
+                return ['"%s" {fake-uuid}' % vm for vm in running]
+            if 'list vms' in cmd:
+                return list(vms) + ['']
+            for vm, mac in vms.items():
+                if (' %s ' % vm) in cmd:
+                    return [mac, '']
+        return _execute
+
+    @mock.patch.object(ssh, '_get_connection')
+    @mock.patch.object(ssh, '_ssh_execute')
+    def test_get_power_states(self, mock_exc, mock_get_conn):
+        node2 = self._create_second_node()
+        mock_get_conn.return_value = self.sshclient
+        mock_exc.side_effect = self._fake_ssh_execute(
+                {'vm1': self.port.address, 'vm2': '52:54:00:cf:2d:32'},
+                ['vm2'])
+
+        with task_manager.acquire(self.context, self.node.uuid) as task1:
+            with task_manager.acquire(self.context, node2.uuid) as task2:
+                power_states = self.driver.power.get_power_states(
+                        [task1, task2])
+
+        self.assertEqual({self.node.uuid: states.POWER_OFF,
+                          node2.uuid: states.POWER_ON}, power_states)
+        running_calls = [c for c in mock_exc.call_args_list
+                         if c[0][1].endswith('list runningvms')]
+        self.assertEqual(1, len(running_calls))
+        mock_get_conn.assert_called_once_with(mock.ANY)
+
+    @mock.patch.object(ssh, '_get_connection')
+    @mock.patch.object(ssh, '_ssh_execute')
+    def test_get_power_states_node_not_found(self, mock_exc, mock_get_conn):
+        node2 = self._create_second_node()
+        mock_get_conn.return_value = self.sshclient
+        mock_exc.side_effect = self._fake_ssh_execute(
+                {'vm1': self.port.address}, ['vm1'])
+
+        with task_manager.acquire(self.context, self.node.uuid) as task1:
+            with task_manager.acquire(self.context, node2.uuid) as task2:
+                power_states = self.driver.power.get_power_states(
+                        [task1, task2])
+
+        self.assertEqual(states.POWER_ON, power_states[self.node.uuid])
+        self.assertIsInstance(power_states[node2.uuid],
+                              exception.NodeNotFound)
+
+    @mock.patch.object(ssh, '_get_connection')
+    def test_get_power_states_connect_failed(self, mock_get_conn):
+        node2 = self._create_second_node()
+        error = exception.SSHConnectFailed(host='1.2.3.4')
+        mock_get_conn.side_effect = error
+
+        with task_manager.acquire(self.context, self.node.uuid) as task1:
+            with task_manager.acquire(self.context, node2.uuid) as task2:
+                power_states = self.driver.power.get_power_states(
+                        [task1, task2])
+
+        self.assertEqual({self.node.uuid: error, node2.uuid: error},
+                         power_states)
+
+    @mock.patch.object(ssh.SSHPower, 'get_power_state')
+    def test_get_power_states_vmware(self, mock_get_power):
+        mock_get_power.return_value = states.POWER_ON
+        with task_manager.acquire(self.context, self.node.uuid) as task:
+            task.node['driver_info']['ssh_virt_type'] = 'vmware'
+            power_states = self.driver.power.get_power_states([task])
+        self.assertEqual({self.node.uuid: states.POWER_ON}, power_states)
+        mock_get_power.assert_called_once_with(task)
+
     def test_management_interface_validate_good(self):
         with task_manager.acquire(self.context, self.node.uuid) as task:
             task.driver.management.validate(task)
@@ -47,7 +47,7 @@ class TestNodeObject(base.DbTestCase):
 
             node = objects.Node.get(self.context, uuid)
 
-            mock_get_node.assert_called_once_with(uuid)
+            mock_get_node.assert_called_once_with(uuid, use_slave=False)
             self.assertEqual(self.context, node._context)
 
     def test_get_bad_id_and_uuid(self):
@@ -66,16 +66,67 @@ class TestNodeObject(base.DbTestCase):
                 n.properties = {"fake": "property"}
                 n.save()
 
-                mock_get_node.assert_called_once_with(uuid)
+                mock_get_node.assert_called_once_with(uuid, use_slave=False)
                 mock_update_node.assert_called_once_with(
                         uuid, {'properties': {"fake": "property"}})
                 self.assertEqual(self.context, n._context)
 
+    def test_save_scalar_fields(self):
+        uuid = self.fake_node['uuid']
+        with mock.patch.object(self.dbapi, 'get_node_by_uuid',
+                               autospec=True) as mock_get_node:
+            mock_get_node.return_value = dict(self.fake_node, version_id=3)
+            with mock.patch.object(self.dbapi, 'update_node_columns',
+                                   autospec=True) as mock_update_columns:
+                mock_update_columns.return_value = 4
+
+                n = objects.Node.get(self.context, uuid)
+                n.power_state = 'power on'
+                n.save()
+
+                mock_update_columns.assert_called_once_with(
+                        uuid, {'power_state': 'power on'}, 3)
+                self.assertEqual(4, n.version_id)
+                self.assertEqual({}, n.obj_get_changes())
+
+    def test_save_without_version_id(self):
+        uuid = self.fake_node['uuid']
+        with mock.patch.object(self.dbapi, 'update_node',
+                               autospec=True) as mock_update_node:
+            mock_update_node.return_value = dict(self.fake_node,
+                                                 version_id=4)
+            n = objects.Node(self.context)
+            n.uuid = uuid
+            n.power_state = 'power on'
+            n.save()
+
+            mock_update_node.assert_called_once_with(
+                    uuid, {'uuid': uuid, 'power_state': 'power on'})
+            self.assertEqual(4, n.version_id)
+
+    def test_save_conflict(self):
+        node = utils.create_test_node()
+        first = objects.Node.get(self.context, node.uuid)
+        second = objects.Node.get(self.context, node.uuid)
+
+        first.power_state = 'power on'
+        first.save()
+        # saved from a copy of the node loaded before the first save
+        second.power_state = 'power off'
+        self.assertRaises(exception.NodeUpdateConflict, second.save)
+
+        self.assertEqual('power on',
+                         objects.Node.get(self.context, node.uuid).power_state)
+        # the first copy is still up to date
+        first.target_power_state = 'power off'
+        first.save()
+
     def test_refresh(self):
         uuid = self.fake_node['uuid']
         returns = [dict(self.fake_node, properties={"fake": "first"}),
                    dict(self.fake_node, properties={"fake": "second"})]
-        expected = [mock.call(uuid), mock.call(uuid)]
+        expected = [mock.call(uuid, use_slave=False),
+                    mock.call(uuid, use_slave=False)]
         with mock.patch.object(self.dbapi, 'get_node_by_uuid',
                                side_effect=returns,
                                autospec=True) as mock_get_node:
@@ -95,6 +146,20 @@ class TestNodeObject(base.DbTestCase):
             self.assertIsInstance(nodes[0], objects.Node)
             self.assertEqual(self.context, nodes[0]._context)
 
+    def test_list_fields(self):
+        with mock.patch.object(self.dbapi, 'get_node_list',
+                               autospec=True) as mock_get_list:
+            mock_get_list.return_value = [self.fake_node]
+            nodes = objects.Node.list(self.context, marker='fake-uuid',
+                                      fields=['uuid', 'power_state'],
+                                      use_slave=True)
+            mock_get_list.assert_called_once_with(
+                    filters=None, limit=None, marker='fake-uuid',
+                    sort_key=None, sort_dir=None,
+                    columns=['uuid', 'power_state'], use_slave=True)
+            self.assertEqual(self.fake_node['uuid'], nodes[0].uuid)
+            self.assertFalse(nodes[0].obj_attr_is_set('driver_info'))
+
     def test_reserve(self):
         with mock.patch.object(self.dbapi, 'reserve_node',
                                autospec=True) as mock_reserve:
@@ -115,6 +180,45 @@ class TestNodeObject(base.DbTestCase):
                               objects.Node.reserve, self.context, 'fake-tag',
                               node_id)
 
+    def test_reserve_with_ports(self):
+        fake_port = utils.get_test_port(node_id=self.fake_node['id'])
+        with mock.patch.object(self.dbapi, 'reserve_node_with_ports',
+                               autospec=True) as mock_reserve:
+            mock_reserve.return_value = (self.fake_node, [fake_port])
+            node_id = self.fake_node['id']
+            fake_tag = 'fake-tag'
+            node, ports = objects.Node.reserve_with_ports(self.context,
+                                                          fake_tag, node_id)
+            mock_reserve.assert_called_once_with(fake_tag, node_id)
+            self.assertIsInstance(node, objects.Node)
+            self.assertEqual(self.context, node._context)
+            self.assertThat(ports, HasLength(1))
+            self.assertIsInstance(ports[0], objects.Port)
+            self.assertEqual(fake_port['uuid'], ports[0].uuid)
+            self.assertEqual(self.context, ports[0]._context)
+
+    def test_create_batch(self):
+        fake_port = utils.get_test_port(node_id=self.fake_node['id'])
+        error = exception.NodeAlreadyExists(uuid='fake-uuid')
+        with mock.patch.object(self.dbapi, 'create_nodes',
+                               autospec=True) as mock_create:
+            mock_create.return_value = [(self.fake_node, [fake_port]), error]
+            node = objects.Node(self.context, driver='fake')
+            port = objects.Port(self.context, address=fake_port['address'])
+            other = objects.Node(self.context, uuid='fake-uuid')
+
+            errors = objects.Node.create_batch(self.context,
+                                               [(node, [port]), (other, [])])
+
+            mock_create.assert_called_once_with(
+                [({'driver': 'fake'}, [{'address': fake_port['address']}]),
+                 ({'uuid': 'fake-uuid'}, [])])
+            self.assertEqual([None, error], errors)
+            self.assertEqual(self.fake_node['uuid'], node.uuid)
+            self.assertEqual({}, node.obj_get_changes())
+            self.assertEqual(fake_port['uuid'], port.uuid)
+            self.assertEqual(self.fake_node['id'], port.node_id)
+
     def test_release(self):
         with mock.patch.object(self.dbapi, 'release_node',
                                autospec=True) as mock_release:
@@ -50,7 +50,7 @@ class StubGlanceClient(object):
                 return image
         raise exception.ImageNotFound(image_id)
 
-    def data(self, image_id):
+    def data(self, image_id, do_checksum=True):
         self.get(image_id)
         return []
 
@@ -16,6 +16,7 @@
 
 import datetime
 import filecmp
+import hashlib
 import os
 import tempfile
 
@@ -488,6 +489,72 @@ class TestGlanceImageService(base.TestCase):
         self.config(glance_num_retries=1, group='glance')
         stub_service.download(image_id, writer)
 
+    def _get_checksum_service(self, chunks, version=1):
+        class MyGlanceStubClient(stubs.StubGlanceClient):
+            """A client that returns image data without metadata."""
+            def get(self, image_id):
+                raise AssertionError('image metadata requested')
+
+            def data(self, image_id, do_checksum=True):
+                self.do_checksum = do_checksum
+                return iter(chunks)
+
+        stub_context = context.RequestContext(auth_token=True)
+        stub_context.user_id = 'fake'
+        stub_context.project_id = 'fake'
+        return service.Service(MyGlanceStubClient(), version, stub_context)
+
+    def test_download_checksum_verified(self):
+        chunks = ['a' * 10, 'b' * 10]
+        stub_service = self._get_checksum_service(chunks)
+        writer = mock.Mock()
+
+        self.assertTrue(stub_service.download(
+            1, writer, checksum=hashlib.md5(''.join(chunks)).hexdigest()))
+
+        self.assertEqual([mock.call(c) for c in chunks],
+                         writer.write.call_args_list)
+        self.assertFalse(stub_service.client.do_checksum)
+
+    def test_download_checksum_mismatch(self):
+        stub_service = self._get_checksum_service(['corrupted'])
+        self.assertRaises(exception.ImageUnacceptable,
+                          stub_service.download, 1, NullWriter(),
+                          checksum=hashlib.md5('image').hexdigest())
+
+    def test_download_no_checksum(self):
+        stub_service = self._get_checksum_service(['image'])
+        self.assertFalse(stub_service.download(1, NullWriter()))
+
+    def test_download_file_url_checksum(self):
+        (srcfd, srcname) = tempfile.mkstemp(prefix='directURLsrc')
+        self.addCleanup(os.remove, srcname)
+        with os.fdopen(srcfd, 'w') as src:
+            src.write('x' * 100000)
+        checksum = hashlib.md5('x' * 100000).hexdigest()
+
+        class MyGlanceStubClient(stubs.StubGlanceClient):
+            """A client that returns a file url."""
+            def get(self, image_id):
+                return type('GlanceTestDirectUrlMeta', (object,),
+                            {'direct_url': 'file://' + srcname})
+
+        stub_context = context.RequestContext(auth_token=True)
+        stub_context.user_id = 'fake'
+        stub_context.project_id = 'fake'
+        stub_service = service.Service(MyGlanceStubClient(),
+                                       context=stub_context,
+                                       version=2)
+        (outfd, tmpfname) = tempfile.mkstemp(prefix='directURLdst')
+        self.addCleanup(os.remove, tmpfname)
+        self.config(allowed_direct_url_schemes=['file'], group='glance')
+
+        with os.fdopen(outfd, 'w') as writer:
+            self.assertTrue(stub_service.download(1, writer,
+                                                  checksum=checksum))
+
+        self.assertTrue(filecmp.cmp(tmpfname, srcname, shallow=False))
+
     def test_download_file_url(self):
         # NOTE: only in v2 API
         class MyGlanceStubClient(stubs.StubGlanceClient):
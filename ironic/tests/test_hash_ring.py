@@ -13,6 +13,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import bisect
 import hashlib
 
 import mock
@@ -209,12 +210,101 @@ class HashRingTestCase(base.TestCase):
                           ring.get_hosts,
                           None)
 
+    def test_get_partition_matches_bisect(self):
+        hosts = ['host%d' % i for i in range(10)]
+        ring = hash_ring.HashRing(hosts)
+        for i in range(1000):
+            data = 'node-%d' % i
+            hashed_key = ring._hash2int(hashlib.md5(data))
+            position = bisect.bisect(ring._partitions, hashed_key)
+            expected = position if position < len(ring._partitions) else 0
+            self.assertEqual(expected, ring._get_partition(data))
+
+    def test_get_partition_wraps_around(self):
+        hosts = ['foo', 'bar']
+        ring = hash_ring.HashRing(hosts)
+        with mock.patch.object(hashlib, 'md5') as mock_md5:
+            mock_md5.return_value.digest.return_value = 16 * '\xff'
+            mock_md5.return_value.hexdigest.return_value = 32 * 'f'
+            self.assertEqual(0, ring._get_partition('fake'))
+
+    def test_get_hosts_remembers_result(self):
+        hosts = ['foo', 'bar', 'baz']
+        ring = hash_ring.HashRing(hosts, replicas=2)
+        expected = ring.get_hosts('fake')
+        with mock.patch.object(ring, '_get_partition') as mock_partition:
+            hosts = ring.get_hosts('fake')
+            self.assertFalse(mock_partition.called)
+        self.assertEqual(expected, hosts)
+        # callers get their own copy of the result
+        hosts.append('qux')
+        self.assertEqual(expected, ring.get_hosts('fake'))
+
+    def test_get_hosts_ignore_hosts_not_remembered(self):
+        hosts = ['foo', 'bar', 'baz']
+        ring = hash_ring.HashRing(hosts, replicas=1)
+        self.assertEqual(['baz'], ring.get_hosts('fake-again',
+                                                 ignore_hosts=['bar']))
+        self.assertEqual({}, ring._memo)
+        self.assertEqual(['bar'], ring.get_hosts('fake-again'))
+
+    @mock.patch.object(hash_ring, 'MAX_MEMO_SIZE', 2)
+    def test_get_hosts_memo_size_limited(self):
+        hosts = ['foo', 'bar']
+        ring = hash_ring.HashRing(hosts, replicas=1)
+        for data in ('a', 'b', 'c'):
+            ring.get_hosts(data)
+        self.assertEqual(['c'], list(ring._memo))
+
+    def test_get_hash_partition(self):
+        data = 'fake'
+        hashed_key = int(hashlib.md5(data).hexdigest(), 16)
+        self.assertEqual(hashed_key >> (128 - hash_ring.HASH_PARTITION_BITS),
+                         hash_ring.get_hash_partition(data))
+
+    def _assert_hash_partition_ranges_cover(self, ring):
+        keys = ['node-%d' % i for i in range(1000)]
+        for host in ring.hosts:
+            ranges = ring.get_hash_partition_ranges(host)
+            self.assertEqual(sorted(ranges), ranges)
+            for key in keys:
+                if host not in ring.get_hosts(key):
+                    continue
+                partition = hash_ring.get_hash_partition(key)
+                self.assertTrue(any(first <= partition <= last
+                                    for first, last in ranges))
+
+    def test_get_hash_partition_ranges(self):
+        hosts = ['host%d' % i for i in range(5)]
+        ring = hash_ring.HashRing(hosts, replicas=1)
+        self._assert_hash_partition_ranges_cover(ring)
+
+    def test_get_hash_partition_ranges_with_replicas(self):
+        hosts = ['host%d' % i for i in range(5)]
+        ring = hash_ring.HashRing(hosts, replicas=2)
+        self._assert_hash_partition_ranges_cover(ring)
+
+    def test_get_hash_partition_ranges_one_host(self):
+        ring = hash_ring.HashRing(['foo'])
+        max_partition = 2 ** hash_ring.HASH_PARTITION_BITS - 1
+        self.assertEqual([(0, max_partition)],
+                         ring.get_hash_partition_ranges('foo'))
+
+    def test_get_hash_partition_ranges_unknown_host(self):
+        ring = hash_ring.HashRing(['foo', 'bar'])
+        self.assertEqual([], ring.get_hash_partition_ranges('baz'))
+
 
 class HashRingManagerTestCase(db_base.DbTestCase):
 
     def setUp(self):
         super(HashRingManagerTestCase, self).setUp()
         self.ring_manager = hash_ring.HashRingManager()
+        self.ring_manager.reset()
+        self.addCleanup(self.ring_manager.reset)
+        p = mock.patch.object(hash_ring.HashRingManager, '_ring_sources', {})
+        p.start()
+        self.addCleanup(p.stop)
 
     def register_conductors(self):
         self.dbapi.register_conductor({
@@ -248,3 +338,35 @@ class HashRingManagerTestCase(db_base.DbTestCase):
         self.assertRaises(exception.DriverNotFound,
                           self.ring_manager.__getitem__,
                           'driver1')
+
+    def test_hash_ring_manager_reset_keeps_unchanged_rings(self):
+        self.register_conductors()
+        ring1 = self.ring_manager['driver1']
+        ring2 = self.ring_manager['driver2']
+        self.dbapi.register_conductor({
+            'hostname': 'host3',
+            'drivers': ['driver2'],
+        })
+        self.ring_manager.reset()
+        self.assertIs(ring1, self.ring_manager['driver1'])
+        self.assertIsNot(ring2, self.ring_manager['driver2'])
+        self.assertEqual(set(['host1', 'host3']),
+                         self.ring_manager['driver2'].hosts)
+
+    def test_hash_ring_manager_reset_rebuilds_on_config_change(self):
+        self.register_conductors()
+        ring1 = self.ring_manager['driver1']
+        CONF.set_override('hash_partition_exponent', 2)
+        self.ring_manager.reset()
+        ring2 = self.ring_manager['driver1']
+        self.assertIsNot(ring1, ring2)
+        self.assertEqual(2 * 2 ** 2, len(ring2._partitions))
+
+    def test_hash_ring_manager_get_hash_partitions(self):
+        self.register_conductors()
+        partitions = self.ring_manager.get_hash_partitions('host2')
+        self.assertEqual(['driver1'], list(partitions))
+        self.assertEqual(
+            self.ring_manager['driver1'].get_hash_partition_ranges('host2'),
+            partitions['driver1'])
+        self.assertEqual({}, self.ring_manager.get_hash_partitions('host3'))
@@ -18,6 +18,8 @@
 
 import os
 import shutil
+import struct
+import tempfile
 
 import mock
 from oslo.config import cfg
@@ -78,7 +80,7 @@ class IronicImagesTestCase(base.TestCase):
         image_service_mock.assert_called_once_with(version=1,
                                                    context='context')
         image_service_mock.return_value.download.assert_called_once_with(
-            'image_href', 'file')
+            'image_href', 'file', checksum=None)
 
     @mock.patch.object(__builtin__, 'open')
     def test_fetch_image_service(self, open_mock):
@@ -87,11 +89,27 @@ class IronicImagesTestCase(base.TestCase):
         open_mock.return_value = mock_file_handle
         image_service_mock = mock.Mock()
 
-        images.fetch('context', 'image_href', 'path', image_service_mock)
+        image_service_mock.download.return_value = True
+
+        self.assertTrue(images.fetch('context', 'image_href', 'path',
+                                     image_service_mock))
 
         open_mock.assert_called_once_with('path', 'wb')
         image_service_mock.download.assert_called_once_with(
-            'image_href', 'file')
+            'image_href', 'file', checksum=None)
+
+    @mock.patch.object(__builtin__, 'open')
+    def test_fetch_checksum(self, open_mock):
+        mock_file_handle = mock.MagicMock(spec=file)
+        mock_file_handle.__enter__.return_value = 'file'
+        open_mock.return_value = mock_file_handle
+        image_service_mock = mock.Mock()
+
+        images.fetch('context', 'image_href', 'path', image_service_mock,
+                     checksum='fake-checksum')
+
+        image_service_mock.download.assert_called_once_with(
+            'image_href', 'file', checksum='fake-checksum')
 
     @mock.patch.object(images, 'image_to_raw')
     @mock.patch.object(__builtin__, 'open')
@@ -106,10 +124,62 @@ class IronicImagesTestCase(base.TestCase):
 
         open_mock.assert_called_once_with('path', 'wb')
         image_service_mock.download.assert_called_once_with(
-            'image_href', 'file')
+            'image_href', 'file', checksum=None)
         image_to_raw_mock.assert_called_once_with(
             'image_href', 'path', 'path.part')
 
+    def test_fetch_format_callback(self):
+        header = b'QFI\xfb' + b'\0' * 20 + struct.pack('>Q', 1024)
+        chunks = [header[:10], header[10:] + b'\0' * 1000, b'\1' * 100]
+        image_service_mock = mock.Mock()
+        image_service_mock.download.side_effect = (
+            lambda href, data, checksum: [data.write(c) for c in chunks])
+        callback = mock.Mock()
+        path = os.path.join(tempfile.mkdtemp(), 'image')
+
+        images.fetch('context', 'image_href', path, image_service_mock,
+                     format_callback=callback)
+
+        callback.assert_called_once_with('qcow2', 1024)
+        with open(path, 'rb') as fp:
+            self.assertEqual(b''.join(chunks), fp.read())
+
+    def test_fetch_format_callback_small_image(self):
+        image_service_mock = mock.Mock()
+        image_service_mock.download.side_effect = (
+            lambda href, data, checksum: data.write(b'kernel'))
+        callback = mock.Mock()
+        path = os.path.join(tempfile.mkdtemp(), 'image')
+
+        images.fetch('context', 'image_href', path, image_service_mock,
+                     format_callback=callback)
+
+        callback.assert_called_once_with('raw', None)
+
+    def test_fetch_format_callback_not_seen(self):
+        image_service_mock = mock.Mock()
+        image_service_mock.download.side_effect = (
+            lambda href, data, checksum: os.write(data.fileno(), b'QFI\xfb'))
+        callback = mock.Mock()
+        path = os.path.join(tempfile.mkdtemp(), 'image')
+
+        images.fetch('context', 'image_href', path, image_service_mock,
+                     format_callback=callback)
+
+        self.assertFalse(callback.called)
+
+    def test_detect_format(self):
+        qcow2 = b'QFI\xfb' + b'\0' * 20 + struct.pack('>Q', 42)
+        self.assertEqual(('qcow2', 42), images.detect_format(qcow2))
+        self.assertEqual(('qcow2', None), images.detect_format(qcow2[:16]))
+        vdi = b'<<< Oracle VM VirtualBox Disk Image >>>\n'.ljust(64, b'\0')
+        self.assertEqual(('vdi', None),
+                         images.detect_format(vdi + b'\x7f\x10\xda\xbe'))
+        self.assertEqual(('vmdk', None), images.detect_format(b'KDMV\1'))
+        self.assertEqual(('raw', None),
+                         images.detect_format(b'\xeb\x63\x90' + b'\0' * 509))
+        self.assertEqual(('raw', None), images.detect_format(b''))
+
     @mock.patch.object(images, 'qemu_img_info')
     def test_image_to_raw_no_file_format(self, qemu_img_info_mock):
         info = self.FakeImgInfo()
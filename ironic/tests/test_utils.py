@@ -510,3 +510,112 @@ class IsHttpUrlTestCase(base.TestCase):
         self.assertTrue(utils.is_http_url('HTTPS://127.3.2.1'))
         self.assertFalse(utils.is_http_url('Zm9vYmFy'))
         self.assertFalse(utils.is_http_url('11111111'))
+
+
+@mock.patch.object(utils, 'ssh_connect')
+class SSHConnectionPoolTestCase(base.TestCase):
+
+    def setUp(self):
+        super(SSHConnectionPoolTestCase, self).setUp()
+        self.pool = utils.SSHConnectionPool()
+        self.info = {'host': 'host1', 'port': 22, 'username': 'user',
+                     'password': 'pass'}
+
+    def _new_client(self, active=True):
+        client = mock.Mock()
+        client.get_transport.return_value.is_active.return_value = active
+        return client
+
+    def test_get_reuses_connection(self, connect_mock):
+        connect_mock.return_value = self._new_client()
+        ssh1 = self.pool.get(self.info)
+        ssh2 = self.pool.get(dict(self.info))
+        self.assertIs(ssh1, ssh2)
+        connect_mock.assert_called_once_with(self.info)
+
+    def test_get_different_credentials(self, connect_mock):
+        connect_mock.side_effect = [self._new_client(), self._new_client()]
+        ssh1 = self.pool.get(self.info)
+        ssh2 = self.pool.get(dict(self.info, username='other'))
+        self.assertIsNot(ssh1, ssh2)
+        self.assertEqual(2, connect_mock.call_count)
+
+    def test_get_reconnects_inactive(self, connect_mock):
+        dead = self._new_client(active=False)
+        connect_mock.side_effect = [dead, self._new_client()]
+        self.pool.get(self.info)
+        ssh = self.pool.get(self.info)
+        self.assertIsNot(dead, ssh)
+        dead.close.assert_called_once_with()
+
+    def test_get_connect_failed(self, connect_mock):
+        connect_mock.side_effect = exception.SSHConnectFailed(host='host1')
+        self.assertRaises(exception.SSHConnectFailed,
+                          self.pool.get, self.info)
+        self.assertEqual({}, self.pool._entries)
+
+    def test_get_closes_idle(self, connect_mock):
+        self.config(ssh_connection_idle_timeout=60)
+        idle = self._new_client()
+        connect_mock.side_effect = [idle, self._new_client()]
+        self.pool.get(self.info)
+        self.pool._entries_by_client[idle].last_used -= 61
+
+        self.pool.get(dict(self.info, host='host2'))
+
+        idle.close.assert_called_once_with()
+        self.assertNotIn(idle, self.pool._entries_by_client)
+
+    def test_get_does_not_close_busy(self, connect_mock):
+        self.config(ssh_connection_idle_timeout=60)
+        busy = self._new_client()
+        connect_mock.side_effect = [busy, self._new_client()]
+        self.pool.get(self.info)
+        with self.pool.channel(busy):
+            self.pool._entries_by_client[busy].last_used -= 61
+            self.pool.get(dict(self.info, host='host2'))
+        self.assertFalse(busy.close.called)
+
+    def test_channel_release_closes_idle(self, connect_mock):
+        self.config(ssh_connection_idle_timeout=60)
+        idle = self._new_client()
+        connect_mock.side_effect = [idle, self._new_client()]
+        self.pool.get(self.info)
+        ssh = self.pool.get(dict(self.info, host='host2'))
+        with self.pool.channel(ssh):
+            self.pool._entries_by_client[idle].last_used -= 61
+        idle.close.assert_called_once_with()
+        self.assertNotIn(idle, self.pool._entries_by_client)
+        self.assertFalse(ssh.close.called)
+
+    def test_close_idle(self, connect_mock):
+        self.config(ssh_connection_idle_timeout=60)
+        idle = self._new_client()
+        connect_mock.side_effect = [idle, self._new_client()]
+        self.pool.get(self.info)
+        ssh = self.pool.get(dict(self.info, host='host2'))
+        self.pool._entries_by_client[idle].last_used -= 61
+        self.pool.close_idle()
+        idle.close.assert_called_once_with()
+        self.assertEqual([ssh], list(self.pool._entries_by_client))
+
+    def test_channel_limit(self, connect_mock):
+        self.config(ssh_max_channels_per_host=1)
+        connect_mock.return_value = self._new_client()
+        ssh = self.pool.get(self.info)
+        channels = self.pool._entries_by_client[ssh].channels
+        with self.pool.channel(ssh):
+            self.assertFalse(channels.acquire(blocking=False))
+        self.assertTrue(channels.acquire(blocking=False))
+
+    def test_channel_not_pooled(self, connect_mock):
+        with self.pool.channel(self._new_client()):
+            pass
+
+    def test_close_all(self, connect_mock):
+        client = self._new_client()
+        connect_mock.return_value = client
+        self.pool.get(self.info)
+        self.pool.close_all()
+        client.close.assert_called_once_with()
+        self.assertEqual({}, self.pool._entries)
@@ -0,0 +1,112 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import socket
+
+import eventlet
+import mock
+from six.moves import http_client
+
+from ironic.cmd import api as api_cmd
+from ironic.common import exception
+from ironic.common import wsgi_service
+from ironic.tests import base
+
+
+def _hello_app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return ['hello']
+
+
+class WSGIServiceTestCase(base.TestCase):
+
+    def _get(self, server):
+        conn = http_client.HTTPConnection(server.host, server.port,
+                                          timeout=5)
+        conn.request('GET', '/')
+        body = conn.getresponse().read()
+        conn.close()
+        return body
+
+    def test_serve(self):
+        server = wsgi_service.WSGIService('test', _hello_app,
+                                          '127.0.0.1', 0)
+        self.assertNotEqual(0, server.port)
+        server.start()
+        self.addCleanup(server.stop)
+        self.assertEqual(b'hello', self._get(server))
+
+    def test_restart(self):
+        server = wsgi_service.WSGIService('test', _hello_app,
+                                          '127.0.0.1', 0)
+        server.start()
+        server.stop()
+        server.reset()
+        server.start()
+        self.addCleanup(server.stop)
+        self.assertEqual(b'hello', self._get(server))
+
+    def test_stop_completes_requests(self):
+        started = eventlet.event.Event()
+        release = eventlet.event.Event()
+
+        def slow_app(environ, start_response):
+            started.send()
+            release.wait()
+            return _hello_app(environ, start_response)
+
+        self.config(wsgi_keep_alive=False, group='api')
+        server = wsgi_service.WSGIService('test', slow_app, '127.0.0.1', 0)
+        server.start()
+        request = eventlet.spawn(self._get, server)
+        started.wait()
+        stopping = eventlet.spawn(server.stop)
+        eventlet.sleep(0)
+        self.assertFalse(stopping.dead)
+        release.send()
+        self.assertEqual(b'hello', request.wait())
+        stopping.wait()
+
+    @mock.patch.object(eventlet, 'listen', autospec=True)
+    def test_ipv6(self, mock_listen):
+        mock_listen.return_value.getsockname.return_value = ('::1', 6385,
+                                                             0, 0)
+        server = wsgi_service.WSGIService('test', _hello_app, '::1', 6385)
+        mock_listen.assert_called_once_with(('::1', 6385),
+                                            family=socket.AF_INET6)
+        self.assertEqual(('::1', 6385), (server.host, server.port))
+
+
+@mock.patch.object(api_cmd.service, 'launch', autospec=True)
+@mock.patch.object(api_cmd.ironic_service, 'prepare_service', autospec=True)
+@mock.patch.object(api_cmd.app, 'VersionSelectorApplication', autospec=True)
+@mock.patch.object(api_cmd.wsgi_service, 'WSGIService', autospec=True)
+class APICommandTestCase(base.TestCase):
+
+    def test_main(self, mock_service, mock_app, mock_prepare, mock_launch):
+        self.config(api_workers=4, host_ip='127.0.0.1', port=1234,
+                    group='api')
+        mock_service.return_value.host = '127.0.0.1'
+        mock_service.return_value.port = 1234
+        api_cmd.main()
+        mock_service.assert_called_once_with(
+            'ironic-api', mock_app.return_value, '127.0.0.1', 1234)
+        mock_launch.assert_called_once_with(mock_service.return_value,
+                                            workers=4)
+        mock_launch.return_value.wait.assert_called_once_with()
+
+    def test_main_invalid_workers(self, mock_service, mock_app,
+                                  mock_prepare, mock_launch):
+        self.config(api_workers=0, group='api')
+        self.assertRaises(exception.ConfigInvalid, api_cmd.main)
+        self.assertFalse(mock_service.called)
+        self.assertFalse(mock_launch.called)
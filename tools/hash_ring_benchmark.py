@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Time hash ring lookups of node UUIDs for a set of conductors."""
+
+import bisect
+import hashlib
+import optparse
+import os
+import sys
+import time
+import uuid
+
+top_dir = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                       os.pardir))
+sys.path.insert(0, top_dir)
+
+from ironic.common import hash_ring
+
+
+def bisect_partition(ring, data):
+    """Look up a partition by bisecting the whole list of dividers."""
+    hashed_key = ring._hash2int(hashlib.md5(data))
+    position = bisect.bisect(ring._partitions, hashed_key)
+    return position if position < len(ring._partitions) else 0
+
+
+def timed(func, keys):
+    start = time.time()
+    for key in keys:
+        func(key)
+    return time.time() - start
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option("-n", "--nodes", dest="nodes", type="int",
+                      help="number of node UUIDs to look up",
+                      default=100000)
+    parser.add_option("-c", "--conductors", dest="conductors", type="int",
+                      help="number of conductors in the ring",
+                      default=100)
+    parser.add_option("-r", "--replicas", dest="replicas", type="int",
+                      help="number of replicas of each node",
+                      default=1)
+    (options, args) = parser.parse_args()
+
+    hosts = ['conductor-%d' % i for i in range(options.conductors)]
+    keys = [str(uuid.uuid4()) for i in range(options.nodes)]
+
+    start = time.time()
+    ring = hash_ring.HashRing(hosts, replicas=options.replicas)
+    print("Built a ring of %d partitions in %.3fs" %
+          (len(ring._partitions), time.time() - start))
+
+    results = [
+        ("bisect of all partitions",
+         timed(lambda key: bisect_partition(ring, key), keys)),
+        ("partition table", timed(ring._get_partition, keys)),
+        ("get_hosts, first lookup", timed(ring.get_hosts, keys)),
+        ("get_hosts, remembered", timed(ring.get_hosts, keys)),
+    ]
+    for name, elapsed in results:
+        print("%-26s %8.3fs %12.0f lookups/s %8.2fus/lookup" %
+              (name, elapsed, options.nodes / elapsed,
+               elapsed * 1e6 / options.nodes))
+
+
+if __name__ == '__main__':
+    main()
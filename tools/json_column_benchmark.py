@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Time the listing of nodes with different codecs for the JSON columns."""
+
+import optparse
+import os
+import sys
+import time
+import uuid
+
+from oslo.config import cfg
+import sqlalchemy
+from sqlalchemy import orm
+
+top_dir = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                       os.pardir))
+sys.path.insert(0, top_dir)
+
+from ironic.db.sqlalchemy import models
+from ironic import objects
+
+
+def create_nodes(session, count):
+    with session.begin():
+        for i in range(count):
+            session.add(models.Node(
+                uuid=str(uuid.uuid4()),
+                driver='pxe_ipmitool',
+                driver_info={'ipmi_address': '10.0.%d.%d' % divmod(i, 256),
+                             'ipmi_username': 'admin',
+                             'ipmi_password': 'password',
+                             'deploy_kernel': str(uuid.uuid4()),
+                             'deploy_ramdisk': str(uuid.uuid4())},
+                properties={'cpus': 8, 'cpu_arch': 'x86_64',
+                            'memory_mb': 16384, 'local_gb': 500,
+                            'capabilities': 'boot_mode:bios'},
+                instance_info={'image_source': str(uuid.uuid4()),
+                               'root_gb': 10, 'swap_mb': 0,
+                               'configdrive': 'x' * 1024},
+                extra={'rack': 'r%d' % (i % 40), 'slot': i % 42}))
+
+
+def list_nodes(session):
+    return session.query(models.Node).all()
+
+
+def list_objects(session):
+    return [objects.Node._from_db_object(objects.Node(None), node)
+            for node in list_nodes(session)]
+
+
+def update_nodes(session):
+    with session.begin():
+        for node in list_nodes(session):
+            node.extra = dict(node.extra, updated=True)
+
+
+def timed(func, session, repeat):
+    start = time.time()
+    for i in range(repeat):
+        func(session)
+        session.expunge_all()
+    return time.time() - start
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option("-n", "--nodes", dest="nodes", type="int",
+                      help="number of nodes to list",
+                      default=1000)
+    parser.add_option("-r", "--repeat", dest="repeat", type="int",
+                      help="number of times to list the nodes",
+                      default=10)
+    parser.add_option("-c", "--codec", dest="codecs", action="append",
+                      help="module used to encode and decode JSON, "
+                           "may be repeated",
+                      default=[])
+    (options, args) = parser.parse_args()
+    codecs = options.codecs or ["json", "simplejson"]
+
+    engine = sqlalchemy.create_engine('sqlite://')
+    models.Base.metadata.create_all(engine)
+    session = orm.Session(bind=engine, autocommit=True)
+    create_nodes(session, options.nodes)
+
+    tests = [("list nodes", list_nodes),
+             ("list Node objects", list_objects),
+             ("update nodes", update_nodes)]
+    for name, func in tests:
+        for codec in codecs:
+            cfg.CONF.set_override('json_codec', codec, 'database')
+            elapsed = timed(func, session, options.repeat)
+            print("%-18s %-10s %8.3fs %10.0f nodes/s" %
+                  (name, codec, elapsed,
+                   options.nodes * options.repeat / elapsed))
+
+
+if __name__ == '__main__':
+    main()